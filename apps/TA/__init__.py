@@ -9,6 +9,52 @@ HORIZONS = [PERIODS_1HR, PERIODS_4HR, PERIODS_24HR] = [12, 48, 288]  # num of 5
 PRICE_INDEXES = ['open_price', 'close_price', 'low_price', 'high_price', 'midpoint_price', 'mean_price', 'price_variance',]
 VOLUME_INDEXES = ['open_volume', 'close_volume', 'low_volume', 'high_volume',]
 
+# sorted set member encoding used when saving price and volume storages
+# 0 = text "value:score" (legacy), 1 = packed binary, see storages/utils/member_codec.py
+# readers decode both, run `TA_migrate_encoding` to rewrite existing keys
+PV_MEMBER_ENCODING = int(os.environ.get('TA_PV_MEMBER_ENCODING', 1))
+
+# how PriceSubscriber resamples PriceVolumeHistoryStorage into 5min periods, see storages/utils/pv_resampling.py
+# "pipeline" = one read and one MULTI write per 5min block, "lua" = one server side script,
+# "legacy" = generate_pv_storages() for each published index
+PV_RESAMPLING_MODE = os.environ.get('TA_PV_RESAMPLING_MODE', 'pipeline')
+
+# how TimeseriesStorage.publish() reaches TickerSubscribers
+# "pubsub" = redis PUBLISH/SUBSCRIBE, messages are lost while a worker is busy or restarting
+# "streams" = redis streams (server >= 5.0) with a consumer group per subscriber class,
+# TA_worker processes share the messages and ack them once handled, see storages/utils/streams.py
+MESSAGE_TRANSPORT = os.environ.get('TA_MESSAGE_TRANSPORT', 'pubsub')
+STREAM_MAXLEN = int(os.environ.get('TA_STREAM_MAXLEN', 100000))  # approximate length each stream is trimmed to
+
+# keys per SCAN/SSCAN call when walking the keyspace or a key registry, see TimeseriesStorage.get_registered_keys()
+KEY_SCAN_COUNT = int(os.environ.get('TA_KEY_SCAN_COUNT', 1000))
+# a process registers a key on its first save only, and again after this, in case another process unregistered it
+KEY_REGISTRY_REFRESH_SECONDS = int(os.environ.get('TA_KEY_REGISTRY_REFRESH_SECONDS', 3600))
+
+# days of history kept at each resolution by redisCleanup(), older 5min PriceStorage and VolumeStorage periods
+# are compacted into the 1hr and 24hr RollupStorage bars, and PriceStorage.query_ohlcv() stitches the tiers back
+# together, 0 keeps 200 days of 5min periods without compaction
+PRICE_5MIN_RETENTION_DAYS = int(os.environ.get('TA_PRICE_5MIN_RETENTION_DAYS', 0))
+PRICE_1HR_RETENTION_DAYS = int(os.environ.get('TA_PRICE_1HR_RETENTION_DAYS', 200))  # also the 4hr bars
+PRICE_24HR_RETENTION_DAYS = int(os.environ.get('TA_PRICE_24HR_RETENTION_DAYS', 0))  # 0 keeps all
+
+# process-local LRU cache of TimeseriesStorage.query() range reads, see storages/utils/query_cache.py
+# entries follow the publish events and saves seen by the process, and expire after QUERY_CACHE_SECONDS
+QUERY_CACHE_ENTRIES = int(os.environ.get('TA_QUERY_CACHE_ENTRIES', 0))  # 0 disables the cache
+QUERY_CACHE_BYTES = int(os.environ.get('TA_QUERY_CACHE_BYTES', 32 * 1024 * 1024))
+QUERY_CACHE_SECONDS = int(os.environ.get('TA_QUERY_CACHE_SECONDS', 300))
+
+# incremental indicators also recompute from full history on every tick and log any mismatch (slow)
+VERIFY_INCREMENTAL_INDICATORS = bool(int(os.environ.get('TA_VERIFY_INCREMENTAL_INDICATORS', 0)))
+
+# ticker keys like "{ETH_BTC:binance}:PriceStorage:close_price", the hash tag puts every key of a ticker
+# in the same Redis Cluster slot, see storages/utils/key_layout.py and run `TA_migrate_key_layout` on existing keys
+REDIS_KEY_HASH_TAGS = bool(int(os.environ.get('TA_REDIS_KEY_HASH_TAGS', 0)))
+# connect with redis-py-cluster (optional dependency), needs REDIS_KEY_HASH_TAGS, see settings/redis_db.py
+REDIS_CLUSTER = bool(int(os.environ.get('TA_REDIS_CLUSTER', 0)))
+if REDIS_CLUSTER and PV_RESAMPLING_MODE == "lua":
+    PV_RESAMPLING_MODE = "pipeline"  # the script also writes key registries and streams, which are in other slots
+
 deployment_type = os.environ.get('DEPLOYMENT_TYPE', 'LOCAL')
 if deployment_type == 'LOCAL':
     logging.basicConfig(level=logging.DEBUG)
@@ -0,0 +1,44 @@
+def get_indicator_subscriber_classes():
+    # import here, bc indicator modules import the storages and subscribers
+    from apps.TA.indicators.momentum import adx, adxr, apo, aroon, aroonosc, bop, cci, cmo, dx, macd, mfi, mom, \
+        ppo, roc, rocp, rocr, rsi, stoch, stochf, stochrsi, trix, ultosc, willr
+    from apps.TA.indicators.overlap import bbands, dema, ema, ht_trendline, kama, midprice, sma, tema, trima, wma
+
+    return [
+        # overlap
+        sma.SmaSubscriber,
+        ema.EmaSubscriber,
+        wma.WmaSubscriber,
+        dema.DemaSubscriber,
+        tema.TemaSubscriber,
+        trima.TrimaSubscriber,
+        kama.KamaSubscriber,
+        bbands.BbandsSubscriber,
+        ht_trendline.HtTrendlineSubscriber,
+        midprice.MidpriceSubscriber,
+
+        # momentum
+        adx.AdxSubscriber,
+        adxr.AdxrSubscriber,
+        apo.ApoSubscriber,
+        aroon.AroonSubscriber,
+        aroonosc.AroonOscSubscriber,
+        bop.BopSubscriber,
+        cci.CciSubscriber,
+        cmo.CmoSubscriber,
+        dx.DxSubscriber,
+        macd.MacdSubscriber,
+        mfi.MfiSubscriber,
+        mom.MomSubscriber,
+        ppo.PpoSubscriber,
+        roc.RocSubscriber,
+        rocp.RocpSubscriber,
+        rocr.RocrSubscriber,
+        rsi.RsiSubscriber,
+        stoch.StochSubscriber,
+        stochf.StochfSubscriber,
+        stochrsi.StochrsiSubscriber,
+        trix.TrixSubscriber,
+        ultosc.UltoscSubscriber,
+        willr.WillrSubscriber,
+    ]
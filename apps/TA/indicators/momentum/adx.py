@@ -1,10 +1,10 @@
+import math
 from settings import LOAD_TALIB
 
 if LOAD_TALIB:
     import talib
 
-from apps.TA import HORIZONS
-from apps.TA.storages.abstract.indicator import IndicatorStorage
+from apps.TA.storages.abstract.indicator import IndicatorStorage, series_values_to_strs
 from apps.TA.storages.abstract.indicator_subscriber import IndicatorSubscriber
 from apps.TA.storages.data.price import PriceStorage
 from settings import logger
@@ -12,38 +12,34 @@ from settings import logger
 
 class AdxStorage(IndicatorStorage):
 
-    def produce_signal(self):
-        pass
-
-
-class AdxSubscriber(IndicatorSubscriber):
-    classes_subscribing_to = [
-        PriceStorage
-    ]
+    class_periods_list = [14]
+    requisite_pv_indexes = ["high_price", "low_price", "close_price"]
+    warmup = 10  # wilder smoothing of a wilder smoothed series, read this many times periods of price history
 
-    def handle(self, channel, data, *args, **kwargs):
+    def get_lookback(self, periods: int) -> int:
+        return periods * self.warmup
 
-        self.index = self.key_suffix
+    def compute_value_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> str:
+        adx_value = self.compute_arrays_with_requisite_indexes(requisite_pv_index_arrrays, periods)[0][-1]
+        logger.debug(f"Adx computed: {adx_value}")
+        if math.isnan(adx_value): return ""
+        return str(adx_value)
 
-        if str(self.index) is not "close_price":
-            logger.debug(f'index {self.index} is not close_price ...ignoring...')
-            return
+    def compute_series_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> list:
+        return series_values_to_strs(*self.compute_arrays_with_requisite_indexes(requisite_pv_index_arrrays, periods))
 
-        new_adx_storage = AdxStorage(ticker=self.ticker,
-                                     exchange=self.exchange,
-                                     timestamp=self.timestamp)
+    def compute_arrays_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> list:
+        return [talib.ADX(
+            requisite_pv_index_arrrays["high_price"],
+            requisite_pv_index_arrrays["low_price"],
+            requisite_pv_index_arrrays["close_price"],
+            timeperiod=periods or self.periods
+        )]
 
-        for horizon in HORIZONS:
-            periods = horizon * 14
-
-            high_value_np_array = new_adx_storage.get_denoted_price_array("high_price", periods)
-            low_value_np_array = new_adx_storage.get_denoted_price_array("low_price", periods)
-            close_value_np_array = new_adx_storage.get_denoted_price_array("close_price", periods)
+    def produce_signal(self):
+        pass
 
-            timeperiod = min([len(high_value_np_array), len(low_value_np_array), len(close_value_np_array), periods])
-            adx_value = talib.ADX(high_value_np_array, low_value_np_array, close_value_np_array, timeperiod=timeperiod)[-1]
-            # logger.debug(f'savingAdx value {adx_value} for {self.ticker} on {periods} periods')
 
-            new_adx_storage.periods = periods
-            new_adx_storage.value = float(adx_value)
-            new_adx_storage.save()
+class AdxSubscriber(IndicatorSubscriber):
+    classes_subscribing_to = [PriceStorage]
+    storage_class = AdxStorage
@@ -1,9 +1,6 @@
-from settings import LOAD_TALIB
+import math
 
-if LOAD_TALIB:
-    import talib
-
-from apps.TA import HORIZONS
+from apps.TA.indicators.momentum.adx import AdxStorage
 from apps.TA.storages.abstract.indicator import IndicatorStorage
 from apps.TA.storages.abstract.indicator_subscriber import IndicatorSubscriber
 from apps.TA.storages.data.price import PriceStorage
@@ -12,38 +9,28 @@ from settings import logger
 
 class AdxrStorage(IndicatorStorage):
 
-    def produce_signal(self):
-        pass
-
-
-class AdxrSubscriber(IndicatorSubscriber):
-    classes_subscribing_to = [
-        PriceStorage
-    ]
+    class_periods_list = [14]
+    requisite_indicators = [AdxStorage]
 
-    def handle(self, channel, data, *args, **kwargs):
+    def compute_value_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> str:
+        """
+        same as talib.ADXR, from the ADX values shared on the IndicatorContext
 
-        self.index = self.key_suffix
+        :param periods: number of periods to compute value for
+        """
+        periods = periods or self.periods
+        adx_values = requisite_pv_index_arrrays[f'AdxStorage:{periods}:value']
+        if len(adx_values) < periods: return ""
 
-        if str(self.index) is not "close_price":
-            logger.debug(f'index {self.index} is not close_price ...ignoring...')
-            return
+        adxr_value = (adx_values[-1] + adx_values[-periods]) / 2
+        logger.debug(f"Adxr computed: {adxr_value}")
+        if math.isnan(adxr_value): return ""
+        return str(adxr_value)
 
-        new_adxr_storage = AdxrStorage(ticker=self.ticker,
-                                     exchange=self.exchange,
-                                     timestamp=self.timestamp)
-
-        for horizon in HORIZONS:
-            periods = horizon * 14
-
-            high_value_np_array = new_adxr_storage.get_denoted_price_array("high_price", periods)
-            low_value_np_array = new_adxr_storage.get_denoted_price_array("low_price", periods)
-            close_value_np_array = new_adxr_storage.get_denoted_price_array("close_price", periods)
+    def produce_signal(self):
+        pass
 
-            timeperiod = min([len(high_value_np_array), len(low_value_np_array), len(close_value_np_array), periods])
-            adxr_value = talib.ADXR(high_value_np_array, low_value_np_array, close_value_np_array, timeperiod=timeperiod)[-1]
-            # logger.debug(f'savingAdxr value {adxr_value} for {self.ticker} on {periods} periods')
 
-            new_adxr_storage.periods = periods
-            new_adxr_storage.value = float(adxr_value)
-            new_adxr_storage.save()
+class AdxrSubscriber(IndicatorSubscriber):
+    classes_subscribing_to = [PriceStorage]
+    storage_class = AdxrStorage
@@ -1,9 +1,6 @@
-from settings import LOAD_TALIB
+import math
 
-if LOAD_TALIB:
-    import talib
-
-from apps.TA import HORIZONS
+from apps.TA.indicators.overlap.sma import SmaStorage
 from apps.TA.storages.abstract.indicator import IndicatorStorage
 from apps.TA.storages.abstract.indicator_subscriber import IndicatorSubscriber
 from apps.TA.storages.data.price import PriceStorage
@@ -12,39 +9,39 @@ from settings import logger
 
 class ApoStorage(IndicatorStorage):
 
-    def produce_signal(self):
-        pass
+    class_periods_list = [50]
+    requisite_indicators = [SmaStorage]
 
+    @staticmethod
+    def get_apo_periods(periods: int) -> tuple:
+        # fastperiod, slowperiod, eg. 12, 26 for periods=50
+        return int(round(periods*12/50)), int(round(periods*26/50))
 
-class ApoSubscriber(IndicatorSubscriber):
-    classes_subscribing_to = [
-        PriceStorage
-    ]
-
-    def handle(self, channel, data, *args, **kwargs):
+    def get_lookback(self, periods: int) -> int:
+        return 1
 
-        self.index = self.key_suffix
+    def get_requisite_indicator_periods(self, periods: int) -> list:
+        return [(SmaStorage, apo_periods) for apo_periods in self.get_apo_periods(periods)]
 
-        if str(self.index) is not "close_price":
-            logger.debug(f'index {self.index} is not close_price ...ignoring...')
-            return
+    def compute_value_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> str:
+        """
+        same as talib.APO with matype=0, from the SMA values shared on the IndicatorContext
 
-        new_apo_storage = ApoStorage(ticker=self.ticker,
-                                     exchange=self.exchange,
-                                     timestamp=self.timestamp)
+        :param periods: number of periods to compute value for
+        """
+        fastperiod, slowperiod = self.get_apo_periods(periods or self.periods)
+        fast_sma = requisite_pv_index_arrrays[f'SmaStorage:{fastperiod}:value'][-1]
+        slow_sma = requisite_pv_index_arrrays[f'SmaStorage:{slowperiod}:value'][-1]
+        if math.isnan(fast_sma + slow_sma): return ""
 
-        for horizon in HORIZONS:
-            periods = horizon * 50
+        apo_value = fast_sma - slow_sma
+        logger.debug(f"Apo computed: {apo_value}")
+        return str(apo_value)
 
-            close_value_np_array = new_apo_storage.get_denoted_price_array("close_price", periods)
-
-            try:
-                apo_value = talib.APO(close_value_np_array, fastperiod=12, slowperiod=26, matype=0)[-1]
+    def produce_signal(self):
+        pass
 
-                # logger.debug(f'savingApo value {apo_value} for {self.ticker} on {periods} periods')
-                new_apo_storage.periods = periods
-                new_apo_storage.value = float(apo_value)
-                new_apo_storage.save()
 
-            except Exception as e:
-                logger.error(str(e))
+class ApoSubscriber(IndicatorSubscriber):
+    classes_subscribing_to = [PriceStorage]
+    storage_class = ApoStorage
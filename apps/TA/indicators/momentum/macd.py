@@ -1,17 +1,21 @@
+import math
 from settings import LOAD_TALIB
 if LOAD_TALIB:
-    import math, talib
+    import talib
 
-from apps.TA.storages.abstract.indicator import IndicatorStorage
+from apps.TA.storages.abstract.indicator import series_values_to_strs
+from apps.TA.storages.abstract.incremental_indicator import IncrementalIndicatorStorage, state_values_to_str
 from apps.TA.storages.abstract.indicator_subscriber import IndicatorSubscriber
 from apps.TA.storages.data.price import PriceStorage
+from apps.TA.storages.utils.recursive import ema_update
 from settings import logger
 
 
-class MacdStorage(IndicatorStorage):
+class MacdStorage(IncrementalIndicatorStorage):
 
     class_periods_list = [26]
     requisite_pv_indexes = ["close_price"]
+    value_names = ["macd", "macdsignal", "macdhist"]
 
     def compute_value_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> str:
         """
@@ -21,10 +25,7 @@ class MacdStorage(IndicatorStorage):
         :param periods: number of periods to compute value for
         :return:
         """
-        periods = periods or self.periods
-        fastperiod = periods*12/26
-        slowperiod = periods*26/26
-        signalperiod = periods*9/26
+        fastperiod, slowperiod, signalperiod = self.get_macd_periods(periods or self.periods)
 
         macd_value, macdsignal, macdhist = talib.MACD(
             requisite_pv_index_arrrays["close_price"],
@@ -37,6 +38,35 @@ class MacdStorage(IndicatorStorage):
 
         return f"{macd_value[-1]}:{macdsignal[-1]}:{macdhist[-1]}"
 
+    def compute_series_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> list:
+        fastperiod, slowperiod, signalperiod = self.get_macd_periods(periods or self.periods)
+        return series_values_to_strs(*talib.MACD(
+            requisite_pv_index_arrrays["close_price"],
+            fastperiod=fastperiod, slowperiod=slowperiod, signalperiod=signalperiod
+        ))
+
+    @staticmethod
+    def get_macd_periods(periods: int) -> tuple:
+        # talib requires integer periods, eg. 12, 26, 9 for periods=26
+        return int(round(periods*12/26)), int(periods), int(round(periods*9/26))
+
+    def advance_state(self, state: dict, arrays: dict, i: int, periods: int):
+        fastperiod, slowperiod, signalperiod = self.get_macd_periods(periods)
+
+        close_price = arrays["close_price"][i]
+        fast_ema = ema_update(state, "fast_ema", close_price, fastperiod)
+        slow_ema = ema_update(state, "slow_ema", close_price, slowperiod)
+        if math.isnan(slow_ema):
+            return
+        state["macd"] = fast_ema - slow_ema
+        ema_update(state, "signal", state["macd"], signalperiod)
+
+    def value_from_state(self, state: dict, periods: int) -> str:
+        macd_value, macdsignal = state.get("macd"), state.get("signal")
+        if macd_value is None or macdsignal is None:
+            return ""
+        return state_values_to_str(macd_value, macdsignal, macd_value - macdsignal)
+
     def produce_signal(self):
         pass
 
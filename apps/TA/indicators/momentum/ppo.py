@@ -1,9 +1,6 @@
-from settings import LOAD_TALIB
+import math
 
-if LOAD_TALIB:
-    import talib
-
-from apps.TA import HORIZONS
+from apps.TA.indicators.overlap.sma import SmaStorage
 from apps.TA.storages.abstract.indicator import IndicatorStorage
 from apps.TA.storages.abstract.indicator_subscriber import IndicatorSubscriber
 from apps.TA.storages.data.price import PriceStorage
@@ -12,35 +9,39 @@ from settings import logger
 
 class PpoStorage(IndicatorStorage):
 
-    def produce_signal(self):
-        pass
-
+    class_periods_list = [26]
+    requisite_indicators = [SmaStorage]
 
-class PpoSubscriber(IndicatorSubscriber):
-    classes_subscribing_to = [
-        PriceStorage
-    ]
+    @staticmethod
+    def get_ppo_periods(periods: int) -> tuple:
+        # fastperiod, slowperiod, eg. 12, 26 for periods=26
+        return int(round(periods*12/26)), int(periods)
 
-    def handle(self, channel, data, *args, **kwargs):
+    def get_lookback(self, periods: int) -> int:
+        return 1
 
-        self.index = self.key_suffix
+    def get_requisite_indicator_periods(self, periods: int) -> list:
+        return [(SmaStorage, ppo_periods) for ppo_periods in self.get_ppo_periods(periods)]
 
-        if str(self.index) is not "close_price":
-            logger.debug(f'index {self.index} is not close_price ...ignoring...')
-            return
+    def compute_value_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> str:
+        """
+        same as talib.PPO with matype=0, from the SMA values shared on the IndicatorContext
 
-        new_ppo_storage = PpoStorage(ticker=self.ticker,
-                                     exchange=self.exchange,
-                                     timestamp=self.timestamp)
+        :param periods: number of periods to compute value for
+        """
+        fastperiod, slowperiod = self.get_ppo_periods(periods or self.periods)
+        fast_sma = requisite_pv_index_arrrays[f'SmaStorage:{fastperiod}:value'][-1]
+        slow_sma = requisite_pv_index_arrrays[f'SmaStorage:{slowperiod}:value'][-1]
+        if math.isnan(fast_sma + slow_sma) or not slow_sma: return ""
 
-        for horizon in HORIZONS:
-            periods = horizon * 26
+        ppo_value = (fast_sma - slow_sma) / slow_sma * 100
+        logger.debug(f"Ppo computed: {ppo_value}")
+        return str(ppo_value)
 
-            close_value_np_array = new_ppo_storage.get_denoted_price_array("close_price", periods)
+    def produce_signal(self):
+        pass
 
-            ppo_value = talib.PPO(close_value_np_array, fastperiod=horizon*12, slowperiod=horizon*26, matype=0)[-1]
-            # logger.debug(f'savingPpo value {ppo_value} for {self.ticker} on {periods} periods')
 
-            new_ppo_storage.periods = periods
-            new_ppo_storage.value = str(ppo_value)
-            new_ppo_storage.save()
+class PpoSubscriber(IndicatorSubscriber):
+    classes_subscribing_to = [PriceStorage]
+    storage_class = PpoStorage
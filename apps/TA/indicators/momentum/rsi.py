@@ -1,20 +1,62 @@
+import math
 import numpy as np
 from settings import LOAD_TALIB
 
 if LOAD_TALIB:
     import talib
 
-from apps.TA import HORIZONS
-from apps.TA.storages.abstract.indicator import IndicatorStorage, BULLISH, BEARISH
+from apps.TA.storages.abstract.indicator import BULLISH, BEARISH
+from apps.TA.storages.abstract.incremental_indicator import IncrementalIndicatorStorage, state_values_to_str
 from apps.TA.storages.abstract.indicator_subscriber import IndicatorSubscriber
 from apps.TA.storages.data.price import PriceStorage
+from apps.TA.storages.utils.recursive import wilder_update
 from settings import logger
 
 
-class RsiStorage(IndicatorStorage):
+RSI_TIMEPERIOD = 14  # RSI of each horizon is over 14 of its periods
+
+
+class RsiStorage(IncrementalIndicatorStorage):
+    """
+    saved under the horizon periods (12, 48, 288), computed over RSI_TIMEPERIOD * periods price periods
+    """
+    requisite_pv_indexes = ["close_price"]
+    state_warmup = 10 * RSI_TIMEPERIOD  # wilder smoothing decays slower than an EMA
+
+    def get_rsi_timeperiod(self, periods: int = 0) -> int:
+        return (periods or self.periods) * RSI_TIMEPERIOD
+
+    def get_lookback(self, periods: int) -> int:
+        return self.get_rsi_timeperiod(periods) + 1
+
+    def compute_value_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> str:
+        rsi_value = talib.RSI(requisite_pv_index_arrrays["close_price"], timeperiod=self.get_rsi_timeperiod(periods))[-1]
+        if math.isnan(rsi_value): return ""
+        return str(rsi_value)
+
+    def compute_arrays_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> list:
+        return [talib.RSI(requisite_pv_index_arrrays["close_price"], timeperiod=self.get_rsi_timeperiod(periods))]
+
+    def advance_state(self, state: dict, arrays: dict, i: int, periods: int):
+        close_price = arrays["close_price"][i]
+        previous_close_price = state.get("close_price")
+        state["close_price"] = close_price
+        if previous_close_price is None:
+            return
+        change = close_price - previous_close_price
+        wilder_update(state, "avg_gain", max(change, 0.0), self.get_rsi_timeperiod(periods))
+        wilder_update(state, "avg_loss", max(-change, 0.0), self.get_rsi_timeperiod(periods))
+
+    def value_from_state(self, state: dict, periods: int) -> str:
+        avg_gain, avg_loss = state.get("avg_gain"), state.get("avg_loss")
+        if avg_gain is None or avg_loss is None:
+            return ""
+        if avg_gain + avg_loss == 0:
+            return state_values_to_str(0.0)  # same as talib
+        return state_values_to_str(100 * avg_gain / (avg_gain + avg_loss))
 
     def get_rsi_strength(self) -> int:
-        rsi = int(self.value)
+        rsi = int(float(self.value))
         if rsi is None or rsi <= 0.0 or rsi >= 100.0:
             return None
 
@@ -49,30 +91,5 @@ class RsiStorage(IndicatorStorage):
 
 
 class RsiSubscriber(IndicatorSubscriber):
-    classes_subscribing_to = [
-        PriceStorage
-    ]
-
-    def handle(self, channel, data, *args, **kwargs):
-
-        self.index = self.key_suffix
-
-        if str(self.index) is not "close_price":
-            logger.debug(f'index {self.index} is not close_price ...ignoring...')
-            return
-
-        new_rsi_storage = RsiStorage(ticker=self.ticker,
-                                     exchange=self.exchange,
-                                     timestamp=self.timestamp)
-
-        for horizon in HORIZONS:
-            periods = horizon*14
-
-            close_value_np_array = new_rsi_storage.get_denoted_price_array("close_price", periods)
-
-            rsi_value = talib.RSI(close_value_np_array, timeperiod=periods)[-1]
-            # logger.debug(f'savingRSI value {rsi_value} for {self.ticker} on {horizon*14} periods')
-
-            new_rsi_storage.periods = horizon
-            new_rsi_storage.value = float(rsi_value)
-            new_rsi_storage.save()
+    classes_subscribing_to = [PriceStorage]
+    storage_class = RsiStorage
@@ -1,9 +1,10 @@
+import math
 from settings import LOAD_TALIB
 
 if LOAD_TALIB:
     import talib
 
-from apps.TA import HORIZONS
+from apps.TA.indicators.momentum.rsi import RsiStorage, RSI_TIMEPERIOD
 from apps.TA.storages.abstract.indicator import IndicatorStorage
 from apps.TA.storages.abstract.indicator_subscriber import IndicatorSubscriber
 from apps.TA.storages.data.price import PriceStorage
@@ -12,36 +13,45 @@ from settings import logger
 
 class StochrsiStorage(IndicatorStorage):
 
-    def produce_signal(self):
-        pass
+    class_periods_list = [14]
+    requisite_indicators = [RsiStorage]
+    value_names = ["fastk", "fastd"]
 
+    @staticmethod
+    def get_stochrsi_periods(periods: int) -> tuple:
+        # fastk_period, fastd_period, eg. 5, 3 for periods=14
+        return int(round(periods*5/14)), int(round(periods*3/14))
 
-class StochrsiSubscriber(IndicatorSubscriber):
-    classes_subscribing_to = [
-        PriceStorage
-    ]
+    def get_lookback(self, periods: int) -> int:
+        fastk_period, fastd_period = self.get_stochrsi_periods(periods)
+        return fastk_period + fastd_period
 
-    def handle(self, channel, data, *args, **kwargs):
+    def get_requisite_indicator_periods(self, periods: int) -> list:
+        # RsiStorage is saved under the horizon, eg. periods=168 is the RSI of horizon 12
+        return [(RsiStorage, max(periods // RSI_TIMEPERIOD, 1))]
 
-        self.index = self.key_suffix
+    def compute_value_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> str:
+        """
+        same as talib.STOCHRSI, a fast stochastic of the RSI values shared on the IndicatorContext
 
-        if str(self.index) is not "close_price":
-            logger.debug(f'index {self.index} is not close_price ...ignoring...')
-            return
+        :param periods: number of periods to compute value for
+        """
+        periods = periods or self.periods
+        fastk_period, fastd_period = self.get_stochrsi_periods(periods)
+        (_, rsi_periods), = self.get_requisite_indicator_periods(periods)
+        rsi_values = requisite_pv_index_arrrays[f'RsiStorage:{rsi_periods}:value']
 
-        new_stochrsi_storage = StochrsiStorage(ticker=self.ticker,
-                                     exchange=self.exchange,
-                                     timestamp=self.timestamp)
+        fastk, fastd = talib.STOCHF(rsi_values, rsi_values, rsi_values,
+                                    fastk_period=fastk_period, fastd_period=fastd_period, fastd_matype=0)
+        logger.debug(f"Stochrsi computed: {fastk[-1]}:{fastd[-1]}")
 
-        for horizon in HORIZONS:
-            periods = horizon * 14
+        if math.isnan(fastk[-1] + fastd[-1]): return ""
+        return f"{fastk[-1]}:{fastd[-1]}"
 
-            close_value_np_array = new_stochrsi_storage.get_denoted_price_array("close_price", periods)
+    def produce_signal(self):
+        pass
 
-            fastk, fastd = talib.STOCHRSI(close_value_np_array, timeperiod=horizon*14,
-                                        fastk_period=horizon*5, fastd_period=horizon*3, fastd_matype=0)[-1]
-            # logger.debug(f'savingStochrsi value {fastk}, {fastd} for {self.ticker} on {periods} periods')
 
-            new_stochrsi_storage.periods = periods
-            new_stochrsi_storage.value = f'{fastk}:{fastd}'
-            new_stochrsi_storage.save()
+class StochrsiSubscriber(IndicatorSubscriber):
+    classes_subscribing_to = [PriceStorage]
+    storage_class = StochrsiStorage
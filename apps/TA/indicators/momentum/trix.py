@@ -1,47 +1,43 @@
+import math
 from settings import LOAD_TALIB
 
 if LOAD_TALIB:
     import talib
 
-from apps.TA import HORIZONS
-from apps.TA.storages.abstract.indicator import IndicatorStorage
+from apps.TA.storages.abstract.incremental_indicator import IncrementalIndicatorStorage, state_values_to_str
 from apps.TA.storages.abstract.indicator_subscriber import IndicatorSubscriber
 from apps.TA.storages.data.price import PriceStorage
-from settings import logger
+from apps.TA.storages.utils.recursive import ema_update, NAN
 
 
-class TrixStorage(IndicatorStorage):
+class TrixStorage(IncrementalIndicatorStorage):
 
-    def produce_signal(self):
-        pass
-
-
-class TrixSubscriber(IndicatorSubscriber):
-    classes_subscribing_to = [
-        PriceStorage
-    ]
+    class_periods_list = [30]
+    requisite_pv_indexes = ["close_price"]
+    talib_function = "TRIX"
+    state_warmup = 10  # the rate of change of a triple EMA amplifies the error of a short warm up
 
-    def handle(self, channel, data, *args, **kwargs):
+    def compute_value_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> str:
+        trix_value = talib.TRIX(requisite_pv_index_arrrays["close_price"], timeperiod=periods or self.periods)[-1]
+        if math.isnan(trix_value): return ""
+        return str(trix_value)
 
-        self.index = self.key_suffix
+    def advance_state(self, state: dict, arrays: dict, i: int, periods: int):
+        ema1 = ema_update(state, "ema1", arrays["close_price"][i], periods)
+        ema2 = ema_update(state, "ema2", ema1, periods)
+        previous_ema3 = state.get("ema3", NAN)
+        ema3 = ema_update(state, "ema3", ema2, periods)
+        if not math.isnan(previous_ema3) and previous_ema3 != 0:
+            # 1 period rate of change of the triple EMA
+            state["trix"] = (ema3 - previous_ema3) / previous_ema3 * 100
 
-        if str(self.index) is not "close_price":
-            logger.debug(f'index {self.index} is not close_price ...ignoring...')
-            return
+    def value_from_state(self, state: dict, periods: int) -> str:
+        return state_values_to_str(state.get("trix", NAN))
 
-        new_trix_storage = TrixStorage(ticker=self.ticker,
-                                     exchange=self.exchange,
-                                     timestamp=self.timestamp)
-
-        for horizon in HORIZONS:
-            periods = horizon * 30
-
-            close_value_np_array = new_trix_storage.get_denoted_price_array("close_price", periods)
+    def produce_signal(self):
+        pass
 
-            timeperiod = min([len(close_value_np_array), periods])
-            trix_value = talib.TRIX(close_value_np_array, timeperiod=timeperiod)[-1]
-            # logger.debug(f'savingTrix value {trix_value} for {self.ticker} on {periods} periods')
 
-            new_trix_storage.periods = periods
-            new_trix_storage.value = float(trix_value)
-            new_trix_storage.save()
+class TrixSubscriber(IndicatorSubscriber):
+    classes_subscribing_to = [PriceStorage]
+    storage_class = TrixStorage
@@ -2,16 +2,25 @@ from settings import LOAD_TALIB
 if LOAD_TALIB:
     import math, talib
 
-from apps.TA.storages.abstract.indicator import IndicatorStorage, BULLISH, BEARISH, OTHER
+from apps.TA.storages.abstract.indicator import IndicatorStorage, BULLISH, BEARISH, OTHER, series_values_to_strs
 from apps.TA.storages.abstract.indicator_subscriber import IndicatorSubscriber
 from apps.TA.storages.data.price import PriceStorage
+from apps.TA.storages.utils.rolling import RollingState, RollingMinMax
 from settings import logger
 
+SQUEEZE_PERIODS = 180  # a squeeze is the smallest width of this many periods
+
 
 class BbandsStorage(IndicatorStorage):
 
     class_periods_list = [5]
     requisite_pv_indexes = ["close_price"]
+    value_names = ["upperband", "middleband", "lowerband"]
+    talib_function = "BBANDS"
+
+    @classmethod
+    def get_talib_params(cls, periods: int) -> dict:
+        return dict(timeperiod=periods, nbdevup=2.0, nbdevdn=2.0, matype=0)
 
     def get_width(self):
         self.value = self.get_value()
@@ -46,33 +55,49 @@ class BbandsStorage(IndicatorStorage):
 
         return f"{upperband[-1]}:{middleband[-1]}:{lowerband[-1]}"
 
+    def compute_series_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> list:
+        return series_values_to_strs(*talib.BBANDS(
+            requisite_pv_index_arrrays["close_price"],
+            timeperiod=periods or self.periods,
+            nbdevup=2, nbdevdn=2, matype=0
+        ))
 
-    def produce_signal(self):
 
-        self.value = self.get_value()
-        # Bbands value like f"{upperband_val}:{middleband_val}:{lowerband_val}"
+    def get_width_range(self) -> RollingMinMax:
+        """
+        min and max width over the last SQUEEZE_PERIODS, kept up to date in redis instead of queried each time
+        """
+        score = self.score_from_timestamp(self.unix_timestamp)
+        rolling_state = RollingState.load(self.get_rolling_db_key())
+        width_range = rolling_state.get("width", RollingMinMax, SQUEEZE_PERIODS)
+
+        if rolling_state.is_new("width"):  # first check for this key, seed it once from the saved bands
+            query_result = BbandsStorage.query(
+                ticker=self.ticker, exchange=self.exchange, timestamp=self.unix_timestamp,
+                periods_key=self.periods, periods_range=SQUEEZE_PERIODS
+            )
+            for value, value_score in zip(query_result.get('values', []), query_result.get('scores', [])):
+                if value and float(value_score) < score:
+                    upperband_val, middleband_val, lowerband_val = [float(val) for val in value.split(":")]
+                    width_range.update(value_score, (upperband_val - lowerband_val) / middleband_val)
+
+        width_range.update(score, self.width)
+        rolling_state.save()
+        return width_range
 
-        [self.upperband_val, self.middleband_val, self.lowerband_val] = [float(val) for val in self.value.split(":")]
-        self.width = (self.upperband_val - self.lowerband_val) / self.middleband_val
+    def produce_signal(self):
+        # Bbands value like f"{upperband_val}:{middleband_val}:{lowerband_val}"
+        if self.get_width() is None:
+            return
 
-        query_result = BbandsStorage.query(
-            ticker=self.ticker, exchange=self.exchange, timestamp=self.unix_timestamp, periods=180
-        )
-        if query_result['values_count'] < 180:
+        width_range = self.get_width_range()
+        if not width_range.is_full():
             return  # not enough data
 
-        bbands_values = query_result['values'][-180:]
-
-        upper, middle, lower = 0, 1, 2
-
-        bbands_widths = [(float(v.split(":")[upper]) - float(v.split(":")[lower])) / float(v.split(":")[middle])
-                         for v in query_result['values']]
-
-        if self.width <= min(bbands_widths):  # smallest width (squeeze) in the last 180 periods
+        if self.width <= width_range.min:  # smallest width (squeeze) in the last 180 periods
             # squeeze = True
 
-            self.price = float(PriceStorage.query(ticker=self.ticker, exchange=self.exchange, index="close_price",
-                                                  timestamp=self.unix_timestamp)['values'][-1])
+            self.price = self.get_signal_price()
 
             if self.price > self.upperband_val:  # price breaks out above the band
                 self.trend = BULLISH
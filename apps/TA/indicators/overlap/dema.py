@@ -1,51 +1,40 @@
+import math
 from settings import LOAD_TALIB
 
 if LOAD_TALIB:
     import talib
 
-from apps.TA import HORIZONS
-from apps.TA.storages.abstract.indicator import IndicatorStorage
+from apps.TA.storages.abstract.incremental_indicator import IncrementalIndicatorStorage, state_values_to_str
 from apps.TA.storages.abstract.indicator_subscriber import IndicatorSubscriber
 from apps.TA.storages.data.price import PriceStorage
-from settings import logger
+from apps.TA.storages.utils.recursive import ema_update, NAN
 
 DEMA_LIST = [30,]
 
 
-class DemaStorage(IndicatorStorage):
+class DemaStorage(IncrementalIndicatorStorage):
 
-    def produce_signal(self):
-        pass
-
-
-class DemaSubscriber(IndicatorSubscriber):
-    classes_subscribing_to = [
-        PriceStorage
-    ]
-
-    def handle(self, channel, data, *args, **kwargs):
+    class_periods_list = DEMA_LIST
+    requisite_pv_indexes = ["close_price"]
+    talib_function = "DEMA"
 
-        self.index = self.key_suffix
+    def compute_value_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> str:
+        dema_value = talib.DEMA(requisite_pv_index_arrrays["close_price"], timeperiod=periods or self.periods)[-1]
+        if math.isnan(dema_value): return ""
+        return str(dema_value)
 
-        if self.index != 'close_price':
-            logger.debug(f'index {self.index} is not close_price ...ignoring...')
-            return
+    def advance_state(self, state: dict, arrays: dict, i: int, periods: int):
+        ema1 = ema_update(state, "ema1", arrays["close_price"][i], periods)
+        ema_update(state, "ema2", ema1, periods)
 
-        new_dema_storage = DemaStorage(ticker=self.ticker,
-                                     exchange=self.exchange,
-                                     timestamp=self.timestamp)
+    def value_from_state(self, state: dict, periods: int) -> str:
+        ema1, ema2 = state.get("ema1", NAN), state.get("ema2", NAN)
+        return state_values_to_str(2 * ema1 - ema2)
 
-        periods_list = []
-        for s in DEMA_LIST:
-            periods_list.extend([h * s for h in HORIZONS])
-
-        for periods in set(periods_list):
-
-            close_value_np_array = new_dema_storage.get_denoted_price_array("close_price", periods)
+    def produce_signal(self):
+        pass
 
-            dema_value = talib.DEMA(close_value_np_array, timeperiod=periods)[-1]
-            # logger.debug(f'savingDema value {dema_value}for {self.ticker} on {periods} periods')
 
-            new_dema_storage.periods = periods
-            new_dema_storage.value = float(dema_value)
-            new_dema_storage.save()
+class DemaSubscriber(IndicatorSubscriber):
+    classes_subscribing_to = [PriceStorage]
+    storage_class = DemaStorage
@@ -2,15 +2,17 @@ from settings import LOAD_TALIB
 if LOAD_TALIB:
     import math, talib
 
-from apps.TA.storages.abstract.indicator import IndicatorStorage
+from apps.TA.storages.abstract.indicator import series_values_to_strs
+from apps.TA.storages.abstract.incremental_indicator import IncrementalIndicatorStorage, state_values_to_str
 from apps.TA.storages.abstract.indicator_subscriber import IndicatorSubscriber
 from apps.TA.storages.data.price import PriceStorage
+from apps.TA.storages.utils.recursive import ema_update
 from settings import logger
 
 EMA_LIST = [30, 50, 200, ]
 
 
-class EmaStorage(IndicatorStorage):
+class EmaStorage(IncrementalIndicatorStorage):
     # sorted_set_key = "BTC_USDT:poloniex:EmaStorage:30"
 
     class_periods_list = EMA_LIST
@@ -36,6 +38,15 @@ class EmaStorage(IndicatorStorage):
 
         return str(ema_value)
 
+    def compute_series_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> list:
+        return series_values_to_strs(talib.EMA(requisite_pv_index_arrrays["close_price"], timeperiod=periods or self.periods))
+
+    def advance_state(self, state: dict, arrays: dict, i: int, periods: int):
+        ema_update(state, "ema", arrays["close_price"][i], periods)
+
+    def value_from_state(self, state: dict, periods: int) -> str:
+        return state_values_to_str(state.get("ema"))
+
     def produce_signal(self):
         pass
 
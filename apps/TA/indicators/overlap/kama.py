@@ -1,51 +1,56 @@
+import math
+import numpy as np
 from settings import LOAD_TALIB
 
 if LOAD_TALIB:
     import talib
 
-from apps.TA import HORIZONS
-from apps.TA.storages.abstract.indicator import IndicatorStorage, BULLISH
+from apps.TA.storages.abstract.indicator import BULLISH
+from apps.TA.storages.abstract.incremental_indicator import IncrementalIndicatorStorage, state_values_to_str
 from apps.TA.storages.abstract.indicator_subscriber import IndicatorSubscriber
 from apps.TA.storages.data.price import PriceStorage
-from settings import logger
+from apps.TA.storages.utils.recursive import NAN
 
 KAMA_LIST = [30,]
 
 
-class KamaStorage(IndicatorStorage):
+class KamaStorage(IncrementalIndicatorStorage):
 
-    def produce_signal(self):
-        pass
-
-
-class KamaSubscriber(IndicatorSubscriber):
-    classes_subscribing_to = [
-        PriceStorage
-    ]
+    class_periods_list = KAMA_LIST
+    requisite_pv_indexes = ["close_price"]
+    talib_function = "KAMA"
 
-    def handle(self, channel, data, *args, **kwargs):
+    def compute_value_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> str:
+        kama_value = talib.KAMA(requisite_pv_index_arrrays["close_price"], timeperiod=periods or self.periods)[-1]
+        if math.isnan(kama_value): return ""
+        return str(kama_value)
 
-        self.index = self.key_suffix
+    def get_state_lookback(self, periods: int) -> int:
+        return periods + 1  # efficiency ratio is over the last periods price changes
 
-        if self.index != 'close_price':
-            logger.debug(f'index {self.index} is not close_price ...ignoring...')
+    def advance_state(self, state: dict, arrays: dict, i: int, periods: int):
+        close_prices = arrays["close_price"]
+        if i < periods:
             return
 
-        new_kama_storage = KamaStorage(ticker=self.ticker,
-                                     exchange=self.exchange,
-                                     timestamp=self.timestamp)
+        # seeded with the previous close, like talib
+        previous_kama = state.get("kama", close_prices[i-1])
 
-        periods_list = []
-        for s in KAMA_LIST:
-            periods_list.extend([h * s for h in HORIZONS])
+        change = abs(close_prices[i] - close_prices[i-periods])
+        volatility = np.abs(np.diff(close_prices[i-periods:i+1])).sum()
+        efficiency_ratio = 1.0 if volatility <= change or volatility == 0 else change / volatility
 
-        for periods in set(periods_list):
+        fastest, slowest = 2.0 / (2 + 1), 2.0 / (30 + 1)
+        smoothing_constant = (efficiency_ratio * (fastest - slowest) + slowest) ** 2
+        state["kama"] = previous_kama + smoothing_constant * (close_prices[i] - previous_kama)
 
-            close_value_np_array = new_kama_storage.get_denoted_price_array("close_price", periods)
+    def value_from_state(self, state: dict, periods: int) -> str:
+        return state_values_to_str(state.get("kama", NAN))
 
-            kama_value = talib.KAMA(close_value_np_array, timeperiod=periods)[-1]
-            # logger.debug(f'savingKama value {kama_value}for {self.ticker} on {periods} periods')
+    def produce_signal(self):
+        pass
 
-            new_kama_storage.periods = periods
-            new_kama_storage.value = float(kama_value)
-            new_kama_storage.save()
+
+class KamaSubscriber(IndicatorSubscriber):
+    classes_subscribing_to = [PriceStorage]
+    storage_class = KamaStorage
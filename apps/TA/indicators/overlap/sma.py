@@ -2,7 +2,7 @@ from settings import LOAD_TALIB
 if LOAD_TALIB:
     import math, talib
 
-from apps.TA.storages.abstract.indicator import IndicatorStorage, BULLISH, BEARISH, OTHER
+from apps.TA.storages.abstract.indicator import IndicatorStorage, BULLISH, BEARISH, OTHER, series_values_to_strs
 from apps.TA.storages.abstract.indicator_subscriber import IndicatorSubscriber
 from apps.TA.storages.data.price import PriceStorage
 from settings import logger
@@ -15,6 +15,7 @@ class SmaStorage(IndicatorStorage):
 
     class_periods_list = SMA_LIST
     requisite_pv_indexes = ["close_price"]
+    talib_function = "SMA"
 
     def compute_value_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> str:
         """
@@ -34,6 +35,12 @@ class SmaStorage(IndicatorStorage):
 
         return str(sma_value)
 
+    def compute_series_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> list:
+        return series_values_to_strs(*self.compute_arrays_with_requisite_indexes(requisite_pv_index_arrrays, periods))
+
+    def compute_arrays_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> list:
+        return [talib.SMA(requisite_pv_index_arrrays["close_price"], timeperiod=periods or self.periods)]
+
 
     def produce_signal(self):
         """
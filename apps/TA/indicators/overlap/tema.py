@@ -1,51 +1,42 @@
+import math
 from settings import LOAD_TALIB
 
 if LOAD_TALIB:
     import talib
 
-from apps.TA import HORIZONS
-from apps.TA.storages.abstract.indicator import IndicatorStorage, BULLISH
+from apps.TA.storages.abstract.indicator import BULLISH
+from apps.TA.storages.abstract.incremental_indicator import IncrementalIndicatorStorage, state_values_to_str
 from apps.TA.storages.abstract.indicator_subscriber import IndicatorSubscriber
 from apps.TA.storages.data.price import PriceStorage
-from settings import logger
+from apps.TA.storages.utils.recursive import ema_update, NAN
 
 TEMA_LIST = [30,]
 
 
-class TemaStorage(IndicatorStorage):
+class TemaStorage(IncrementalIndicatorStorage):
 
-    def produce_signal(self):
-        pass
-
-
-class TemaSubscriber(IndicatorSubscriber):
-    classes_subscribing_to = [
-        PriceStorage
-    ]
-
-    def handle(self, channel, data, *args, **kwargs):
+    class_periods_list = TEMA_LIST
+    requisite_pv_indexes = ["close_price"]
+    talib_function = "TEMA"
 
-        self.index = self.key_suffix
+    def compute_value_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> str:
+        tema_value = talib.TEMA(requisite_pv_index_arrrays["close_price"], timeperiod=periods or self.periods)[-1]
+        if math.isnan(tema_value): return ""
+        return str(tema_value)
 
-        if self.index != 'close_price':
-            logger.debug(f'index {self.index} is not close_price ...ignoring...')
-            return
+    def advance_state(self, state: dict, arrays: dict, i: int, periods: int):
+        ema1 = ema_update(state, "ema1", arrays["close_price"][i], periods)
+        ema2 = ema_update(state, "ema2", ema1, periods)
+        ema_update(state, "ema3", ema2, periods)
 
-        new_tema_storage = TemaStorage(ticker=self.ticker,
-                                     exchange=self.exchange,
-                                     timestamp=self.timestamp)
+    def value_from_state(self, state: dict, periods: int) -> str:
+        ema1, ema2, ema3 = state.get("ema1", NAN), state.get("ema2", NAN), state.get("ema3", NAN)
+        return state_values_to_str(3 * ema1 - 3 * ema2 + ema3)
 
-        periods_list = []
-        for s in TEMA_LIST:
-            periods_list.extend([h * s for h in HORIZONS])
-
-        for periods in set(periods_list):
-
-            close_value_np_array = new_tema_storage.get_denoted_price_array("close_price", periods)
+    def produce_signal(self):
+        pass
 
-            tema_value = talib.TEMA(close_value_np_array, timeperiod=periods)[-1]
-            # logger.debug(f'savingTema value {tema_value}for {self.ticker} on {periods} periods')
 
-            new_tema_storage.periods = periods
-            new_tema_storage.value = float(tema_value)
-            new_tema_storage.save()
+class TemaSubscriber(IndicatorSubscriber):
+    classes_subscribing_to = [PriceStorage]
+    storage_class = TemaStorage
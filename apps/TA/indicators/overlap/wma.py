@@ -2,7 +2,7 @@ from settings import LOAD_TALIB
 if LOAD_TALIB:
     import math, talib
 
-from apps.TA.storages.abstract.indicator import IndicatorStorage
+from apps.TA.storages.abstract.indicator import IndicatorStorage, series_values_to_strs
 from apps.TA.storages.abstract.indicator_subscriber import IndicatorSubscriber
 from apps.TA.storages.data.price import PriceStorage
 from settings import logger
@@ -15,6 +15,7 @@ class WmaStorage(IndicatorStorage):
 
     class_periods_list = WMA_LIST
     requisite_pv_indexes = ["close_price"]
+    talib_function = "WMA"
 
     def compute_value_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> str:
         """
@@ -36,6 +37,9 @@ class WmaStorage(IndicatorStorage):
 
         return str(wma_value)
 
+    def compute_series_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> list:
+        return series_values_to_strs(talib.WMA(requisite_pv_index_arrrays["close_price"], timeperiod=periods or self.periods))
+
     def produce_signal(self):
         pass
 
@@ -0,0 +1,38 @@
+import logging
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+
+from apps.TA.storages.utils.indicator_backfill import backfill_all_tickers, get_backfill_storage_classes
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Compute indicator values over the whole 5min price history of every ticker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                            help='worker processes, one ticker at a time each (default cpu count)')
+        parser.add_argument('--indicator', action='append', default=[],
+                            help='indicator storage class to backfill, eg. SmaStorage, repeatable (default all)')
+        parser.add_argument('--no-resume', action='store_true',
+                            help='recompute values already saved, instead of continuing after the last one')
+
+    def handle(self, *args, **options):
+        class_names = [storage_class.__name__ for storage_class in get_backfill_storage_classes()]
+        unknown_names = set(options['indicator']) - set(class_names)
+        if unknown_names:
+            logger.error(f"cannot backfill {sorted(unknown_names)}, choose from {class_names}")
+            return
+
+        logger.info(f"Starting indicator backfill of {options['indicator'] or class_names} "
+                    f"with {options['processes']} processes")
+
+        values_count = backfill_all_tickers(
+            processes=options['processes'],
+            storage_class_names=options['indicator'],
+            resume=not options['no_resume']
+        )
+
+        logger.info(f"{values_count} indicator values saved")
@@ -0,0 +1,31 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.TA import PERIODS_24HR
+from apps.TA.storages.data.price import PriceStorage
+from apps.TA.storages.data.rollup import backfill_rollups
+from apps.TA.storages.utils.key_layout import split_ticker_key
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the 1hr, 4hr and 24hr RollupStorage bars from 5min price and volume history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=200, help='days of history to roll up (default 200)')
+
+    def handle(self, *args, **options):
+        periods = options['days'] * PERIODS_24HR
+        timestamp = (int(time.time()) // 300) * 300
+
+        logger.info(f"Starting rollup backfill for the last {options['days']} days")
+
+        bars_count = 0
+        for key in PriceStorage.get_registered_keys(match="*:PriceStorage:close_price"):
+            [ticker, exchange, storage_class, index] = split_ticker_key(key)
+            bars_count += backfill_rollups(ticker, exchange, timestamp, periods)
+
+        logger.info(f"{bars_count} rollup bars saved")
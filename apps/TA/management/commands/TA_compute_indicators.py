@@ -0,0 +1,32 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.TA.storages.utils.indicator_backfill import compute_all_tickers, get_backfill_storage_classes
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Compute the indicator values of one 5min period for every ticker, ' \
+           'talib kernel indicators are evaluated on many tickers at once'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--timestamp', type=int, default=None,
+                            help='unix timestamp of the 5min period (default the last complete one)')
+        parser.add_argument('--indicator', action='append', default=[],
+                            help='indicator storage class to compute, eg. SmaStorage, repeatable (default all)')
+
+    def handle(self, *args, **options):
+        class_names = [storage_class.__name__ for storage_class in get_backfill_storage_classes()]
+        unknown_names = set(options['indicator']) - set(class_names)
+        if unknown_names:
+            logger.error(f"cannot compute {sorted(unknown_names)}, choose from {class_names}")
+            return
+
+        timestamp = options['timestamp'] or (int(time.time()) // 300 - 1) * 300
+
+        logger.info(f"Computing {options['indicator'] or class_names} at {timestamp}")
+        values_count = compute_all_tickers(timestamp, storage_class_names=options['indicator'])
+        logger.info(f"{values_count} indicator values saved")
@@ -6,9 +6,11 @@ from django.core.management.base import BaseCommand
 
 from apps.TA import PRICE_INDEXES
 from apps.TA.storages.abstract.timeseries_storage import TimeseriesStorage
+from apps.TA.storages.data.price import PriceStorage
 from apps.common.utilities.multithreading import start_new_thread, multithread_this_shit
 from apps.TA.storages.utils import missing_data
-from settings.redis_db import database
+from apps.TA.storages.utils.key_layout import split_ticker_key, ticker_key_pattern
+from apps.TA.storages.utils.list_search import contiguous_ranges
 
 logger = logging.getLogger(__name__)
 
@@ -45,11 +47,12 @@ def fill_data_gaps(SQL_fill = False, force_fill=False):
 
     method_params = []
 
-    for ticker in ["*_USDT", "*_BTC"]:
+    for ticker_pattern in ["*_USDT", "*_BTC"]:
         for index in ['close_price', 'open_price', 'high_price', 'low_price', 'close_volume']:
 
-            for key in database.keys(f"{ticker}*PriceStorage*{index}*"):
-                [ticker, exchange, storage_class, index] = key.decode("utf-8").split(":")
+            key_pattern = ticker_key_pattern(ticker_pattern, "*", f"PriceStorage:{index}")
+            for key in PriceStorage.get_registered_keys(match=key_pattern):
+                [ticker, exchange, storage_class, index] = split_ticker_key(key)
 
                 ugly_tuple = (ticker, exchange, index, bool(SQL_fill))
                 method_params.append(ugly_tuple)
@@ -57,22 +60,36 @@ def fill_data_gaps(SQL_fill = False, force_fill=False):
     logger.info(f"{len(method_params)} tickers ready to fill gaps")
 
     results = multithread_this_shit(condensed_fill_redis_gaps, method_params)
-
-    missing_scores_count = sum([len(result) for result in results])
-    logger.warning(f"{missing_scores_count} scores could not be recovered and are still missing.")
+    log_gaps_summary(method_params, results)
 
     if SQL_fill:
         results = multithread_this_shit(condensed_fill_SQL_gaps, method_params)
-        missing_scores_count = sum([len(result) for result in results])
-        logger.warning(f"{missing_scores_count} scores could not be recovered and are still missing.")
+        log_gaps_summary(method_params, results)
 
     if force_fill:
         logger.warning("STARTING FORCE FILL OF THESE VALUES...")
         logger.warning("!! THERE'S NO GOING BACK FROM HERE. DATA MAY WILL BE PERMAMENTLY CORRUPTED !!")
-        for missing_scores in results:
+        for (ticker, exchange, index, _), missing_scores in zip(method_params, results):
             missing_data.force_plug_pv_storage_data_gaps(ticker, exchange, index, missing_scores)
 
 
+def log_gaps_summary(method_params: list, results: list):
+    """
+    one line per (ticker, exchange, index) still having gaps, then the totals
+    """
+    gaps_count = 0
+    for (ticker, exchange, index, _), missing_scores in zip(method_params, results):
+        if not missing_scores:
+            continue
+        index_gaps_count = len(contiguous_ranges(missing_scores))
+        gaps_count += index_gaps_count
+        logger.info(f"{ticker}:{exchange}:{index} still has {len(missing_scores)} missing scores "
+                    f"in {index_gaps_count} gaps, from {min(missing_scores)} to {max(missing_scores)}")
+
+    missing_scores_count = sum([len(result) for result in results])
+    logger.warning(f"{missing_scores_count} scores in {gaps_count} gaps could not be recovered and are still missing.")
+
+
 def condensed_fill_redis_gaps(ugly_tuple):
     (ticker, exchange, index, back_to_the_backlog) = ugly_tuple
     return missing_data.find_pv_storage_data_gaps(ticker, exchange, index, back_to_the_backlog=False)
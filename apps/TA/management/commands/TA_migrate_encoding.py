@@ -0,0 +1,84 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from apps.TA import PV_MEMBER_ENCODING
+from apps.TA.storages.utils.member_codec import ENCODINGS, TEXT_ENCODING, PACKED_ENCODING, \
+    MemberCodecException, encode_member, decode_member, is_packed_member
+from settings.redis_db import database
+
+logger = logging.getLogger(__name__)
+
+MIGRATED_STORAGE_CLASSES = ["PriceStorage", "VolumeStorage", "PriceVolumeHistoryStorage"]
+CHUNK_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Rewrite sorted set members of price and volume storages in place using another member encoding'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--encoding', type=int, default=PV_MEMBER_ENCODING, choices=ENCODINGS,
+                            help=f'target encoding, {TEXT_ENCODING}=text, {PACKED_ENCODING}=packed')
+        parser.add_argument('--storage', action='append', choices=MIGRATED_STORAGE_CLASSES,
+                            help='storage class to migrate, may be repeated (default all)')
+
+    def handle(self, *args, **options):
+        encoding = options['encoding']
+        storage_class_names = options['storage'] or MIGRATED_STORAGE_CLASSES
+
+        logger.info(f"Starting member encoding migration to encoding {encoding} for {storage_class_names}")
+
+        for storage_class_name in storage_class_names:
+            keys_count, members_count = 0, 0
+            for key in database.scan_iter(match=f'*:{storage_class_name}:*', count=CHUNK_SIZE):
+                members_count += migrate_key_encoding(key, encoding)
+                keys_count += 1
+            logger.info(f"{storage_class_name}: {members_count} members rewritten in {keys_count} keys")
+
+
+def migrate_key_encoding(key, encoding: int) -> int:
+    """
+    Rewrite every member of a sorted set using the target encoding.
+    Members are read by score from a moving lower bound, rewritten
+    members keep their scores so none is read twice or skipped.
+    Each chunk is swapped inside a MULTI/EXEC transaction, so readers
+    never see a score missing. Readers decode mixed encodings,
+    so an interrupted migration can simply be run again.
+
+    :param key: redis sorted set key, eg. "ETH_BTC:binance:PriceStorage:close_price"
+    :param encoding: target encoding from member_codec.ENCODINGS
+    :return: number of members rewritten
+    """
+    rewritten_count = 0
+    min_score = "-inf"
+
+    while True:
+        members_with_scores = database.zrangebyscore(key, min_score, "+inf", start=0, num=CHUNK_SIZE,
+                                                     withscores=True)
+        if not members_with_scores:
+            break
+
+        last_score = members_with_scores[-1][1]
+        if len(members_with_scores) == CHUNK_SIZE:
+            # the chunk may end inside a run of equal scores, read the whole run
+            members_with_scores = [(member, score) for member, score in members_with_scores if score != last_score]
+            members_with_scores += database.zrangebyscore(key, last_score, last_score, withscores=True)
+
+        pipeline = database.pipeline(transaction=True)
+        for member, score in members_with_scores:
+            if is_packed_member(member) == (encoding == PACKED_ENCODING):
+                continue  # already in target encoding
+            value, member_score = decode_member(member)
+            try:
+                new_member = encode_member(value, member_score, encoding)
+            except MemberCodecException as e:
+                logger.warning(f"skipping member in {key}: {e}")
+                continue
+            pipeline.zrem(key, member)
+            pipeline.zadd(key, new_member, score)
+            rewritten_count += 1
+        pipeline.execute()
+
+        min_score = f"({last_score!r}"
+
+    return rewritten_count
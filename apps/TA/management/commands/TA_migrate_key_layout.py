@@ -0,0 +1,73 @@
+import logging
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from apps.TA import KEY_SCAN_COUNT, REDIS_KEY_HASH_TAGS
+from apps.TA.storages.abstract.ticker import TickerStorage
+from apps.TA.storages.utils.key_layout import split_ticker_key, convert_ticker_key
+from settings.redis_db import database
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = ('Rename the ticker keys to or from the hash tagged layout and update the key registries. '
+            'Run against a single redis node, before moving the data to a cluster')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hash-tags', type=int, default=int(REDIS_KEY_HASH_TAGS), choices=[0, 1],
+                            help='target layout, 1="{ETH_BTC:binance}:...", 0="ETH_BTC:binance:..." '
+                                 '(default TA_REDIS_KEY_HASH_TAGS)')
+
+    def handle(self, *args, **options):
+        hash_tags = bool(options['hash_tags'])
+        logger.info(f"Starting key layout migration, hash tags {'on' if hash_tags else 'off'}")
+
+        keys_count = 0
+        scan = database.scan_iter(match="*_*:*:*", count=KEY_SCAN_COUNT)
+        keys = list(islice(scan, KEY_SCAN_COUNT))
+        while keys:
+            keys_count += rename_keys(keys, hash_tags)
+            keys = list(islice(scan, KEY_SCAN_COUNT))
+
+        logger.info(f"{keys_count} keys renamed")
+
+
+def rename_keys(keys: list, hash_tags: bool) -> int:
+    """
+    keys already in the target layout and keys of other kinds are left alone
+    SCAN may return a renamed key again, it is then in the target layout
+
+    :param keys: eg. [b"ETH_BTC:binance:PriceStorage:close_price", b"key_registry:PriceStorage:binance"]
+    :return: number of keys renamed
+    """
+    renamed = []
+    pipeline = database.pipeline(transaction=False)
+
+    for key in keys:
+        key = key.decode("utf-8") if isinstance(key, bytes) else key
+        # "{ticker}:{exchange}:{class_name}:..." or "{ticker}:{exchange}:{state|rolling}:{class_name}:{periods}"
+        key_parts = split_ticker_key(key)
+        if len(key_parts) < 3 or not (key_parts[2].endswith("Storage") or key_parts[2] in ["state", "rolling"]):
+            continue
+        if key.startswith("{") == hash_tags:
+            continue
+
+        new_key = convert_ticker_key(key, hash_tags=hash_tags)
+        pipeline.renamenx(key, new_key)
+        renamed.append((key, new_key, key_parts))
+
+    renamed_count = 0
+    for (key, new_key, [ticker, exchange, storage_class_name, *suffix]), is_renamed in zip(renamed, pipeline.execute()):
+        if not is_renamed:
+            logger.warning(f"{new_key} already exists, {key} not renamed")
+            continue
+        renamed_count += 1
+        if storage_class_name.endswith("Storage"):
+            registry_key = f'{TickerStorage.key_registry_prefix}:{storage_class_name}:{exchange}'
+            pipeline.srem(registry_key, key)
+            pipeline.sadd(registry_key, new_key)
+
+    pipeline.execute()
+    return renamed_count
@@ -0,0 +1,51 @@
+import logging
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from apps.TA import KEY_SCAN_COUNT
+from apps.TA.storages.abstract.ticker import TickerStorage
+from apps.TA.storages.utils.key_layout import split_ticker_key
+from settings.redis_db import database
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Add the existing ticker storage keys to the key registries (keys saved from now on register themselves)'
+
+    def handle(self, *args, **options):
+        logger.info("Starting key registration, walking the keyspace with SCAN")
+
+        keys_count = 0
+        scan = database.scan_iter(match="*_*:*:*Storage*", count=KEY_SCAN_COUNT)
+        keys = list(islice(scan, KEY_SCAN_COUNT))
+        while keys:
+            keys_count += register_keys(keys)
+            keys = list(islice(scan, KEY_SCAN_COUNT))
+
+        logger.info(f"{keys_count} keys registered")
+
+
+def register_keys(keys: list) -> int:
+    """
+    :param keys: ticker storage keys, eg. b"ETH_BTC:binance:PriceStorage:close_price"
+    :return: number of keys registered
+    """
+    pipeline = database.pipeline(transaction=False)
+    registered_count = 0
+
+    for key in keys:
+        # "{ticker}:{exchange}:{class_name}:..."
+        key_parts = split_ticker_key(key)
+        if len(key_parts) < 3 or not key_parts[2].endswith("Storage"):
+            continue
+        [ticker, exchange, storage_class_name] = key_parts[:3]
+
+        class_registry_key = f'{TickerStorage.key_registry_prefix}:{storage_class_name}'
+        pipeline.sadd(class_registry_key, exchange)
+        pipeline.sadd(f'{class_registry_key}:{exchange}', key)
+        registered_count += 1
+
+    pipeline.execute()
+    return registered_count
@@ -18,13 +18,21 @@ logger = logging.getLogger(__name__)
 class Command(BaseCommand):
     help = 'Run Redis Data Restore from SQL'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--bulk', action='store_true',
+                            help='resample in pandas and write 5min storages directly, without pub/sub')
+
     def handle(self, *args, **options):
         logger.info("Starting TA restore script...")
 
         start_datetime = datetime(2018, 11, 7)
         end_datetime = datetime.today()
 
-        restore_db_to_redis(start_datetime, end_datetime)
+        if options['bulk']:
+            from apps.TA.storages.utils.bulk_restore import bulk_restore_db_to_redis
+            bulk_restore_db_to_redis(start_datetime, end_datetime)
+        else:
+            restore_db_to_redis(start_datetime, end_datetime)
 
         from apps.TA.management.commands.TA_fill_gaps import fill_data_gaps
         fill_data_gaps(SQL_fill=True, force_fill=False)
@@ -0,0 +1,20 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from apps.TA.management.commands.TA_worker import get_subscriber_classes
+from apps.TA.storages.utils import streams
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Show the consumer groups lag of the TA worker streams (TA_MESSAGE_TRANSPORT=streams)'
+
+    def handle(self, *args, **options):
+        for subscriber_class in get_subscriber_classes():
+            for s_class in subscriber_class.classes_subscribing_to:
+                stream_key = streams.get_stream_key(s_class.__name__)
+                lag = streams.get_group_lag(stream_key, subscriber_class.__name__)
+                self.stdout.write(f'{subscriber_class.__name__} on {stream_key}: '
+                                  f'{lag or "no consumer group yet"}')
@@ -3,14 +3,17 @@ import time
 
 from django.core.management.base import BaseCommand
 
+from apps.TA import MESSAGE_TRANSPORT
 from apps.TA.storages.utils.memory_cleaner import redisCleanup
+from apps.TA.storages.utils.query_cache import query_cache
 from settings.rabbitmq import WorkQueue
 from settings.redis_db import database
 
 logger = logging.getLogger(__name__)
 
 try:
-    earliest_price_score = int(float(database.zrangebyscore("BTC_USDT:bittrex:PriceStorage:close_price", 0, "inf", 0, 1)[0].decode("utf-8").split(":")[0]))
+    from apps.TA.storages.utils.member_codec import decode_member
+    earliest_price_score = int(float(decode_member(database.zrangebyscore("BTC_USDT:bittrex:PriceStorage:close_price", 0, "inf", 0, 1)[0])[1]))
 except:
     from apps.TA.storages.abstract.timeseries_storage import TimeseriesStorage
     earliest_price_score = TimeseriesStorage.score_from_timestamp(int(time.time()))
@@ -41,21 +44,40 @@ except:
 class Command(BaseCommand):
     help = 'Run Redis Subscribers for TA'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1,
+                            help='worker processes, events are sharded by (ticker, exchange) (default 1, no sharding)')
+
     def handle(self, *args, **options):
         logger.info("Starting TA worker.")
 
+        if options['processes'] > 1:
+            from apps.TA.storages.utils.dispatcher import TickerDispatcher
+            TickerDispatcher(get_subscriber_classes(), options['processes']).run()
+            return
+
         subscribers = {}
         for subscriber_class in get_subscriber_classes():
             subscribers[subscriber_class.__name__] = subscriber_class()
             logger.debug(f'added subscriber {subscriber_class}')
             logger.debug(f'new subscriber is {subscribers[subscriber_class.__name__]}')
 
-        for s in subscribers:
-            logger.debug(f'latest channels: {subscribers[s].database.pubsub_channels()}')
-
-        logger.info("Pubsub clients are ready.")
+        if MESSAGE_TRANSPORT == "streams":
+            logger.info("Stream consumers are ready.")
+        else:
+            for s in subscribers:
+                logger.debug(f'latest channels: {subscribers[s].database.pubsub_channels()}')
+            logger.info("Pubsub clients are ready.")
 
+        last_lag_log_time = last_cache_log_time = time.time()
         while True:
+            if MESSAGE_TRANSPORT == "streams" and time.time() - last_lag_log_time > STREAM_LAG_LOG_INTERVAL:
+                last_lag_log_time = time.time()
+                log_stream_lag(subscribers.values())
+            if query_cache.enabled and time.time() - last_cache_log_time > QUERY_CACHE_LOG_INTERVAL:
+                last_cache_log_time = time.time()
+                logger.info(f'query cache: {query_cache.get_stats()}')
+
             for class_name in subscribers:
                 # logger.debug(f'checking subscription {class_name}: {subscribers[class_name]}')
                 try:
@@ -80,13 +102,25 @@ class Command(BaseCommand):
     #         time.sleep(5)  # wait for the world to end
 
 
+STREAM_LAG_LOG_INTERVAL = 60  # seconds
+QUERY_CACHE_LOG_INTERVAL = 600  # seconds
+
+
+def log_stream_lag(subscribers):
+    for subscriber in subscribers:
+        for stream_key, lag in subscriber.get_lag().items():
+            logger.info(f'{subscriber.consumer_group} on {stream_key}: {lag}')
+
+
 def get_subscriber_classes():
 
     from apps.TA.storages.data.price import PriceSubscriber
+    # from apps.TA.storages.abstract.indicator_subscriber import IndicatorsSweepSubscriber
     # from apps.TA.storages.data.volume import VolumeSubscriber
     # only PriceStorage:close_price is publishing. All other p and v indexes are muted
 
     return [
         PriceSubscriber,
         # VolumeSubscriber,  # the PriceSubscriber handles volume resampling
+        # IndicatorsSweepSubscriber,  # runs all indicator subscribers on one shared price window per event
     ]
@@ -80,9 +80,11 @@ class HistoricalDataAPI(APIView):
 
 
             database_response = pipeline.execute()
+            # XADD of the streams transport replies with a message id, count only the int replies
+            entries_count = sum(response for response in database_response if isinstance(response, int))
 
             return Response({
-                       'success': f'{sum(database_response)} '
+                       'success': f'{entries_count} '
                                   f'db entries created and TA subscribers received'
                    }, status=status.HTTP_201_CREATED)
 
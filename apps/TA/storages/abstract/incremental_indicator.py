@@ -0,0 +1,140 @@
+import logging
+import math
+import numpy as np
+
+from apps.TA import VERIFY_INCREMENTAL_INDICATORS
+from apps.TA.storages.abstract.indicator import IndicatorStorage
+from apps.TA.storages.utils.key_layout import get_ticker_db_key
+from settings.redis_db import database
+
+logger = logging.getLogger(__name__)
+
+
+def state_values_to_str(*values) -> str:
+    # same format as the talib based indicators, "" until every value is available
+    if any(value is None or math.isnan(value) for value in values):
+        return ""
+    return ":".join(str(value) for value in values)
+
+
+class IncrementalIndicatorStorage(IndicatorStorage):
+    """
+    indicator with a recursive definition (EMA, RSI, MACD, ...)
+    the recursive state is saved in a redis hash per (ticker, exchange, indicator, periods)
+    and advanced by one price period on each new 5min close, instead of recomputing the whole window
+    a gap or a missing state (eg. after a restart) rebuilds the state from recent price history
+    """
+    recursive = True
+    state_lookback = 1  # price periods read by advance_state(), ending at the current period
+    state_warmup = 4  # rebuild from state_warmup * periods price periods, an EMA seed's weight decays to ~e**-8
+    verify = VERIFY_INCREMENTAL_INDICATORS
+    verify_tolerance = 1e-3  # relative difference allowed between incremental and full recompute
+
+    def get_state_db_key(self, periods: int) -> str:
+        # not under "{ticker}:{exchange}:{class_name}", where every key is a sorted set
+        return get_ticker_db_key(self.ticker, self.exchange, "state", self.__class__.__name__, periods)
+
+    def get_state_lookback(self, periods: int) -> int:
+        return self.state_lookback
+
+    def advance_state(self, state: dict, arrays: dict, i: int, periods: int):
+        """
+        override with the recursive step, update state in place
+
+        :param state: dict of floats, empty when starting from scratch
+        :param arrays: dict of requisite_pv_indexes: numpy arrays of price history
+        :param i: position in arrays of the price period to add, earlier positions are history
+        :param periods: number of periods of the indicator
+        """
+        raise NotImplementedError
+
+    def value_from_state(self, state: dict, periods: int) -> str:
+        """
+        override to format the indicator value from the state
+
+        :return: value string, "" while the state is still seeding
+        """
+        raise NotImplementedError
+
+    def compute_series_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> list:
+        # the recursion stepped over the whole arrays, or one vectorized call of cls.talib_function if set
+        if self.talib_function:
+            return super().compute_series_with_requisite_indexes(requisite_pv_index_arrrays, periods)
+        periods = periods or self.periods
+        state, values = {}, []
+        for i in range(len(requisite_pv_index_arrrays[self.requisite_pv_indexes[0]])):
+            self.advance_state(state, requisite_pv_index_arrrays, i, periods)
+            values.append(self.value_from_state(state, periods))
+        return values
+
+    def load_state(self, periods: int) -> dict:
+        state = database.hgetall(self.get_state_db_key(periods))
+        return {key.decode("utf-8"): float(value) for key, value in state.items()}
+
+    def save_state(self, state: dict, periods: int, pipeline=None):
+        (pipeline or database).hmset(
+            self.get_state_db_key(periods), {key: repr(float(value)) for key, value in state.items()}
+        )
+        return pipeline
+
+    def rebuild_state(self, periods: int) -> dict:
+        arrays = self.get_denoted_price_arrays(self.requisite_pv_indexes, periods * self.state_warmup)
+        state = {}
+        for i in range(len(arrays[self.requisite_pv_indexes[0]])):
+            self.advance_state(state, arrays, i, periods)
+        return state
+
+    def compute_value(self, periods: int = 0) -> str:
+        periods = periods or self.periods
+        score = self.score_from_timestamp(self.unix_timestamp)
+        state = self.load_state(periods)
+        state_score = state.pop('score', None)
+
+        if state_score == score:
+            return self.value_from_state(state, periods)  # already advanced to this period
+
+        if state_score is not None and state_score > score:
+            # an older period, eg. from get_value(), compute without touching the live state
+            return self.value_from_state(self.rebuild_state(periods), periods)
+
+        state_is_current = False
+        if state_score == score - 1:
+            lookback = self.get_state_lookback(periods)
+            arrays = self.get_denoted_price_arrays(self.requisite_pv_indexes, lookback)
+            if len(arrays[self.requisite_pv_indexes[0]]) == lookback:
+                self.advance_state(state, arrays, lookback - 1, periods)
+                state_is_current = True
+
+        if not state_is_current:
+            # gap in prices or no saved state (restart)
+            logger.debug(f'rebuilding {self.get_state_db_key(periods)} from price history')
+            state = self.rebuild_state(periods)
+
+        value = self.value_from_state(state, periods)
+        state['score'] = score
+        self.save_state(state, periods)
+
+        if self.verify:
+            self.verify_value(value, periods)
+        return value
+
+    def verify_value(self, value: str, periods: int) -> bool:
+        """
+        compare an incremental value with the full talib recompute in compute_value_with_requisite_indexes()
+
+        :return: True if the values agree within verify_tolerance
+        """
+        arrays = self.get_denoted_price_arrays(self.requisite_pv_indexes, periods * self.state_warmup)
+        full_value = self.compute_value_with_requisite_indexes(arrays, periods)
+
+        if value and full_value:
+            incremental_values = np.array(value.split(":"), dtype=np.float64)
+            full_values = np.array(full_value.split(":"), dtype=np.float64)
+            if np.allclose(incremental_values, full_values, rtol=self.verify_tolerance, equal_nan=True):
+                return True
+        elif value == full_value:
+            return True
+
+        logger.warning(f'{self.get_state_db_key(periods)} at {self.unix_timestamp}: '
+                       f'incremental value "{value}" != full recompute "{full_value}"')
+        return False
@@ -1,8 +1,20 @@
 import logging
+import math
+from datetime import datetime
+
+import numpy as np
 
 from apps.TA import TAException, HORIZONS
 from apps.TA.storages.abstract.ticker import TickerStorage
+from apps.TA.storages.utils import talib_kernel
+from apps.TA.storages.utils.key_layout import get_ticker_db_key
+from apps.TA.storages.utils.talib_kernel import KernelCall
 from apps.signal.models import Signal
+from settings import EMIT_SIGNALS, LOAD_TALIB
+from settings.redis_db import database
+
+if LOAD_TALIB:
+    import talib, talib.abstract
 
 logger = logging.getLogger(__name__)
 
@@ -13,10 +25,49 @@ class IndicatorException(TAException):
     pass
 
 
+def series_values_to_strs(*series) -> list:
+    """
+    format aligned talib output arrays like compute_value_with_requisite_indexes() formats their last value
+
+    :param series: one or more numpy arrays of the same length, eg. upperband, middleband, lowerband
+    :return: list of value strings, "" where any of the series is NaN
+    """
+    return [
+        "" if any(math.isnan(value) for value in values) else ":".join(str(value) for value in values)
+        for values in zip(*series)
+    ]
+
+
 class SignalException(TAException):
     pass
 
 
+def save_signals(signals: list) -> list:
+    """
+    insert unsaved Signal objects with one bulk_create
+    bulk_create skips the post_save receiver, so the signals are emitted here and marked sent with one update
+
+    :return: the saved signals
+    """
+    if not signals:
+        return []
+    signals = Signal.objects.bulk_create(signals)
+    if not EMIT_SIGNALS:
+        logger.debug("signals not sending because env variable EMIT_SIGNALS set to false")
+        return signals
+
+    sent_signals = []
+    for signal in signals:
+        try:
+            signal._send()
+            sent_signals.append(signal)
+        except Exception as e:
+            logger.error(f'error emitting signal: {str(e)}')
+    if sent_signals:
+        Signal.objects.filter(pk__in=[signal.pk for signal in sent_signals]).update(sent_at=datetime.now())
+    return signals
+
+
 class IndicatorStorage(TickerStorage):
     """
     stores indicators in a sorted set unique to each ticker and exchange
@@ -26,6 +77,7 @@ class IndicatorStorage(TickerStorage):
     """
     class_describer = "indicator"
     value_sig_figs = 6
+    score_dtype = np.int32
 
     class_periods_list = [1,]  # class should override this
     # list of integers where for x: (1 <= x <= 200)
@@ -35,6 +87,24 @@ class IndicatorStorage(TickerStorage):
     # may only include values in default_price_indexes or default_volume_indexes
     # eg. ["high_price", "low_price", "open_price", "close_price", "close_volume"]
 
+    requisite_indicators = []  # IndicatorStorage classes this one is computed from, eg. [RsiStorage] for STOCHRSI
+    # their outputs are computed once per event on the IndicatorContext and shared,
+    # see get_requisite_indicator_periods()
+    # the indicator graph evaluates them first, see storages/abstract/indicator_graph.py
+
+    value_names = ["value"]  # outputs, the ":" separated parts of a value, eg. ["upperband", "middleband", "lowerband"]
+
+    talib_function = ""  # eg. "SMA", for indicators that are one talib call on requisite_pv_indexes
+    # the default compute_value_with_requisite_indexes() and compute_series_with_requisite_indexes() make the call,
+    # non recursive ones are computed with the other such indicators in one pass over the IndicatorContext matrix,
+    # see storages/utils/talib_kernel.py and get_talib_params()
+
+    recursive = False  # the value depends on the whole price history, not only on the last `periods` periods
+
+    rollup_horizons = []  # class may override, eg. [PERIODS_24HR]
+    # periods that are a multiple of one of these horizons are computed on RollupStorage bars of that horizon
+    # instead of 5min periods, eg. 200 bars of 24hr instead of 57600 periods of 5min
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -55,6 +125,18 @@ class IndicatorStorage(TickerStorage):
         self.db_key_suffix = f':{self.periods}'
         self.value = None
 
+        # optional IndicatorContext shared by all indicators computed for the same event
+        self.context = kwargs.get('context', None)
+
+        # while produce_signals() runs, send_signal() collects unsaved Signals here instead of saving each one
+        self.signal_batch = None
+        self.signal_price = None
+
+    def get_context(self):
+        if self.context and self.context.matches(self.ticker, self.exchange, self.unix_timestamp):
+            return self.context
+        return None
+
     def get_value(self, refresh_from_db=False):
         try:
             if self.value and not refresh_from_db:
@@ -84,7 +166,7 @@ class IndicatorStorage(TickerStorage):
         return int(round(super().periods_from_seconds(*args, **kwargs)))
 
     @classmethod
-    def query(cls, *args, **kwargs):
+    def compile_query_kwargs(cls, kwargs: dict) -> dict:
 
         periods_key = kwargs.get("periods_key", "")
         key_suffix = kwargs.get("key_suffix", "")
@@ -92,9 +174,14 @@ class IndicatorStorage(TickerStorage):
         if periods_key:
             kwargs["key_suffix"] = f'{periods_key}' + (f':{key_suffix}' if key_suffix else "")
 
+        return super().compile_query_kwargs(kwargs)
+
+    @classmethod
+    def query(cls, *args, **kwargs):
+
         results_dict = super().query(*args, **kwargs)
 
-        results_dict['periods_key'] = periods_key
+        results_dict['periods_key'] = kwargs.get("periods_key", "")
         return results_dict
 
     @classmethod
@@ -104,34 +191,196 @@ class IndicatorStorage(TickerStorage):
             periods_list.extend([h * s for h in HORIZONS])
         return set(periods_list)
 
+    def get_rolling_db_key(self, periods: int = 0) -> str:
+        # hash of RollingState statistics used by produce_signal(), see storages/utils/rolling.py
+        return get_ticker_db_key(self.ticker, self.exchange, "rolling", self.__class__.__name__,
+                                 periods or self.periods)
+
+    def get_rollup_horizon(self, periods: int) -> int:
+        horizons = [horizon for horizon in self.rollup_horizons if periods % horizon == 0]
+        return max(horizons) if horizons else 1
+
     def get_denoted_price_array(self, index: str = "close_price", periods: int = 0):
+        if self.get_rollup_horizon(periods or self.periods) > 1:
+            return self.get_denoted_price_arrays([index], periods)[index]
+
+        if self.get_context():
+            return self.context.get_arrays([index], periods or self.periods)[index]
+
         from apps.TA.storages.data.price import PriceStorage
-        results_dict = PriceStorage.query(
+        scores, values = PriceStorage.query_array(
             ticker=self.ticker,
             exchange=self.exchange,
             index=index,
             timestamp=self.unix_timestamp,
-            periods_range=periods or self.periods
+            periods_range=periods or self.periods,
+            limit=periods
         )
-        return self.get_values_array_from_query(results_dict, limit=periods)
+        return values
+
+    def get_denoted_price_arrays(self, indexes: list, periods: int = 0) -> dict:
+        """
+        fetch several price and volume indexes in one round trip
+        periods missing in any of the indexes are dropped, so the arrays stay aligned
+
+        :param indexes: eg. ["high_price", "low_price", "close_price"]
+        :param periods: number of periods up to and including self.unix_timestamp
+        :return: dict of index: numpy array, one value per bar if a rollup horizon applies to periods
+        """
+        periods = periods or self.periods
+        horizon = self.get_rollup_horizon(periods)
+        if horizon > 1:
+            from apps.TA.storages.data.rollup import RollupStorage
+            scores, matrix = RollupStorage.query_bars(
+                ticker=self.ticker,
+                exchange=self.exchange,
+                horizon=horizon,
+                timestamp=self.unix_timestamp,
+                bars=periods // horizon,
+                indexes=indexes
+            )
+            matrix = matrix[:, ~np.isnan(matrix).any(axis=0)]
+            return {index: matrix[i] for i, index in enumerate(indexes)}
+
+        if self.get_context():
+            return self.context.get_arrays(indexes, periods)
+
+        from apps.TA.storages.data.price import PriceStorage
+        scores, matrix = PriceStorage.query_ohlcv(
+            ticker=self.ticker,
+            exchange=self.exchange,
+            timestamp=self.unix_timestamp,
+            periods=periods,
+            indexes=indexes
+        )
+        matrix = matrix[:, ~np.isnan(matrix).any(axis=0)]
+        return {index: matrix[i] for i, index in enumerate(indexes)}
+
+    @classmethod
+    def get_talib_params(cls, periods: int) -> dict:
+        # keyword arguments of cls.talib_function
+        return dict(timeperiod=periods)
+
+    @classmethod
+    def get_talib_window(cls, periods: int) -> int:
+        # number of price periods a value of cls.talib_function reads, at least periods
+        lookback = talib.abstract.Function(cls.talib_function, **cls.get_talib_params(periods)).lookback
+        return max(periods, lookback + 1)
+
+    @classmethod
+    def get_kernel_calls(cls) -> list:
+        """
+        :return: list of KernelCall, one per periods, empty if the class has no talib_function
+        """
+        if not cls.talib_function or cls.rollup_horizons or cls.recursive:
+            return []
+        return [
+            KernelCall((cls.__name__, periods), cls.talib_function, cls.requisite_pv_indexes,
+                       cls.get_talib_params(periods), cls.get_talib_window(periods))
+            for periods in sorted(cls.get_periods_list())
+        ]
+
+    def compute_kernel_values(self) -> dict:
+        """
+        values of all periods from the talib kernel on the IndicatorContext, periods longer than its window are left out
+
+        :return: dict of periods: value string, empty without context or talib_function
+        """
+        if not self.get_context():
+            return {}
+        calls = [call for call in self.get_kernel_calls() if call.window <= self.context.periods]
+        return {key[1]: value for key, value in self.context.get_kernel_values(calls).items()}
+
+    def get_lookback(self, periods: int) -> int:
+        # number of periods of price history read to compute a value, override for indicators with a warm up
+        if self.talib_function and self.get_rollup_horizon(periods) == 1:
+            return self.get_talib_window(periods)
+        return periods
+
+    def get_requisite_indicator_periods(self, periods: int) -> list:
+        """
+        which outputs of self.requisite_indicators compute_value_with_requisite_indexes() gets
+        they are added to its arrays as f'{storage_class.__name__}:{periods}:{value_name}'
+
+        :return: list of (storage_class, periods), default is the same periods of each requisite indicator
+        """
+        return [(storage_class, periods) for storage_class in self.requisite_indicators]
+
+    def get_requisite_indicator_arrays(self, periods: int, length: int) -> dict:
+        """
+        :return: dict of f'{storage_class.__name__}:{periods}:{value_name}': the last `length` values,
+                 computed on the IndicatorContext window, NaN where the requisite indicator has no value
+        """
+        if not self.requisite_indicators:
+            return {}
+        if not self.get_context():
+            from apps.TA.storages.abstract.indicator_context import IndicatorContext  # circular dependancy
+            self.context = IndicatorContext(self.ticker, self.exchange, self.unix_timestamp)
+
+        requisite_arrays = {}
+        for storage_class, requisite_periods in self.get_requisite_indicator_periods(periods):
+            for value_name, values in self.context.get_indicator_arrays(storage_class, requisite_periods).items():
+                requisite_arrays[f'{storage_class.__name__}:{requisite_periods}:{value_name}'] = values[-length:]
+        return requisite_arrays
+
+    def compute_arrays(self, periods: int, length: int) -> dict:
+        """
+        the outputs of this indicator at each of the last `length` periods of the IndicatorContext,
+        for the indicators declaring this class in requisite_indicators
+
+        :return: dict of value_name: float array, NaN where there is no value
+        """
+        arrays = self.context.get_arrays(self.requisite_pv_indexes, length) if self.requisite_pv_indexes else {}
+        arrays.update(self.get_requisite_indicator_arrays(periods, length))
+        return dict(zip(self.value_names, self.compute_arrays_with_requisite_indexes(arrays, periods)))
+
+    def compute_arrays_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> list:
+        """
+        override with the talib call returning one array per value name
+        the default parses the strings of compute_series_with_requisite_indexes()
+
+        :return: list of float arrays, in the order of self.value_names
+        """
+        if self.talib_function:
+            return self.compute_talib_arrays(requisite_pv_index_arrrays, periods)
+        values = self.compute_series_with_requisite_indexes(requisite_pv_index_arrrays, periods)
+        return [
+            np.array([float(value.split(":")[i]) if value else np.nan for value in values], dtype=np.float64)
+            for i in range(len(self.value_names))
+        ]
+
+    def compute_talib_arrays(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> list:
+        """
+        one cls.talib_function call over the whole arrays of requisite_pv_indexes, with get_talib_params()
+
+        :return: list of float arrays, in the order of self.value_names
+        """
+        output = getattr(talib, self.talib_function)(
+            *[requisite_pv_index_arrrays[index] for index in self.requisite_pv_indexes],
+            **self.get_talib_params(periods or self.periods)
+        )
+        return list(output) if isinstance(output, (tuple, list)) else [output]
 
     def compute_value(self, periods: int = 0) -> str:
         periods = periods or self.periods
+        lookback = self.get_lookback(periods)
 
         index_value_arrrays = {}
-        for index in self.requisite_pv_indexes:
-            index_value_arrrays[index] = self.get_denoted_price_array(index, periods)
-            if not len(index_value_arrrays[index]): return ""
+        if self.requisite_pv_indexes:
+            index_value_arrrays = self.get_denoted_price_arrays(self.requisite_pv_indexes, lookback)
+        index_value_arrrays.update(self.get_requisite_indicator_arrays(periods, lookback))
+        if not index_value_arrrays or not all(len(values) for values in index_value_arrrays.values()): return ""
 
-        return self.compute_value_with_requisite_indexes(index_value_arrrays, periods)
+        # on rollup bars, the indicator is computed over the number of bars
+        return self.compute_value_with_requisite_indexes(index_value_arrrays, periods // self.get_rollup_horizon(periods))
 
     def compute_value_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> str:
         """
         custom class should set cls.requisite_pv_indexes
-        override this function with custom logic
+        override this function with custom logic, the default is the last value of cls.talib_function if set
 
         :param index_value_arrrays: a dict with keys matching requisite+pv_indexes and values from self.get_denoted_price_array()
-        :param periods: number of periods to compute value for
+        :param periods: number of periods to compute value for (number of bars if self.rollup_horizons applies)
         :return:
         """
         # example:
@@ -141,8 +390,34 @@ class IndicatorStorage(TickerStorage):
         # if math.isnan(sma_value):
         #     return ""
         # return str(sma_value)
+        if self.talib_function:
+            values = series_values_to_strs(*self.compute_talib_arrays(requisite_pv_index_arrrays, periods))
+            return values[-1] if values else ""
         return ""
 
+    def compute_series_with_requisite_indexes(self, requisite_pv_index_arrrays: dict, periods: int = 0) -> list:
+        """
+        the value at every position of the arrays, for backfilling history in one pass
+        override with a single vectorized talib call over the whole arrays
+        the default is that call if cls.talib_function is set,
+        else compute_value_with_requisite_indexes() on each window of `periods` (slow)
+
+        :param requisite_pv_index_arrrays: a dict with keys matching requisite_pv_indexes and aligned arrays without gaps
+        :param periods: number of periods to compute values for
+        :return: list of value strings, "" where there is no value
+        """
+        if self.talib_function:
+            return series_values_to_strs(*self.compute_talib_arrays(requisite_pv_index_arrrays, periods))
+        periods = periods or self.periods
+        length = len(requisite_pv_index_arrrays[self.requisite_pv_indexes[0]])
+        return [
+            self.compute_value_with_requisite_indexes(
+                {index: values[max(0, i + 1 - periods):i + 1] for index, values in requisite_pv_index_arrrays.items()},
+                periods
+            )
+            for i in range(length)
+        ]
+
     def compute_and_save(self) -> bool:
         """
 
@@ -160,11 +435,93 @@ class IndicatorStorage(TickerStorage):
         return bool(self.value)
 
     @classmethod
-    def compute_and_save_all_values_for_timestamp(cls, ticker, exchange, timestamp):
-        new_class_storage = cls(ticker=ticker, exchange=exchange, timestamp=timestamp)
-        for periods in cls.get_periods_list():
+    def compute_and_save_all_values_for_timestamp(cls, ticker, exchange, timestamp, context=None) -> int:
+        """
+        compute the values of all periods and save them in one pipeline,
+        then produce the signals of the computed values as one batch
+
+        :return: number of values saved
+        """
+        new_class_storage = cls(ticker=ticker, exchange=exchange, timestamp=timestamp, context=context)
+        pipeline = database.pipeline(transaction=False)
+        computed_values = []
+        kernel_values = new_class_storage.compute_kernel_values()
+
+        for periods in sorted(cls.get_periods_list()):
             new_class_storage.periods = periods
-            new_class_storage.compute_and_save()
+            if periods in kernel_values:
+                new_class_storage.value = kernel_values[periods]
+            else:
+                new_class_storage.value = new_class_storage.compute_value(periods)
+            if new_class_storage.value:
+                new_class_storage.save(pipeline=pipeline, send_signals=False)
+                computed_values.append((periods, new_class_storage.value))
+
+        if computed_values:
+            pipeline.execute()
+        new_class_storage.produce_signals(computed_values)
+        return len(computed_values)
+
+    @classmethod
+    def compute_and_save_all_values_for_tickers(cls, ticker_exchanges: list, timestamp) -> int:
+        """
+        the values of all periods for many tickers, read with one query and evaluated by the talib kernel,
+        saved in one pipeline, then the signals of each ticker are produced as one batch
+
+        :param ticker_exchanges: list of (ticker, exchange) tuples, eg. [("ETH_BTC", "binance"), ...]
+        :return: number of values saved
+        """
+        calls = cls.get_kernel_calls()
+        if not calls:
+            raise IndicatorException(f'{cls.__name__} is not computed by the talib kernel')
+
+        from apps.TA.storages.data.price import PriceStorage
+        scores, matrices = PriceStorage.query_ohlcv_many(
+            ticker_exchanges, timestamp, max(call.window for call in calls), cls.requisite_pv_indexes
+        )
+        results = talib_kernel.evaluate_many(matrices, cls.requisite_pv_indexes, calls, scores)
+
+        pipeline = database.pipeline(transaction=False)
+        batches = []  # (storage, computed_values) of each ticker
+        for (ticker, exchange), result in zip(ticker_exchanges, results):
+            new_class_storage = cls(ticker=ticker, exchange=exchange, timestamp=timestamp)
+            computed_values = []
+            for call in calls:
+                new_class_storage.periods, new_class_storage.value = call.key[1], result.get_value(call)
+                if new_class_storage.value:
+                    new_class_storage.save(pipeline=pipeline, send_signals=False)
+                    computed_values.append((new_class_storage.periods, new_class_storage.value))
+            batches.append((new_class_storage, computed_values))
+
+        pipeline.execute()
+        for new_class_storage, computed_values in batches:
+            new_class_storage.produce_signals(computed_values)
+        return sum(len(computed_values) for _, computed_values in batches)
+
+    def produce_signals(self, computed_values: list) -> list:
+        """
+        run produce_signal() for values already computed and saved, the Signals are written with one bulk_create
+
+        :param computed_values: list of (periods, value)
+        :return: saved Signal objects
+        """
+        self.signal_batch = []
+        try:
+            for periods, value in computed_values:
+                self.periods, self.value = periods, value
+                try:
+                    self.produce_signal()
+                except Exception as e:
+                    logger.error("error producing signal for indicator" + str(e))
+            signals = self.signal_batch
+        finally:
+            self.signal_batch, self.signal_price = None, None
+
+        try:
+            return save_signals(signals)
+        except Exception as e:
+            logger.error(f'error saving {len(signals)} signals for indicator: {str(e)}')
+            return []
 
     def produce_signal(self):
         """
@@ -185,14 +542,11 @@ class IndicatorStorage(TickerStorage):
             strength_max = 5,
         :return: signal object (Django model object)
         """
-        from apps.TA.storages.data.price import PriceStorage
-        price_results_dict = PriceStorage.query(ticker=self.ticker, exchange=self.exchange)
-        most_recent_price = int(price_results_dict['values'][0])
         # from apps.TA.storages.data.volume import VolumeStorage
         # volume_results_dict = VolumeStorage.query(ticker=self.ticker, exchange=self.exchange)
         # most_recent_volume = float(volume_results_dict ['values'][0])
 
-        return Signal.objects.create(
+        signal_fields = dict(
             timestamp=self.unix_timestamp,
             source=self.exchange,
             transaction_currency=self.ticker.split("_")[0],
@@ -202,11 +556,34 @@ class IndicatorStorage(TickerStorage):
 
             signal=self.__class__.__name__.replace("Storage", "").upper(),
             trend=trend,
-            price=most_recent_price,
+            price=self.get_signal_price(),
             **kwargs
         )
 
+        if self.signal_batch is not None:
+            signal = Signal(**signal_fields)
+            self.signal_batch.append(signal)  # saved by produce_signals()
+            return signal
+        return Signal.objects.create(**signal_fields)
+
+    def get_signal_price(self) -> int:
+        """
+        the most recent close price, from the IndicatorContext if there is one, read once per signal batch
+        """
+        if self.signal_batch is not None and self.signal_price is not None:
+            return self.signal_price
+
+        close_prices = self.context.get_arrays(["close_price"], 1)["close_price"] if self.get_context() else []
+        if len(close_prices):
+            self.signal_price = int(close_prices[-1])
+        else:
+            from apps.TA.storages.data.price import PriceStorage
+            price_results_dict = PriceStorage.query(ticker=self.ticker, exchange=self.exchange)
+            self.signal_price = int(price_results_dict['values'][0])
+        return self.signal_price
+
     def save(self, *args, **kwargs):
+        send_signals = kwargs.pop('send_signals', True)  # False when backfilling history
 
         # check meets basic requirements for saving
         if not all([self.ticker, self.exchange,
@@ -217,6 +594,8 @@ class IndicatorStorage(TickerStorage):
 
         self.db_key_suffix = f'{str(self.periods)}'
         save_result = super().save(*args, **kwargs)
+        if not send_signals:
+            return save_result
         try:
             self.produce_signal()
         except Exception as e:
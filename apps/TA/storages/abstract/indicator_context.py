@@ -0,0 +1,134 @@
+import logging
+import numpy as np
+
+from apps.TA import PERIODS_24HR
+from apps.TA.storages.data.pv_history import default_price_indexes
+from apps.TA.storages.utils import talib_kernel
+
+logger = logging.getLogger(__name__)
+
+# longest window read by any indicator (eg. SMA 200 and HT_TRENDLINE on the 24hr horizon)
+CONTEXT_PERIODS = PERIODS_24HR * 200
+
+
+class IndicatorContext(object):
+    """
+    price and volume window shared by all indicators computed for one (ticker, exchange, timestamp) event
+    the longest window is loaded from redis once, each indicator gets slices of it
+    """
+
+    def __init__(self, ticker: str, exchange: str, timestamp: int,
+                 periods: int = CONTEXT_PERIODS, indexes: list = default_price_indexes, kernel_calls: list = None):
+        self.ticker = ticker
+        self.exchange = exchange
+        self.unix_timestamp = int(timestamp)
+        self.periods = int(periods)
+        self.arrays = {}  # index: values aligned on self.scores, NaN where missing
+        self.indicator_arrays = {}  # (class name, periods): outputs of an indicator, see get_indicator_arrays()
+        self.matrix, self.matrix_indexes = None, []  # the matrix loaded last with all the indexes
+        self.kernel_calls = kernel_calls or []  # evaluated together on the first get_kernel_values()
+        self.kernel_values = {}  # call key: value string
+        self.scores = None
+        self.redis_round_trips = 0
+        self.load(indexes)
+
+    def __str__(self):
+        return f'{self.ticker}:{self.exchange}:{self.unix_timestamp}'
+
+    def matches(self, ticker: str, exchange: str, timestamp: int) -> bool:
+        return (self.ticker, self.exchange, self.unix_timestamp) == (ticker, exchange, int(timestamp))
+
+    def load(self, indexes: list):
+        from apps.TA.storages.data.price import PriceStorage  # import here, bc has circular dependancy
+
+        self.scores, matrix = PriceStorage.query_ohlcv(
+            ticker=self.ticker,
+            exchange=self.exchange,
+            timestamp=self.unix_timestamp,
+            periods=self.periods,
+            indexes=indexes
+        )
+        self.redis_round_trips += 1
+        for i, index in enumerate(indexes):
+            self.arrays[index] = matrix[i]
+        if set(indexes) >= set(self.matrix_indexes):
+            self.matrix, self.matrix_indexes = matrix, list(indexes)
+
+    def get_arrays(self, indexes: list, periods: int) -> dict:
+        """
+        :param indexes: eg. ["high_price", "low_price", "close_price"]
+        :param periods: number of periods up to and including the context timestamp
+        :return: dict of index: numpy array, periods missing in any of the indexes are dropped
+        """
+        periods = int(periods)
+
+        if periods > self.periods:
+            # longer than expected, reload everything at the new length
+            logger.debug(f'{self} context extended from {self.periods} to {periods} periods')
+            self.periods = periods
+            self.load(sorted(set(self.arrays) | set(indexes)))
+        else:
+            missing_indexes = [index for index in indexes if index not in self.arrays]
+            if missing_indexes:
+                self.load(missing_indexes)
+
+        window = np.vstack([self.arrays[index][-periods:] for index in indexes])
+        window = window[:, ~np.isnan(window).any(axis=0)]
+        return {index: window[i] for i, index in enumerate(indexes)}
+
+    def get_indicator_arrays(self, storage_class, periods: int) -> dict:
+        """
+        outputs of an indicator over the whole window, computed once per event
+        and shared by all indicators declaring it in their requisite_indicators
+
+        :param storage_class: eg. RsiStorage
+        :param periods: periods of the indicator, eg. 14
+        :return: dict of value name: float array,
+                 aligned on get_arrays(storage_class.requisite_pv_indexes, self.periods)
+        """
+        arrays_key = (storage_class.__name__, int(periods))
+        if arrays_key not in self.indicator_arrays:
+            storage = storage_class(ticker=self.ticker, exchange=self.exchange, timestamp=self.unix_timestamp,
+                                    context=self)
+            self.indicator_arrays[arrays_key] = storage.compute_arrays(int(periods), self.periods)
+        return self.indicator_arrays[arrays_key]
+
+    def get_last_values(self, indexes: list) -> tuple:
+        """
+        :return: the value of each index at the context timestamp, None where missing
+        """
+        missing_indexes = [index for index in indexes if index not in self.arrays]
+        if missing_indexes:
+            self.load(missing_indexes)
+        return tuple(
+            None if not len(self.arrays[index]) or np.isnan(self.arrays[index][-1]) else float(self.arrays[index][-1])
+            for index in indexes
+        )
+
+    def get_matrix(self, indexes: list) -> tuple:
+        """
+        :return: (matrix, matrix_indexes), reloaded with all indexes in one query if some are not in it
+        """
+        if not set(indexes) <= set(self.matrix_indexes):
+            self.load(sorted(set(self.arrays) | set(indexes)))
+        return self.matrix, self.matrix_indexes
+
+    def get_kernel_values(self, calls: list) -> dict:
+        """
+        values from the talib kernel, see storages/utils/talib_kernel.py
+        the first call also evaluates all of self.kernel_calls, so they take one pass over the matrix,
+        over the last columns of the matrix only, as many as the longest window of the calls
+
+        :param calls: list of KernelCall, eg. SmaStorage.get_kernel_calls()
+        :return: dict of call key: value string, "" where there is no value
+        """
+        pending_calls = {call.key: call for call in calls + self.kernel_calls
+                         if call.key not in self.kernel_values and call.window <= self.periods}
+        if any(call.key in pending_calls for call in calls):
+            matrix, indexes = self.get_matrix(sorted(set(index for call in pending_calls.values()
+                                                         for index in call.inputs)))
+            window = max(call.window for call in pending_calls.values())
+            result = talib_kernel.evaluate(matrix[:, -window:], indexes, list(pending_calls.values()),
+                                           self.scores[-window:])
+            self.kernel_values.update({key: result.get_value(call) for key, call in pending_calls.items()})
+        return {call.key: self.kernel_values.get(call.key, "") for call in calls}
@@ -0,0 +1,118 @@
+import logging
+
+from apps.TA import TAException
+from apps.TA.storages.abstract.indicator import IndicatorStorage
+from apps.TA.storages.data.pv_history import default_price_indexes, default_volume_indexes
+
+logger = logging.getLogger(__name__)
+
+# each IndicatorStorage declares its inputs, requisite_pv_indexes and requisite_indicators, and its value_names
+# the graph runs the indicator subscribers once per price event in dependency order,
+# the outputs of requisite indicators are computed once on the IndicatorContext and shared by their dependents
+
+
+class IndicatorGraphException(TAException):
+    pass
+
+
+def get_pv_inputs(storage_class, path: tuple = ()) -> list:
+    """
+    price and volume indexes the values of an indicator depend on, through its requisite indicators too
+
+    :return: sorted list of indexes, eg. ["close_price"]
+    """
+    if storage_class in path:
+        raise IndicatorGraphException(
+            f'requisite indicators cycle: {" -> ".join(s_class.__name__ for s_class in path + (storage_class,))}'
+        )
+    if storage_class is IndicatorStorage:
+        # subscribers with their own handle() declare nothing, any index may be used
+        return default_price_indexes + default_volume_indexes
+
+    pv_inputs = set(storage_class.requisite_pv_indexes)
+    for requisite_class in storage_class.requisite_indicators:
+        pv_inputs.update(get_pv_inputs(requisite_class, path + (storage_class,)))
+    return sorted(pv_inputs)
+
+
+class IndicatorNode(object):
+
+    def __init__(self, subscriber_class):
+        self.subscriber = subscriber_class(subscribe=False)
+        self.storage_class = subscriber_class.storage_class
+        self.name = subscriber_class.__name__
+        self.requisite_class_names = [
+            storage_class.__name__ for storage_class in self.storage_class.requisite_indicators
+        ]
+        self.pv_inputs = get_pv_inputs(self.storage_class)
+
+    def __repr__(self):
+        return f'IndicatorNode({self.name})'
+
+
+class IndicatorGraph(object):
+    """
+    the indicator subscribers in topological order of their requisite indicators
+    a node is skipped when the values of its inputs at the event timestamp are the same as on its last run,
+    eg. a close price published again, so the same (ticker, exchange) should always reach the same graph
+    """
+
+    def __init__(self, subscriber_classes: list):
+        self.nodes = self.sort([IndicatorNode(subscriber_class) for subscriber_class in subscriber_classes])
+        self.last_inputs = {}  # (ticker, exchange, node name): (timestamp, input values) of the last successful run
+
+    @staticmethod
+    def sort(nodes: list) -> list:
+        """
+        Kahn's algorithm, keeping the given order between independent nodes
+        requisite indicators without a node are computed on demand by the IndicatorContext
+
+        :return: nodes, each after the nodes of its requisite indicators
+        """
+        nodes_by_class_name = {node.storage_class.__name__: node for node in nodes
+                               if node.storage_class is not IndicatorStorage}
+        requisite_nodes = {
+            node.name: [nodes_by_class_name[class_name] for class_name in node.requisite_class_names
+                        if class_name in nodes_by_class_name]
+            for node in nodes
+        }
+
+        sorted_nodes, sorted_names = [], set()
+        while len(sorted_nodes) < len(nodes):
+            ready_nodes = [node for node in nodes if node.name not in sorted_names and
+                           all(requisite.name in sorted_names for requisite in requisite_nodes[node.name])]
+            if not ready_nodes:
+                cycle_names = [node.name for node in nodes if node.name not in sorted_names]
+                raise IndicatorGraphException(f'requisite indicators cycle between {cycle_names}')
+            sorted_nodes.extend(ready_nodes)
+            sorted_names.update(node.name for node in ready_nodes)
+        return sorted_nodes
+
+    def evaluate(self, channel, data, context) -> dict:
+        """
+        run each node's subscriber on the event with the shared context
+
+        :param context: IndicatorContext of the event
+        :return: dict of node name: True if run, False if skipped, None if failed
+        """
+        results = {}
+        for node in self.nodes:
+            inputs_key = (context.ticker, context.exchange, node.name)
+            inputs = (context.unix_timestamp, context.get_last_values(node.pv_inputs))
+            if self.last_inputs.get(inputs_key) == inputs:
+                results[node.name] = False
+                continue
+
+            subscriber = node.subscriber
+            try:
+                subscriber.pre_handle(channel, data)
+                subscriber.context = context
+                subscriber.handle(channel, data)
+                self.last_inputs[inputs_key] = inputs
+                results[node.name] = True
+            except Exception as e:
+                logger.error(f'{node.name} failed on {context}: {str(e)}')
+                results[node.name] = None
+            finally:
+                subscriber.context = None
+        return results
@@ -1,5 +1,9 @@
 from apps.TA.storages.abstract.indicator import IndicatorException, IndicatorStorage
+from apps.TA.storages.abstract.indicator_context import IndicatorContext
+from apps.TA.storages.abstract.indicator_graph import IndicatorGraph
 from apps.TA.storages.abstract.ticker_subscriber import TickerSubscriber, get_nearest_5min_timestamp
+from apps.TA.storages.data.price import PriceStorage
+from apps.TA.storages.utils.key_layout import split_ticker_key
 from settings import logger
 
 
@@ -9,6 +13,9 @@ class IndicatorSubscriber(TickerSubscriber):
         # ...
     ]
     storage_class = IndicatorStorage  # override with applicable storage class
+    handled_pv_indexes = []  # price indexes whose new values compute the indicator, eg. ["close_price"]
+    # default storage_class.requisite_pv_indexes
+    context = None  # IndicatorContext, set by IndicatorsSweepSubscriber before each handle()
 
     def extract_params(self, channel, data, *args, **kwargs):
 
@@ -19,7 +26,7 @@ class IndicatorSubscriber(TickerSubscriber):
         #     "score": "1532373300"
         # }
 
-        [self.ticker, self.exchange, object_class, self.key_suffix] = data["key"].split(":")
+        [self.ticker, self.exchange, object_class, self.key_suffix] = split_ticker_key(data["key"])
 
         if not object_class == channel and object_class in [
             sub_class.__name__ for sub_class in self.classes_subscribing_to
@@ -62,8 +69,50 @@ class IndicatorSubscriber(TickerSubscriber):
         :return:
         """
 
-        if self.key_suffix not in self.storage_class.requisite_pv_indexes:
-            logger.debug(f'index {self.key_suffix} is not in {self.storage_class.requisite_pv_indexes} ...ignoring...')
+        handled_pv_indexes = self.handled_pv_indexes or self.storage_class.requisite_pv_indexes
+        if self.key_suffix not in handled_pv_indexes:
+            logger.debug(f'index {self.key_suffix} is not in {handled_pv_indexes} ...ignoring...')
             return
 
-        self.storage_class.compute_and_save_all_values_for_timestamp(self.ticker, self.exchange, self.timestamp)
+        self.storage_class.compute_and_save_all_values_for_timestamp(
+            self.ticker, self.exchange, self.timestamp, context=self.context
+        )
+
+
+class IndicatorsSweepSubscriber(IndicatorSubscriber):
+    """
+    runs every indicator subscriber on each PriceStorage event with one shared IndicatorContext
+    so the price window is read from redis once per (ticker, exchange, timestamp)
+    instead of once per indicator and horizon
+    the subscribers run in the order of their IndicatorGraph, see storages/abstract/indicator_graph.py
+    """
+    class_describer = "indicators_sweep_subscriber"
+    classes_subscribing_to = [
+        PriceStorage
+    ]
+
+    def __init__(self, indicator_subscriber_classes=None, subscribe=True):
+        super().__init__(subscribe=subscribe)
+        if indicator_subscriber_classes is None:
+            from apps.TA.indicators import get_indicator_subscriber_classes
+            indicator_subscriber_classes = get_indicator_subscriber_classes()
+
+        self.indicator_graph = IndicatorGraph(indicator_subscriber_classes)
+        # talib kernel calls of all the indicators, evaluated in one pass over the context matrix
+        self.kernel_calls = [
+            call for node in self.indicator_graph.nodes for call in node.storage_class.get_kernel_calls()
+        ]
+
+    def handle(self, channel, data, *args, **kwargs):
+
+        if self.key_suffix != "close_price":
+            logger.debug(f'index {self.key_suffix} is not close_price ...ignoring...')
+            return
+
+        self.context = IndicatorContext(self.ticker, self.exchange, self.timestamp, kernel_calls=self.kernel_calls)
+        results = self.indicator_graph.evaluate(channel, data, self.context)
+
+        logger.debug(f'{list(results.values()).count(True)} indicator subscribers ran '
+                     f'({list(results.values()).count(False)} with unchanged inputs skipped) on {self.context} '
+                     f'with {self.context.redis_round_trips} price queries')
+        self.context = None
@@ -1,7 +1,11 @@
 import logging
-from apps.TA import TAException
-from apps.TA.storages.abstract.timeseries_storage import TimeseriesStorage
+from collections import defaultdict
+
+from apps.TA import TAException, KEY_SCAN_COUNT
+from apps.TA.storages.abstract.timeseries_storage import TimeseriesStorage, forget_registered_keys
+from apps.TA.storages.utils.key_layout import get_ticker_key_prefix, split_ticker_key
 from settings import EXCHANGE_MARKETS
+from settings.redis_db import database
 
 logger = logging.getLogger(__name__)
 
@@ -38,22 +42,97 @@ class TickerStorage(TimeseriesStorage):
 
 
     def get_db_key(self):
-        self.db_key_prefix = f'{self.ticker}:{self.exchange}:'
-        # by default will return "{ticker}:{exchange}:{class_name}"
+        self.db_key_prefix = get_ticker_key_prefix(self.ticker, self.exchange)
+        # by default will return "{ticker}:{exchange}:{class_name}", see key_layout.py for hash tags
         return super().get_db_key()
 
+    def save_own_existance(self, describer_key="", pipeline=None):
+        self.describer_key = describer_key or f'{self.__class__.class_describer}:{self.get_db_key()}'
+        if not self.needs_registering():
+            return pipeline
+
+        # the class registry holds exchanges, each exchange registry holds keys
+        if pipeline is None:
+            return database.pipeline(transaction=False).sadd(
+                self.get_key_registry_db_key(), self.exchange
+            ).sadd(
+                self.get_key_registry_db_key(self.exchange), self.get_db_key()
+            ).execute()
+
+        pipeline.sadd(self.get_key_registry_db_key(), self.exchange)
+        return pipeline.sadd(self.get_key_registry_db_key(self.exchange), self.get_db_key())
 
     @classmethod
-    def query(cls, *args, **kwargs):
+    def get_key_registry_db_key(cls, exchange: str = "", *args, **kwargs) -> str:
+        """
+        without exchange, the set of exchanges with keys saved by this class
+        with exchange, the set of db keys saved by this class for the exchange
+        eg. "key_registry:PriceStorage:binance"
+        """
+        return super().get_key_registry_db_key() + (f':{exchange}' if exchange else "")
+
+    @classmethod
+    def get_registered_exchanges(cls) -> list:
+        return sorted(exchange.decode("utf-8") for exchange in database.smembers(cls.get_key_registry_db_key()))
+
+    @classmethod
+    def get_registered_keys(cls, match: str = None, exchange: str = None, *args, **kwargs):
+        """
+        iterate the db keys saved by this class, with SSCAN so redis is never blocked
+
+        :param match: glob pattern on the keys (optional)
+        :param exchange: only keys of this exchange (optional, default all registered exchanges)
+        :return: generator of keys (bytes)
+        """
+        for exchange in ([exchange] if exchange else cls.get_registered_exchanges()):
+            yield from database.sscan_iter(cls.get_key_registry_db_key(exchange), match=match, count=KEY_SCAN_COUNT)
+
+    @classmethod
+    def unregister_keys(cls, keys: list, pipeline=None):
+        keys_by_exchange = defaultdict(list)
+        for key in keys:
+            # "{ticker}:{exchange}:{class_name}:..."
+            keys_by_exchange[split_ticker_key(key)[1]].append(key)
+
+        if pipeline is None:
+            if not keys_by_exchange:
+                return []
+            return cls.unregister_keys(keys, pipeline=database.pipeline(transaction=False)).execute()
+
+        forget_registered_keys(keys)
+        for exchange, exchange_keys in keys_by_exchange.items():
+            pipeline.srem(cls.get_key_registry_db_key(exchange), *exchange_keys)
+        return pipeline
+
+    @classmethod
+    def unregister_exchange(cls, exchange: str, pipeline=None):
+        """
+        forget every key of an exchange, eg. after deleting all its data
+        """
+        if pipeline is None:
+            return cls.unregister_exchange(exchange, pipeline=database.pipeline(transaction=False)).execute()
+
+        forget_registered_keys()
+        pipeline.delete(cls.get_key_registry_db_key(exchange))
+        return pipeline.srem(cls.get_key_registry_db_key(), exchange)
+
+
+    @classmethod
+    def compile_query_kwargs(cls, kwargs: dict) -> dict:
 
         ticker = kwargs.get("ticker", None)
         exchange = kwargs.get("exchange", None)
         if not ticker or not exchange:
             raise IndicatorException("ticker and exchange both requried for ticker query")
-        kwargs["key_prefix"] = f'{ticker}:{exchange}'
+        kwargs["key_prefix"] = get_ticker_key_prefix(ticker, exchange)
+
+        return super().compile_query_kwargs(kwargs)
+
+    @classmethod
+    def query(cls, *args, **kwargs):
 
         results_dict = super().query(*args, **kwargs)
         if results_dict:
-            results_dict['exchange'] = exchange
-            results_dict['ticker'] = ticker
+            results_dict['exchange'] = kwargs.get("exchange")
+            results_dict['ticker'] = kwargs.get("ticker")
         return results_dict
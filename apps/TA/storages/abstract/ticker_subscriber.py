@@ -1,9 +1,13 @@
 import json
+import time
 from abc import ABC
 import logging
+from collections import defaultdict
 from json import JSONDecodeError
 
-from apps.TA import TAException
+from apps.TA import TAException, MESSAGE_TRANSPORT
+from apps.TA.storages.utils import streams
+from apps.TA.storages.utils.query_cache import query_cache
 
 logger = logging.getLogger(__name__)
 
@@ -18,9 +22,28 @@ class TickerSubscriber(ABC):
         # ...
     ]
 
-    def __init__(self):
+    def __init__(self, subscribe=True):
         from settings.redis_db import database
         self.database = database
+        self.pubsub = None
+        self.stream_channels = {}  # stream_key: channel name, when MESSAGE_TRANSPORT is "streams"
+        if not subscribe:
+            # handled by another subscriber, eg. IndicatorsSweepSubscriber
+            return
+
+        if MESSAGE_TRANSPORT == "streams":
+            # one consumer group per subscriber class, shared by all TA_worker processes
+            self.consumer_group = self.__class__.__name__
+            self.consumer_name = streams.get_consumer_name()
+            self.last_claim_time = 0
+            for s_class in self.classes_subscribing_to:
+                stream_key = streams.get_stream_key(s_class.__name__)
+                streams.create_group(stream_key, self.consumer_group)
+                self.stream_channels[stream_key] = s_class.__name__
+                logger.info(f'{self.__class__.__name__} consuming {stream_key} '
+                            f'as {self.consumer_name} in group {self.consumer_group}')
+            return
+
         self.pubsub = database.pubsub()
         logger.info(f'New pubsub for {self.__class__.__name__}')
         for s_class in self.classes_subscribing_to:
@@ -29,6 +52,9 @@ class TickerSubscriber(ABC):
                         f'{s_class.__name__} channel')
 
     def __call__(self):
+        if self.stream_channels:
+            return self.consume_streams()
+
         data_event = self.pubsub.get_message()
         if not data_event:
             return
@@ -50,19 +76,65 @@ class TickerSubscriber(ABC):
 
         try:
             channel_name = data_event.get('channel').decode("utf-8")
-            event_data = json.loads(data_event.get('data').decode("utf-8"))
+        except Exception as e:
+            raise SubscriberException(f'Error calling {self.__class__.__name__}: ' + str(e))
+        self.process_message(channel_name, data_event.get('data'))
+
+    def process_message(self, channel_name: str, data: bytes):
+        try:
+            event_data = json.loads(data.decode("utf-8"))
+            query_cache.apply_published(event_data)
             # logger.debug(f'handling event in {self.__class__.__name__}')
             self.pre_handle(channel_name, event_data)
             self.handle(channel_name, event_data)
         except KeyError as  e:
-            logger.warning(f'unexpected format: {data_event} ' + str(e))
+            logger.warning(f'unexpected format: {data} ' + str(e))
             pass  # message not in expected format, just ignore
         except JSONDecodeError:
-            logger.warning(f'unexpected data format: {data_event["data"]}')
+            logger.warning(f'unexpected data format: {data}')
             pass  # message not in expected format, just ignore
         except Exception as e:
             raise SubscriberException(f'Error calling {self.__class__.__name__}: ' + str(e))
 
+    def consume_streams(self) -> int:
+        """
+        handle a batch of stream messages, each one acked once handled
+        a failing message stays pending and is retried after streams.STREAM_CLAIM_IDLE_MS,
+        by this or another TA_worker, like the messages of a dead worker
+
+        :return: number of messages handled
+        """
+        messages = []
+        if time.time() - self.last_claim_time > streams.STREAM_CLAIM_IDLE_MS / 1000:
+            self.last_claim_time = time.time()
+            for stream_key in self.stream_channels:
+                messages += streams.claim_stale_messages(stream_key, self.consumer_group, self.consumer_name)
+        messages += streams.read_group(list(self.stream_channels), self.consumer_group, self.consumer_name)
+
+        handled_ids = defaultdict(list)
+        for stream_key, message_id, data in messages:
+            try:
+                self.process_message(self.stream_channels[stream_key], data or b"")
+            except SubscriberException:
+                continue  # already logged, left pending
+            handled_ids[stream_key].append(message_id)
+
+        if handled_ids:
+            pipeline = self.database.pipeline(transaction=False)
+            for stream_key, message_ids in handled_ids.items():
+                streams.ack(stream_key, self.consumer_group, message_ids, pipeline=pipeline)
+            pipeline.execute()
+
+        return sum(len(message_ids) for message_ids in handled_ids.values())
+
+    def get_lag(self) -> dict:
+        """
+        :return: dict of stream_key: dict(consumers=, pending=, lag=), see streams.get_group_lag()
+        """
+        return {
+            stream_key: streams.get_group_lag(stream_key, self.consumer_group)
+            for stream_key in self.stream_channels
+        }
 
     def pre_handle(self, channel, data, *args, **kwargs):
         pass
@@ -1,14 +1,37 @@
 import json
 import logging
+import math
+import time
 from datetime import datetime
 import numpy as np
-from apps.TA import TAException, JAN_1_2017_TIMESTAMP
+from apps.TA import TAException, JAN_1_2017_TIMESTAMP, KEY_SCAN_COUNT, KEY_REGISTRY_REFRESH_SECONDS, \
+    MESSAGE_TRANSPORT
 from apps.TA.storages.abstract.key_value import KeyValueStorage
+from apps.TA.storages.utils.member_codec import TEXT_ENCODING, encode_member, decode_member, decode_members_to_arrays
+from apps.TA.storages.utils import streams
+from apps.TA.storages.utils.query_cache import query_cache
 from settings.redis_db import database
 
 logger = logging.getLogger(__name__)
 
 
+# db key: time this process last registered it, see TimeseriesStorage.needs_registering()
+registered_db_keys = {}
+
+
+def forget_registered_keys(keys: list = None):
+    """
+    keys removed from a key registry are registered again on their next save
+
+    :param keys: db keys, str or bytes (optional, default all keys)
+    """
+    if keys is None:
+        registered_db_keys.clear()
+        return
+    for key in keys:
+        registered_db_keys.pop(key.decode("utf-8") if isinstance(key, bytes) else key, None)
+
+
 class StorageException(TAException):
     pass
 
@@ -24,6 +47,9 @@ class TimeseriesStorage(KeyValueStorage):
 
     """
     class_describer = "timeseries"
+    key_registry_prefix = "key_registry"
+    member_encoding = TEXT_ENCODING  # see storages/utils/member_codec.py
+    score_dtype = np.float64  # numpy dtype for scores returned by query_array()
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -43,8 +69,56 @@ class TimeseriesStorage(KeyValueStorage):
         if self.unix_timestamp < JAN_1_2017_TIMESTAMP:
             raise TimeseriesException("timestamp before January 1st, 2017")
 
-    def save_own_existance(self, describer_key=""):
+    def needs_registering(self) -> bool:
+        """
+        True on the first save of the db key by this process, or KEY_REGISTRY_REFRESH_SECONDS after the last one,
+        the key is then counted as registered
+        """
+        db_key = self.get_db_key()
+        registered_time = registered_db_keys.get(db_key)
+        if registered_time is not None and time.time() - registered_time < KEY_REGISTRY_REFRESH_SECONDS:
+            return False
+        registered_db_keys[db_key] = time.time()
+        return True
+
+    def save_own_existance(self, describer_key="", pipeline=None):
+        """
+        register the db key in the key registry of the class, so maintenance code never needs KEYS
+        :return: the pipeline if one was given, else the redis response (None if already registered)
+        """
         self.describer_key = describer_key or f'{self.__class__.class_describer}:{self.get_db_key()}'
+        if not self.needs_registering():
+            return pipeline
+        return (database if pipeline is None else pipeline).sadd(self.get_key_registry_db_key(), self.get_db_key())
+
+    @classmethod
+    def get_key_registry_db_key(cls, *args, **kwargs) -> str:
+        """
+        set of all db keys saved by this class
+        eg. "key_registry:SomeTimeseriesStorage"
+        """
+        return f'{cls.key_registry_prefix}:{cls.__name__}'
+
+    @classmethod
+    def get_registered_keys(cls, match: str = None, *args, **kwargs):
+        """
+        iterate the db keys saved by this class, with SSCAN so redis is never blocked
+
+        :param match: glob pattern on the keys (optional)
+        :return: generator of keys (bytes)
+        """
+        return database.sscan_iter(cls.get_key_registry_db_key(), match=match, count=KEY_SCAN_COUNT)
+
+    @classmethod
+    def unregister_keys(cls, keys: list, pipeline=None):
+        """
+        remove deleted keys from the key registry
+        :return: the pipeline if one was given, else the redis response
+        """
+        if not keys:
+            return pipeline
+        forget_registered_keys(keys)
+        return (database if pipeline is None else pipeline).srem(cls.get_key_registry_db_key(), *keys)
 
     @classmethod
     def score_from_timestamp(cls, timestamp) -> float:
@@ -67,33 +141,41 @@ class TimeseriesStorage(KeyValueStorage):
         return int(float(periods) * 300)
 
     @classmethod
-    def query(cls, key: str = "", key_suffix: str = "", key_prefix: str = "",
-              timestamp: int = None,
-              timestamp_tolerance: int = 299,
-              periods_range: float = 0.01,
-              *args, **kwargs) -> dict:
+    def compile_query_kwargs(cls, kwargs: dict) -> dict:
         """
-        :param key: the exact redis sortedset key (optional)
-        :param key_suffix: suffix on the key  (optional)
-        :param key_prefix: prefix on the key (optional)
-        :param timestamp: timestamp for most recent value returned  (optional, default returns latest)
-        :param periods_range: number of periods desired in results (optional, default 0, so only return 1 value)
-        :param timestamp_tolerance: tolerance in seconds on results within timestamp and period range (optional, defualt=299)
-        :return: dict(values=[], ...)
+        subclasses override this to translate their own query params (eg. ticker, index)
+        into key, key_prefix and key_suffix. Called exactly once for query() and query_array()
+
+        :param kwargs: the kwargs received by query() or query_array()
+        :return: kwargs ready for compile_db_key()
         """
+        return kwargs
 
-        sorted_set_key = cls.compile_db_key(key=key, key_prefix=key_prefix, key_suffix=key_suffix)
+    @classmethod
+    def get_query_members(cls, key: str = "", key_suffix: str = "", key_prefix: str = "",
+                          timestamp: int = None,
+                          timestamp_tolerance: int = 299,
+                          periods_range: float = 0.01,
+                          *args, **kwargs) -> tuple:
+        """
+        run the redis query shared by query() and query_array()
+
+        :return: (raw members list, timestamp, min_score, max_score)
+        """
+        query_kwargs = cls.compile_query_kwargs(dict(kwargs, key=key, key_prefix=key_prefix, key_suffix=key_suffix))
+        sorted_set_key = cls.compile_db_key(
+            key=query_kwargs["key"], key_prefix=query_kwargs["key_prefix"], key_suffix=query_kwargs["key_suffix"]
+        )
         # logger.debug(f'query for sorted set key {sorted_set_key}')
         # example key f'{key_prefix}:{cls.__name__}:{key_suffix}'
 
-        # do a quick check to make sure this is a class of things we know is in existence
-        describer_key = f'{cls.class_describer}:{sorted_set_key}'
         # if no timestamp, assume query to find the most recent, the last one
 
         if not timestamp:
             query_response = database.zrange(sorted_set_key, -1, -1)
             try:
-                [value, timestamp] = query_response[0].decode("utf-8").split(":")
+                [value, score] = decode_member(query_response[0])
+                timestamp = cls.timestamp_from_score(score)
             except:
                 value, timestamp = "unknown", JAN_1_2017_TIMESTAMP
 
@@ -108,7 +190,16 @@ class TimeseriesStorage(KeyValueStorage):
 
             min_score, max_score = (target_score - score_tolerance - periods_range), (target_score + score_tolerance)
 
-            query_response = database.zrangebyscore(sorted_set_key, min_score, max_score)
+            query_min_score, query_max_score = min_score, max_score
+            if np.issubdtype(cls.score_dtype, np.integer):
+                # members are on whole 5min scores, the same periods are the same window, whatever the tolerances
+                query_min_score, query_max_score = math.ceil(min_score), math.floor(max_score)
+
+            query_response = query_cache.get(sorted_set_key, query_min_score, query_max_score)
+            if query_response is None:
+                query_response = database.zrangebyscore(sorted_set_key, query_min_score, query_max_score)
+                query_cache.put(sorted_set_key, query_min_score, query_max_score, query_response,
+                                cls.member_encoding)
 
         # OLD example query_response = [b'0.06288:1532163247']
         # which came from f'{self.value}:{str(self.unix_timestamp)}'
@@ -116,6 +207,32 @@ class TimeseriesStorage(KeyValueStorage):
         # NEW example query_response = [b'0.06288:1532163247']
         # which came from f'{self.value}:{str(score)}' where score = (self.timestamp-JAN_1_2017_TIMESTAMP)/300
 
+        # PACKED example query_response = [b'\x01...'] (17 bytes each), see storages/utils/member_codec.py
+
+        return query_response, timestamp, min_score, max_score
+
+    @classmethod
+    def query(cls, key: str = "", key_suffix: str = "", key_prefix: str = "",
+              timestamp: int = None,
+              timestamp_tolerance: int = 299,
+              periods_range: float = 0.01,
+              *args, **kwargs) -> dict:
+        """
+        :param key: the exact redis sortedset key (optional)
+        :param key_suffix: suffix on the key  (optional)
+        :param key_prefix: prefix on the key (optional)
+        :param timestamp: timestamp for most recent value returned  (optional, default returns latest)
+        :param periods_range: number of periods desired in results (optional, default 0, so only return 1 value)
+        :param timestamp_tolerance: tolerance in seconds on results within timestamp and period range (optional, defualt=299)
+        :return: dict(values=[], ...)
+        """
+
+        query_response, timestamp, min_score, max_score = cls.get_query_members(
+            key=key, key_suffix=key_suffix, key_prefix=key_prefix,
+            timestamp=timestamp, timestamp_tolerance=timestamp_tolerance, periods_range=periods_range,
+            **kwargs
+        )
+
         return_dict = {
             'values': [],
             'values_count': 0,
@@ -135,8 +252,9 @@ class TimeseriesStorage(KeyValueStorage):
             if len(query_response) < periods_range + 1:
                 return_dict["warning"] = "fewer values than query's periods_range"
 
-            values = [value_score.decode("utf-8").split(":")[0] for value_score in query_response]
-            scores = [value_score.decode("utf-8").split(":")[1] for value_score in query_response]
+            value_score_pairs = [decode_member(value_score) for value_score in query_response]
+            values = [value for value, score in value_score_pairs]
+            scores = [score for value, score in value_score_pairs]
             # todo: double check that [-1] in list is most recent timestamp
 
             return_dict.update({
@@ -155,10 +273,29 @@ class TimeseriesStorage(KeyValueStorage):
             return {'error': "redis query problem: " + str(e),  # wtf happened?
                     'values': []}
 
+    @classmethod
+    def query_array(cls, limit: int = 0, *args, **kwargs) -> tuple:
+        """
+        same params as query(), but decodes the raw redis reply straight into numpy arrays
+        only for storages with numeric values (eg. prices, volumes, single value indicators)
+
+        :param limit: keep only the most recent values (optional, default 0 keeps all)
+        :return: (scores, values) as numpy arrays, scores use cls.score_dtype, values are float64
+        """
+        if limit and (not isinstance(limit, int) or limit < 1):
+            raise TimeseriesException(f"bad limit: {limit}")
+
+        query_response, timestamp, min_score, max_score = cls.get_query_members(*args, **kwargs)
+        if limit:
+            query_response = query_response[-limit:]
+
+        scores, values = decode_members_to_arrays(query_response)
+        return scores.astype(cls.score_dtype), values
+
     @staticmethod
     def get_values_array_from_query(query_results: dict, limit: int = 0):
 
-        value_array = [float(v) for v in query_results['values']]
+        value_array = np.array(query_results['values'], dtype=np.float64)
 
         if limit:
             if not isinstance(limit, int) or limit < 1:
@@ -167,12 +304,13 @@ class TimeseriesStorage(KeyValueStorage):
             elif len(value_array) > limit:
                 value_array = value_array[-limit:]
 
-        return np.array(value_array)
+        return value_array
 
-    def get_z_add_data(self):
+    def get_z_add_data(self, encoding: int = None):
+        encoding = self.member_encoding if encoding is None else encoding
         z_add_key = f'{self.get_db_key()}'  # set key name
         z_add_score = f'{self.score_from_timestamp(self.unix_timestamp)}'  # timestamp as score (int or float)
-        z_add_name = f'{self.value}:{z_add_score}'  # item unique value
+        z_add_name = encode_member(self.value, z_add_score, encoding)  # item unique value
         z_add_data = {"key": z_add_key, "name": z_add_name, "score": z_add_score}  # key, score, name
         return z_add_data
 
@@ -183,27 +321,37 @@ class TimeseriesStorage(KeyValueStorage):
             # validate some rules here?
             pass
 
-        self.save_own_existance()
-
         z_add_data = self.get_z_add_data()
         # # logger.debug(f'savingdata with args {z_add_data}')
 
         if pipeline is not None:
+            # a read before the pipeline executes would cache the old reply again
+            query_cache.invalidate_on_execute(pipeline, z_add_data["key"], z_add_data["score"])
             pipeline = pipeline.zadd(*z_add_data.values())
+            pipeline = self.save_own_existance(pipeline=pipeline)
             # logger.debug("added command to redis pipeline")
             if publish: pipeline = self.publish(pipeline)
             return pipeline
         else:
-            response = database.zadd(*z_add_data.values())
+            # still one round trip for the zadd and the key registry
+            pipeline = database.pipeline(transaction=False)
+            pipeline.zadd(*z_add_data.values())
+            self.save_own_existance(pipeline=pipeline)
+            response = pipeline.execute()[0]
+            query_cache.invalidate(z_add_data["key"], z_add_data["score"])
             # logger.debug("no pipeline, executing zadd command immediately.")
             if publish: self.publish()
             return response
 
     def publish(self, pipeline=None):
+        # subscribers always receive the text encoding, packed members are not json serializable
+        message = json.dumps(self.get_z_add_data(encoding=TEXT_ENCODING))
+        if MESSAGE_TRANSPORT == "streams":
+            return streams.add_message(self.__class__.__name__, message, pipeline=pipeline)
         if pipeline:
-            return pipeline.publish(self.__class__.__name__, json.dumps(self.get_z_add_data()))
+            return pipeline.publish(self.__class__.__name__, message)
         else:
-            return database.publish(self.__class__.__name__, json.dumps(self.get_z_add_data()))
+            return database.publish(self.__class__.__name__, message)
 
     def get_value(self, *args, **kwargs):
         TimeseriesException("function not yet implemented! ¯\_(ツ)_/¯ ")
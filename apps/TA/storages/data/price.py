@@ -1,10 +1,17 @@
 import logging
+import numpy as np
 
-from apps.TA import TAException
+from apps.TA import TAException, PV_MEMBER_ENCODING, PV_RESAMPLING_MODE, PRICE_INDEXES, VOLUME_INDEXES
 from apps.TA.storages.abstract.ticker import TickerStorage
 from apps.TA.storages.abstract.ticker_subscriber import TickerSubscriber, score_is_near_5min
-from apps.TA.storages.data.pv_history import default_price_indexes, derived_price_indexes, PriceVolumeHistoryStorage
+from apps.TA.storages.data.pv_history import default_price_indexes, derived_price_indexes, ohlcv_indexes, \
+    PriceVolumeHistoryStorage
+from apps.TA.storages.data.rollup import COMPACTED_HORIZONS, get_compaction_score, queue_compacted_reads, \
+    stitch_compacted_bars, fill_from_compacted_bars
+from apps.TA.storages.utils.key_layout import get_ticker_key_prefix, split_ticker_key
+from apps.TA.storages.utils.member_codec import decode_members_to_arrays
 from apps.TA.storages.utils.memory_cleaner import clear_pv_history_values
+from settings.redis_db import database
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +21,9 @@ class PriceException(TAException):
 
 
 class PriceStorage(TickerStorage):
+    member_encoding = PV_MEMBER_ENCODING
+    score_dtype = np.int32
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.index = kwargs.get('index', "close_price")
@@ -41,7 +51,7 @@ class PriceStorage(TickerStorage):
         return super().save(*args, **kwargs)
 
     @classmethod
-    def query(cls, *args, **kwargs):
+    def compile_query_kwargs(cls, kwargs: dict) -> dict:
 
         if kwargs.get("periods_key", None):
             raise PriceException("periods_key is not usable in PriceStorage query")
@@ -50,11 +60,98 @@ class PriceStorage(TickerStorage):
         index = kwargs.get("index", "close_price")
         kwargs["key_suffix"] = f'{index}' + (f':{key_suffix}' if key_suffix else "")
 
+        return super().compile_query_kwargs(kwargs)
+
+    @classmethod
+    def query(cls, *args, **kwargs):
+
         results_dict = super().query(*args, **kwargs)
 
-        results_dict['index'] = index
+        results_dict['index'] = kwargs.get("index", "close_price")
         return results_dict
 
+    @classmethod
+    def get_index_db_key(cls, ticker: str, exchange: str, index: str) -> str:
+        """
+        :return: sorted set key for a price or volume index, eg. "ETH_BTC:binance:VolumeStorage:close_volume"
+        """
+        if index in PRICE_INDEXES:
+            storage_class_name = cls.__name__
+        elif index in VOLUME_INDEXES:
+            storage_class_name = "VolumeStorage"
+        else:
+            raise PriceException(f"unknown index: {index}")
+        return cls.compile_db_key(key=storage_class_name, key_prefix=get_ticker_key_prefix(ticker, exchange),
+                                  key_suffix=index)
+
+    @classmethod
+    def query_ohlcv(cls, ticker: str, exchange: str, timestamp: int, periods: int,
+                    indexes: list = ohlcv_indexes) -> tuple:
+        """
+        fetch several price and volume indexes for one ticker in a single pipelined round trip
+
+        :param ticker: eg. "ETH_BTC"
+        :param exchange: eg. "binance"
+        :param timestamp: timestamp of the most recent 5min period
+        :param periods: number of 5min periods ending at (and including) timestamp
+        :param indexes: price or volume indexes, eg. ["high_price", "low_price", "close_price"]
+        :return: (scores, matrix) where scores is an int32 array of length periods
+                 and matrix[i] holds the values of indexes[i] aligned on scores, NaN where missing
+        """
+        scores, matrices = cls.query_ohlcv_many([(ticker, exchange)], timestamp, periods, indexes)
+        return scores, matrices[0]
+
+    @classmethod
+    def query_ohlcv_many(cls, ticker_exchanges: list, timestamp: int, periods: int,
+                         indexes: list = ohlcv_indexes) -> tuple:
+        """
+        same as query_ohlcv() for many tickers, still a single pipelined round trip
+        eg. to load the window of a whole exchange at once
+
+        :param ticker_exchanges: list of (ticker, exchange) tuples, eg. [("ETH_BTC", "binance"), ...]
+        :return: (scores, matrices) where matrices has shape (len(ticker_exchanges), len(indexes), periods)
+        """
+        periods = int(periods)
+        if periods < 1:
+            raise PriceException(f"bad periods: {periods}")
+
+        last_score = int(round(cls.score_from_timestamp(timestamp)))
+        scores = np.arange(last_score - periods + 1, last_score + 1, dtype=np.int32)
+
+        pipeline = database.pipeline(transaction=False)
+        for ticker, exchange in ticker_exchanges:
+            for index in indexes:
+                pipeline.zrangebyscore(cls.get_index_db_key(ticker, exchange, index), int(scores[0]), int(scores[-1]))
+        query_responses = pipeline.execute()
+
+        matrices = np.full((len(ticker_exchanges), len(indexes), periods), np.nan, dtype=np.float64)
+        rows = matrices.reshape(-1, periods)  # a view, one row per (ticker, exchange, index)
+
+        compaction_score = get_compaction_score()
+        compacted_rows = []  # (row, ticker, exchange, index, before_score) of rows starting in the compacted past
+        row_keys = [(ticker, exchange, index) for ticker, exchange in ticker_exchanges for index in indexes]
+        for row, (ticker, exchange, index), query_response in zip(rows, row_keys, query_responses):
+            index_scores, index_values = decode_members_to_arrays(query_response)
+            positions = np.rint(index_scores).astype(np.int64) - scores[0]
+            row[positions] = index_values  # scores are within range, zrangebyscore filtered them
+            if index in ohlcv_indexes and scores[0] <= compaction_score and (not len(positions) or positions[0] > 0):
+                before_score = min(int(scores[positions[0]]) if len(positions) else int(scores[-1]) + 1,
+                                   compaction_score + 1)
+                compacted_rows.append((row, ticker, exchange, index, before_score))
+
+        if compacted_rows:
+            # periods older than the 5min retention hold the value of their 1hr or 24hr bar
+            pipeline = database.pipeline(transaction=False)
+            for row, ticker, exchange, index, before_score in compacted_rows:
+                queue_compacted_reads(pipeline, ticker, exchange, index, int(scores[0]), before_score)
+            query_responses = pipeline.execute()
+            for i, (row, ticker, exchange, index, before_score) in enumerate(compacted_rows):
+                tiers_responses = query_responses[i * len(COMPACTED_HORIZONS):(i + 1) * len(COMPACTED_HORIZONS)]
+                bar_members, bar_scores, bar_horizons = stitch_compacted_bars(tiers_responses)
+                fill_from_compacted_bars(row, scores, bar_scores, bar_horizons, decode_members_to_arrays(bar_members)[1])
+
+        return scores, matrices
+
 
 class PriceSubscriber(TickerSubscriber):
     classes_subscribing_to = [
@@ -73,7 +170,7 @@ class PriceSubscriber(TickerSubscriber):
 
         # eg. sorted_set_key = data["key"]
 
-        [ticker, exchange, object_class, index] = data["key"].split(":")
+        [ticker, exchange, object_class, index] = split_ticker_key(data["key"])
         if not object_class == channel == PriceVolumeHistoryStorage.__name__:
             logger.warning(f'Unexpected that these are not the same:'
                            f'object_class: {object_class}, '
@@ -87,7 +184,20 @@ class PriceSubscriber(TickerSubscriber):
             logger.warning(f'Unexpected that score in name {name_score}'
                            f'is different than score {score}')
 
-        if score_is_near_5min(score):
-            if generate_pv_storages(ticker, exchange, index, score):
-                if index == "close_price":
-                    clear_pv_history_values(ticker, exchange, score)
+        if not score_is_near_5min(score):
+            return
+
+        if PV_RESAMPLING_MODE in ["pipeline", "lua"]:
+            # the whole 5min block is resampled once, when its close_price arrives
+            # (all indexes of a block are saved in the same transaction, see resources/historical_data.py)
+            if index == "close_price":
+                from apps.TA.storages.utils.pv_resampling import resample_pv_block, resample_pv_block_lua
+                if PV_RESAMPLING_MODE == "lua":
+                    resample_pv_block_lua(ticker, exchange, score)
+                else:
+                    resample_pv_block(ticker, exchange, score)
+            return
+
+        if generate_pv_storages(ticker, exchange, index, score):
+            if index == "close_price":
+                clear_pv_history_values(ticker, exchange, score)
@@ -1,6 +1,6 @@
 import logging
 
-from apps.TA import TAException
+from apps.TA import TAException, PV_MEMBER_ENCODING
 from apps.TA.storages.abstract.indicator import TickerStorage
 
 logger = logging.getLogger(__name__)
@@ -13,12 +13,14 @@ derived_volume_indexes = ["open_volume", "high_volume", "low_volume",]
 default_indexes = default_price_indexes + default_volume_indexes
 derived_indexes = derived_price_indexes + derived_volume_indexes
 all_indexes = default_indexes + derived_indexes
+ohlcv_indexes = ["open_price", "high_price", "low_price", "close_price", "close_volume", ]
 
 class PriceVolumeHistoryException(TAException):
     pass
 
 
 class PriceVolumeHistoryStorage(TickerStorage):
+    member_encoding = PV_MEMBER_ENCODING
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -27,7 +29,7 @@ class PriceVolumeHistoryStorage(TickerStorage):
 
 
     @classmethod
-    def query(cls, *args, **kwargs):
+    def compile_query_kwargs(cls, kwargs: dict) -> dict:
 
         # "ETH_BTC:poloniex:PriceVolumeHistoryStorage:close_price"
         # f'{ticker}:{exchange}:{cls.__name__}:{index}'
@@ -44,10 +46,15 @@ class PriceVolumeHistoryStorage(TickerStorage):
 
         kwargs["key_suffix"] = f':{index}'
 
+        return super().compile_query_kwargs(kwargs)
+
+    @classmethod
+    def query(cls, *args, **kwargs):
+
         results_dict = super().query(*args, **kwargs)
 
         if results_dict:
-            results_dict['index'] = index
+            results_dict['index'] = kwargs.get("index", "close_price")
         return results_dict
 
 
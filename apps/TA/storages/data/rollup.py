@@ -0,0 +1,326 @@
+import logging
+import math
+import time
+import numpy as np
+
+from apps.TA import TAException, PV_MEMBER_ENCODING, HORIZONS, PERIODS_1HR, PERIODS_24HR, PRICE_5MIN_RETENTION_DAYS
+from apps.TA.storages.abstract.ticker import TickerStorage
+from apps.TA.storages.data.pv_history import ohlcv_indexes
+from apps.TA.storages.utils.key_layout import get_ticker_key_prefix
+from apps.TA.storages.utils.member_codec import decode_members_to_arrays, format_value
+from settings.redis_db import database
+
+logger = logging.getLogger(__name__)
+
+
+class RollupException(TAException):
+    pass
+
+
+def get_bar_score(score: float, horizon: int) -> int:
+    """
+    a bar is scored by its last 5min period, so a 1hr bar holds the 12 periods (bar_score-12, bar_score]
+    bars end on the hour (and on 4hr and midnight UTC), since score 0 is midnight Jan 1st 2017
+
+    :param score: score of a 5min period
+    :param horizon: number of 5min periods in a bar, one of HORIZONS
+    :return: score of the bar the 5min period belongs to
+    """
+    return int(math.ceil(round(score) / horizon) * horizon)
+
+
+def merge_bar_value(index: str, bar_value, value: float, is_first_period: bool) -> float:
+    """
+    :param index: one of ohlcv_indexes
+    :param bar_value: current value of the bar in progress, None if the bar is new
+    :param value: value of the new 5min period
+    :param is_first_period: the new 5min period is the first one of the bar
+    :return: the bar's new value
+    """
+    if bar_value is None:
+        return value
+    if index == "open_price":
+        return value if is_first_period else bar_value
+    if index == "high_price":
+        return max(bar_value, value)
+    if index == "low_price":
+        return min(bar_value, value)
+    # close_price and close_volume, the volume is already a rolling total at the exchange
+    return value
+
+
+class RollupStorage(TickerStorage):
+    """
+    OHLCV bars for the 1hr, 4hr and 24hr horizons rolled up from 5min PriceStorage and VolumeStorage periods
+    the bar in progress is saved again on each 5min close, see update_rollups()
+    eg. sorted_set_key = "ETH_BTC:binance:RollupStorage:288:close_price"
+    """
+    member_encoding = PV_MEMBER_ENCODING
+    score_dtype = np.int32
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.horizon = int(kwargs.get('horizon', PERIODS_1HR))
+        self.index = kwargs.get('index', "close_price")
+        self.value = kwargs.get('value')
+
+        if self.horizon not in HORIZONS:
+            raise RollupException(f"horizon must be one of {HORIZONS}")
+
+        self.db_key_suffix = f':{self.horizon}:{self.index}'
+
+    @classmethod
+    def get_bar_db_key(cls, ticker: str, exchange: str, horizon: int, index: str) -> str:
+        return cls.compile_db_key(key=cls.__name__, key_prefix=get_ticker_key_prefix(ticker, exchange),
+                                  key_suffix=f'{horizon}:{index}')
+
+    def save(self, pipeline=None, *args, **kwargs):
+        """
+        replaces any previous value of the same bar
+        :return: the pipeline if one was given, else the redis response
+        """
+        if not all([self.ticker, self.exchange, self.horizon,
+                    self.index, self.value, self.unix_timestamp]):
+            logger.error("incomplete information, cannot save \n" + str(self.__dict__))
+            raise RollupException("save error, missing data")
+
+        if self.index not in ohlcv_indexes:
+            raise RollupException("unknown index")
+
+        score = self.score_from_timestamp(self.unix_timestamp)
+        if score % self.horizon != 0:
+            raise RollupException("rollup timestamp should be the end of a bar")
+
+        self.db_key_suffix = f':{self.horizon}:{self.index}'
+
+        if pipeline is not None:
+            pipeline.zremrangebyscore(self.get_db_key(), score, score)
+            return super().save(pipeline=pipeline, *args, **kwargs)
+
+        pipeline = database.pipeline(transaction=True)
+        pipeline.zremrangebyscore(self.get_db_key(), score, score)
+        pipeline = super().save(pipeline=pipeline, *args, **kwargs)
+        return pipeline.execute()[1]  # the zadd response
+
+    @classmethod
+    def query_bars(cls, ticker: str, exchange: str, horizon: int, timestamp: int, bars: int,
+                   indexes: list = ohlcv_indexes) -> tuple:
+        """
+        fetch the bars of several indexes in a single pipelined round trip, like PriceStorage.query_ohlcv()
+
+        :param horizon: one of HORIZONS
+        :param timestamp: the last bar is the one holding this timestamp's 5min period, possibly still in progress
+        :param bars: number of bars
+        :return: (scores, matrix) where scores is an int32 array of bar scores
+                 and matrix[i] holds the values of indexes[i] aligned on scores, NaN where missing
+        """
+        if horizon not in HORIZONS:
+            raise RollupException(f"horizon must be one of {HORIZONS}")
+        bars = int(bars)
+        if bars < 1:
+            raise RollupException(f"bad number of bars: {bars}")
+
+        last_bar_score = get_bar_score(cls.score_from_timestamp(timestamp), horizon)
+        scores = np.arange(last_bar_score - (bars - 1) * horizon, last_bar_score + 1, horizon, dtype=np.int32)
+
+        pipeline = database.pipeline(transaction=False)
+        for index in indexes:
+            pipeline.zrangebyscore(cls.get_bar_db_key(ticker, exchange, horizon, index), int(scores[0]), int(scores[-1]))
+        query_responses = pipeline.execute()
+
+        matrix = np.full((len(indexes), bars), np.nan, dtype=np.float64)
+        for row, query_response in zip(matrix, query_responses):
+            bar_scores, bar_values = decode_members_to_arrays(query_response)
+            row[(np.rint(bar_scores).astype(np.int64) - scores[0]) // horizon] = bar_values
+
+        return scores, matrix
+
+
+def queue_rollup_reads(pipeline, ticker: str, exchange: str, index: str, score: float, horizons: list = HORIZONS):
+    """
+    add the reads of the bars in progress holding a 5min period to a pipeline, one response per horizon
+    """
+    score = int(round(score))
+    for horizon in horizons:
+        bar_score = get_bar_score(score, horizon)
+        pipeline.zrangebyscore(RollupStorage.get_bar_db_key(ticker, exchange, horizon, index), bar_score, bar_score)
+    return pipeline
+
+
+def queue_rollup_writes(pipeline, ticker: str, exchange: str, index: str, score: float, value,
+                        query_responses: list, horizons: list = HORIZONS):
+    """
+    add the writes of the merged bars to a pipeline
+
+    :param query_responses: the responses to the reads added by queue_rollup_reads()
+    """
+    score = int(round(score))
+    for horizon, query_response in zip(horizons, query_responses):
+        bar_score = get_bar_score(score, horizon)
+        _, bar_values = decode_members_to_arrays(query_response)
+        bar_value = merge_bar_value(
+            index,
+            bar_values[-1] if len(bar_values) else None,
+            float(value),
+            is_first_period=bool(score == bar_score - horizon + 1)
+        )
+        RollupStorage(
+            ticker=ticker, exchange=exchange, horizon=horizon, index=index, value=format_value(bar_value),
+            timestamp=RollupStorage.timestamp_from_score(bar_score)
+        ).save(pipeline=pipeline)
+    return pipeline
+
+
+def update_rollups(ticker: str, exchange: str, index: str, score: float, value, horizons: list = HORIZONS):
+    """
+    merge a new 5min value into the bar in progress of each horizon
+    one pipelined read and one MULTI/EXEC write for all horizons
+
+    :param index: one of ohlcv_indexes, other indexes are ignored
+    :param score: score of the 5min period
+    :param value: value of the 5min period
+    """
+    if index not in ohlcv_indexes:
+        return
+
+    pipeline = database.pipeline(transaction=False)
+    query_responses = queue_rollup_reads(pipeline, ticker, exchange, index, score, horizons).execute()
+
+    pipeline = database.pipeline(transaction=True)
+    queue_rollup_writes(pipeline, ticker, exchange, index, score, value, query_responses, horizons)
+    pipeline.execute()
+
+
+def _first_valid(values: np.ndarray) -> np.ndarray:
+    # first non NaN value of each row, NaN if none
+    valid = ~np.isnan(values)
+    first = values[np.arange(len(values)), valid.argmax(axis=1)]
+    first[~valid.any(axis=1)] = np.nan
+    return first
+
+
+def backfill_rollups(ticker: str, exchange: str, timestamp: int, periods: int, horizons: list = HORIZONS) -> int:
+    """
+    rebuild all bars holding the 5min periods of the given range from PriceStorage and VolumeStorage
+    for bars older than the ones kept up to date by update_rollups(), eg. after a restore
+
+    :param timestamp: timestamp of the most recent 5min period to roll up
+    :param periods: number of 5min periods to roll up, ending at timestamp
+    :return: number of bars saved
+    """
+    from apps.TA.storages.data.price import PriceStorage  # import here, bc has circular dependancy
+
+    last_score = int(round(RollupStorage.score_from_timestamp(timestamp)))
+    bars_saved = 0
+
+    for horizon in horizons:
+        last_bar_score = get_bar_score(last_score, horizon)
+        first_bar_score = get_bar_score(last_score - int(periods) + 1, horizon)
+        bars = (last_bar_score - first_bar_score) // horizon + 1
+
+        # whole bars, the periods after last_score are NaN and ignored
+        _, matrix = PriceStorage.query_ohlcv(
+            ticker=ticker, exchange=exchange,
+            timestamp=RollupStorage.timestamp_from_score(last_bar_score),
+            periods=bars * horizon, indexes=ohlcv_indexes
+        )
+        matrix[:, bars * horizon - (last_bar_score - last_score):] = np.nan
+        bar_matrix = matrix.reshape(len(ohlcv_indexes), bars, horizon)
+
+        bar_values = {
+            "open_price": _first_valid(bar_matrix[ohlcv_indexes.index("open_price")]),
+            "high_price": np.fmax.reduce(bar_matrix[ohlcv_indexes.index("high_price")], axis=1),
+            "low_price": np.fmin.reduce(bar_matrix[ohlcv_indexes.index("low_price")], axis=1),
+            "close_price": _first_valid(bar_matrix[ohlcv_indexes.index("close_price")][:, ::-1]),
+            "close_volume": _first_valid(bar_matrix[ohlcv_indexes.index("close_volume")][:, ::-1]),
+        }
+
+        pipeline = database.pipeline(transaction=True)
+        for index, values in bar_values.items():
+            rollup = RollupStorage(ticker=ticker, exchange=exchange, horizon=horizon, index=index,
+                                   timestamp=RollupStorage.timestamp_from_score(first_bar_score))
+            for bar, value in enumerate(values):
+                if np.isnan(value):
+                    continue
+                rollup.unix_timestamp = RollupStorage.timestamp_from_score(first_bar_score + bar * horizon)
+                rollup.value = format_value(value)
+                rollup.save(pipeline=pipeline)
+                bars_saved += 1
+        pipeline.execute()
+
+    return bars_saved
+
+
+# horizons of the compacted tiers, finest first, see compact_price_history()
+COMPACTED_HORIZONS = [PERIODS_1HR, PERIODS_24HR]
+
+
+def get_compaction_score(timestamp: int = None, retention_days: int = None) -> int:
+    """
+    5min periods up to and including this score are compacted, it is the end of a 24hr bar
+    so the tiers meet on whole days
+
+    :param timestamp: now (optional, default time.time())
+    :param retention_days: days kept (optional, default PRICE_5MIN_RETENTION_DAYS)
+    :return: the score, 0 when PRICE_5MIN_RETENTION_DAYS is 0 and nothing is compacted
+    """
+    if retention_days is None:
+        if not PRICE_5MIN_RETENTION_DAYS:
+            return 0
+        retention_days = PRICE_5MIN_RETENTION_DAYS
+    score = RollupStorage.score_from_timestamp(time.time() if timestamp is None else timestamp)
+    return int(score - retention_days * PERIODS_24HR) // PERIODS_24HR * PERIODS_24HR
+
+
+def queue_compacted_reads(pipeline, ticker: str, exchange: str, index: str, min_score: float, before_score: float):
+    """
+    add the reads of the compacted bars ending in [min_score, before_score) to a pipeline, one response per tier
+    """
+    for horizon in COMPACTED_HORIZONS:
+        pipeline.zrangebyscore(RollupStorage.get_bar_db_key(ticker, exchange, horizon, index),
+                               min_score, f'({before_score}')
+    return pipeline
+
+
+def stitch_compacted_bars(query_responses: list) -> tuple:
+    """
+    join the tiers read by queue_compacted_reads(), each tier only where no finer tier has bars
+
+    :return: (members, bar_scores, bar_horizons) in score order, members as returned by redis
+    """
+    members, bar_scores, bar_horizons = [], np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    for horizon, query_response in zip(COMPACTED_HORIZONS, query_responses):
+        scores = np.rint(decode_members_to_arrays(query_response)[0]).astype(np.int64)
+        if len(bar_scores):
+            # only bars ending before the first period of the finer tier
+            keep = scores <= bar_scores[0] - bar_horizons[0]
+            query_response, scores = [member for member, kept in zip(query_response, keep) if kept], scores[keep]
+        members = list(query_response) + members
+        bar_scores = np.concatenate([scores, bar_scores])
+        bar_horizons = np.concatenate([np.full(len(scores), horizon, dtype=np.int64), bar_horizons])
+
+    return members, bar_scores, bar_horizons
+
+
+def fill_from_compacted_bars(row: np.ndarray, scores: np.ndarray, bar_scores: np.ndarray,
+                             bar_horizons: np.ndarray, bar_values: np.ndarray) -> np.ndarray:
+    """
+    hold the value of each compacted bar over the 5min periods it covers, on positions of row that are NaN
+
+    :param row: values aligned on scores, changed in place
+    :param scores: int scores of the 5min periods
+    :return: row
+    """
+    if not len(bar_scores):
+        return row
+    # the bar of each period in each tier, then the bar actually found for it
+    for horizon in np.unique(bar_horizons):
+        tier = bar_horizons == horizon
+        tier_scores, tier_values = bar_scores[tier], bar_values[tier]
+        period_bar_scores = -(-scores.astype(np.int64) // horizon) * horizon
+        positions = np.searchsorted(tier_scores, period_bar_scores).clip(0, len(tier_scores) - 1)
+        found = (tier_scores[positions] == period_bar_scores) & np.isnan(row)
+        row[found] = tier_values[positions[found]]
+    return row
+
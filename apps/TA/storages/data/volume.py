@@ -1,10 +1,13 @@
 import logging
+import numpy as np
 
-from apps.TA import TAException
+from apps.TA import TAException, PV_MEMBER_ENCODING
 from apps.TA.storages.abstract.ticker import TickerStorage
 from apps.TA.storages.abstract.ticker_subscriber import TickerSubscriber, timestamp_is_near_5min, \
     get_nearest_5min_timestamp
 from apps.TA.storages.data.pv_history import PriceVolumeHistoryStorage, default_volume_indexes, derived_volume_indexes
+from apps.TA.storages.utils.key_layout import get_ticker_db_key
+from apps.TA.storages.utils.member_codec import decode_member
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +17,9 @@ class VolumeException(TAException):
 
 
 class VolumeStorage(TickerStorage):
+    member_encoding = PV_MEMBER_ENCODING
+    score_dtype = np.int32
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.index = kwargs.get('index', "close_volume")
@@ -62,10 +68,10 @@ class VolumeSubscriber(TickerSubscriber):
             logger.debug(f'process volume for ticker: {ticker}')
 
             # example key = "XPM_BTC:poloniex:PriceVolumeHistoryStorage:close_price"
-            sorted_set_key = f'{ticker}:{exchange}:PriceVolumeHistoryStorage:{index}'
+            sorted_set_key = get_ticker_db_key(ticker, exchange, "PriceVolumeHistoryStorage", index)
 
             index_values[index] = [
-                float(db_value.decode("utf-8").split(":")[0])
+                float(decode_member(db_value)[0])
                 for db_value
                 in self.database.zrangebyscore(sorted_set_key, timestamp - 300, timestamp + 45) # todo: update to scores
             ]
@@ -0,0 +1,192 @@
+import logging
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from apps.TA.storages.abstract.timeseries_storage import TimeseriesStorage
+from apps.TA.storages.data.pv_history import default_price_indexes, derived_price_indexes, default_volume_indexes
+from apps.TA.storages.data.rollup import backfill_rollups
+from apps.TA.storages.utils.member_codec import format_value
+from apps.TA.storages.utils.pv_resampling import get_pv_storage_class, PV_HISTORY_SCORE_TOLERANCE
+from apps.indicator.models.price_history import PriceHistory
+from settings import BINANCE, BTC, USDT, SOURCE_CHOICES, COUNTER_CURRENCY_CHOICES
+from settings.redis_db import database
+
+logger = logging.getLogger(__name__)
+
+# the restore skips PriceVolumeHistoryStorage and pub/sub
+# minute rows of PriceHistory are read with a server-side cursor, one (ticker, exchange) at a time,
+# resampled to 5min periods with pandas and written to PriceStorage and VolumeStorage in large pipelines
+
+SQL_CHUNK_SIZE = 10000  # PriceHistory rows per fetch from the server-side cursor
+RESTORE_CHUNK_SIZE = 5000  # members per ZADD
+
+PV_HISTORY_SECONDS_TOLERANCE = int(round(PV_HISTORY_SCORE_TOLERANCE * 300))  # 29s, see resample_pv_block()
+
+# PriceHistory fields in the order of the restored indexes
+PRICE_HISTORY_FIELDS = ["timestamp", "open_p", "high", "low", "close", "volume"]
+MINUTE_COLUMNS = ["timestamp", "open_price", "high_price", "low_price", "close_price", "close_volume"]
+
+
+def resample_minutes_to_5min(minutes: pd.DataFrame) -> pd.DataFrame:
+    """
+    resample minute prices and volumes with the rules of resample_pv_values()
+    each minute goes to the first 5min period whose window holds it, a period without a close price is dropped
+
+    :param minutes: DataFrame with MINUTE_COLUMNS, timestamp as unix seconds, missing or non positive values are ignored
+    :return: DataFrame indexed by 5min timestamp, one column per PriceStorage and VolumeStorage index, NaN where missing
+    """
+    values_columns = MINUTE_COLUMNS[1:]
+    minutes = minutes[values_columns].where(minutes[values_columns] > 0).assign(
+        period=-((PV_HISTORY_SECONDS_TOLERANCE - minutes["timestamp"].astype(np.int64)) // 300) * 300,
+    ).sort_values("period", kind="mergesort")  # stable, minutes stay in time order
+
+    grouped = minutes.groupby("period")
+    periods = pd.DataFrame({
+        "open_price": grouped["open_price"].first(),
+        "high_price": grouped["high_price"].max(),
+        "low_price": grouped["low_price"].min(),
+        "close_price": grouped["close_price"].last(),
+        "close_volume": grouped["close_volume"].last(),
+    })
+    periods = periods[periods["close_price"].notnull()]
+
+    # derived prices are over the distinct open, high, low and close values of the period
+    prices = pd.DataFrame({
+        "period": np.tile(minutes["period"].values, len(default_price_indexes)),
+        "price": np.concatenate([minutes[index].values for index in default_price_indexes]),
+    }).dropna().drop_duplicates().sort_values(["period", "price"])
+    prices_grouped = prices.groupby("period")["price"]
+    position = prices_grouped.cumcount().values
+    count = prices["period"].map(prices_grouped.size()).values
+    # the median, or the upper of the two middle values, as in resample_pv_values()
+    is_midpoint = position == count // 2
+    periods["midpoint_price"] = pd.Series(prices["price"].values[is_midpoint], index=prices["period"].values[is_midpoint])
+    periods["mean_price"] = prices_grouped.mean()
+
+    return periods[default_price_indexes + [index for index in derived_price_indexes if index in periods.columns]
+                   + default_volume_indexes]
+
+
+def save_5min_periods(ticker: str, exchange: str, periods: pd.DataFrame) -> int:
+    """
+    write resampled periods with one ZADD per RESTORE_CHUNK_SIZE members, no publishing
+
+    :param periods: as returned by resample_minutes_to_5min()
+    :return: number of values saved
+    """
+    values_count = 0
+    pipeline = database.pipeline(transaction=False)
+
+    for index in periods.columns:
+        index_values = periods[index].dropna()
+        index_values = index_values[index_values != 0]
+        if not len(index_values):
+            continue
+
+        storage = get_pv_storage_class(index)(
+            ticker=ticker, exchange=exchange, timestamp=int(index_values.index[0]), index=index
+        )
+        members = []
+        for timestamp, value in index_values.items():
+            storage.unix_timestamp, storage.value = int(timestamp), format_value(value)
+            z_add_data = storage.get_z_add_data()
+            members.append((z_add_data["name"], z_add_data["score"]))
+
+        storage.db_key_suffix = f':{index}'
+        for chunk_start in range(0, len(members), RESTORE_CHUNK_SIZE):
+            pipeline.zadd(storage.get_db_key(), *chain(*members[chunk_start:chunk_start + RESTORE_CHUNK_SIZE]))
+        storage.save_own_existance(pipeline=pipeline)
+        values_count += len(members)
+
+    pipeline.execute()
+    return values_count
+
+
+def get_ticker_exchanges(start_datetime, end_datetime) -> list:
+    """
+    :return: list of (transaction_currency, counter_currency, source) with PriceHistory in the range
+    """
+    return list(PriceHistory.objects.filter(
+        timestamp__gte=start_datetime,
+        timestamp__lt=end_datetime,
+        source=BINANCE,  # Binance only for now
+        counter_currency__in=[BTC, USDT]
+    ).values_list("transaction_currency", "counter_currency", "source").distinct())
+
+
+def query_price_history_minutes(transaction_currency: str, counter_currency: int, source: int,
+                                start_datetime, end_datetime) -> pd.DataFrame:
+    """
+    one range query on PriceHistory, streamed from a server-side cursor
+
+    :return: DataFrame with MINUTE_COLUMNS in time order, NaN where PriceHistory has no value
+    """
+    rows = PriceHistory.objects.filter(
+        timestamp__gte=start_datetime,
+        timestamp__lt=end_datetime,
+        source=source,
+        transaction_currency=transaction_currency,
+        counter_currency=counter_currency
+    ).order_by("timestamp").values_list(*PRICE_HISTORY_FIELDS).iterator(chunk_size=SQL_CHUNK_SIZE)
+
+    minutes = pd.DataFrame.from_records(
+        ((int(timestamp.timestamp()),) + tuple(values) for timestamp, *values in rows),
+        columns=MINUTE_COLUMNS
+    )
+    minutes[MINUTE_COLUMNS[1:]] = minutes[MINUTE_COLUMNS[1:]].astype(np.float64)  # None to NaN
+    return minutes
+
+
+def restore_ticker(transaction_currency: str, counter_currency: int, source: int,
+                   start_datetime, end_datetime) -> int:
+    """
+    restore PriceStorage, VolumeStorage and RollupStorage of one (ticker, exchange) from PriceHistory
+
+    :return: number of 5min values saved
+    """
+    ticker = f'{transaction_currency}_{dict(COUNTER_CURRENCY_CHOICES)[counter_currency]}'
+    exchange = dict(SOURCE_CHOICES)[source]
+
+    minutes = query_price_history_minutes(transaction_currency, counter_currency, source, start_datetime, end_datetime)
+    if not len(minutes):
+        return 0
+
+    periods = resample_minutes_to_5min(minutes)
+    if not len(periods):
+        return 0
+
+    values_count = save_5min_periods(ticker, exchange, periods)
+
+    first_score = int(round(TimeseriesStorage.score_from_timestamp(periods.index[0])))
+    last_score = int(round(TimeseriesStorage.score_from_timestamp(periods.index[-1])))
+    backfill_rollups(ticker, exchange, int(periods.index[-1]), last_score - first_score + 1)
+
+    logger.debug(f'{values_count} values restored for {ticker}:{exchange} from {len(minutes)} minutes')
+    return values_count
+
+
+def bulk_restore_db_to_redis(start_datetime, end_datetime) -> int:
+    """
+    much faster than restore_db_to_redis(), but subscribers are not notified
+    so indicators are not computed for the restored periods, see TA_backfill_indicators
+
+    :return: number of 5min values saved
+    """
+    if start_datetime > end_datetime:  # please go forward in time :)
+        return 0
+
+    ticker_exchanges = get_ticker_exchanges(start_datetime, end_datetime)
+    logger.info(f"bulk restoring {len(ticker_exchanges)} tickers from {start_datetime} to {end_datetime}")
+
+    values_count = 0
+    for transaction_currency, counter_currency, source in ticker_exchanges:
+        try:
+            values_count += restore_ticker(transaction_currency, counter_currency, source,
+                                           start_datetime, end_datetime)
+        except Exception as e:
+            logger.error(f'bulk restore failed for {transaction_currency} {counter_currency}: {str(e)}')
+
+    logger.info(f"{values_count} values added to Redis")
+    return values_count
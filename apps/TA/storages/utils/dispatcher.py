@@ -0,0 +1,194 @@
+import json
+import logging
+import multiprocessing
+import signal
+import time
+import zlib
+from collections import defaultdict
+
+from apps.TA import MESSAGE_TRANSPORT
+from apps.TA.storages.abstract.ticker_subscriber import SubscriberException
+from apps.TA.storages.utils.key_layout import split_ticker_key
+from apps.TA.storages.utils import streams
+from settings.redis_db import database
+
+logger = logging.getLogger(__name__)
+
+DISPATCH_BLOCK_SECONDS = 1.0  # longest wait for an event before checking for shutdown
+SHARD_QUEUE_SIZE = 10000  # events waiting per worker process, the dispatcher blocks when a worker falls behind
+DRAIN_TIMEOUT_SECONDS = 120  # time given to worker processes to finish their queues on shutdown
+
+
+def get_shard(data: bytes, shards_count: int) -> int:
+    """
+    the same (ticker, exchange) always goes to the same worker process, so its events are handled in order
+
+    :param data: the published message, eg. b'{"key": "ETH_BTC:binance:PriceStorage:close_price", ...}'
+    :return: shard number in range(shards_count)
+    """
+    try:
+        [ticker, exchange] = split_ticker_key(json.loads(data.decode("utf-8"))["key"])[:2]
+    except Exception:
+        return 0  # not in expected format, the subscriber will log it
+    return zlib.crc32(f'{ticker}:{exchange}'.encode("utf-8")) % shards_count
+
+
+def run_shard_worker(shard: int, queue, subscriber_classes: list):
+    """
+    worker process, handles the events of its shard in order until it gets None
+
+    :param queue: of (subscriber_class_names, channel_name, data, ack) tuples
+                  ack is (stream_key, consumer_group, message_id) for streams, else None
+    """
+    # shutdown is driven by the dispatcher, so queued events are never cut off
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    subscribers = {
+        subscriber_class.__name__: subscriber_class(subscribe=False) for subscriber_class in subscriber_classes
+    }
+    handled_ids = defaultdict(list)
+    logger.info(f'TA worker shard {shard} started')
+
+    while True:
+        event = queue.get()
+        if event is None:
+            break
+
+        subscriber_class_names, channel_name, data, ack = event
+        handled = True
+        for class_name in subscriber_class_names:
+            try:
+                subscribers[class_name].process_message(channel_name, data)
+            except SubscriberException:
+                handled = False  # already logged, a stream message stays pending
+            except Exception as e:
+                logger.error(f'shard {shard} {class_name} failed: {str(e)}')
+                handled = False
+
+        if ack and handled:
+            stream_key, consumer_group, message_id = ack
+            handled_ids[(stream_key, consumer_group)].append(message_id)
+
+        if handled_ids and (queue.empty() or sum(map(len, handled_ids.values())) >= streams.STREAM_READ_COUNT):
+            flush_acks(handled_ids)
+
+    flush_acks(handled_ids)
+    logger.info(f'TA worker shard {shard} drained')
+
+
+def flush_acks(handled_ids: dict):
+    if not handled_ids:
+        return
+    pipeline = database.pipeline(transaction=False)
+    for (stream_key, consumer_group), message_ids in handled_ids.items():
+        streams.ack(stream_key, consumer_group, message_ids, pipeline=pipeline)
+    pipeline.execute()
+    handled_ids.clear()
+
+
+class TickerDispatcher(object):
+    """
+    receives the events of all subscriber classes in one process, blocking instead of polling,
+    and hands each one to the worker process of its (ticker, exchange), see get_shard()
+    SIGINT or SIGTERM stops receiving, then the workers drain their queues before exiting
+    """
+
+    def __init__(self, subscriber_classes: list, processes: int):
+        self.subscriber_classes = subscriber_classes
+        self.processes = int(processes)
+        self.queues, self.workers = [], []
+        self.stopping = False
+
+        # channel name: names of the subscriber classes listening to it
+        self.channel_subscribers = defaultdict(list)
+        for subscriber_class in subscriber_classes:
+            for s_class in subscriber_class.classes_subscribing_to:
+                self.channel_subscribers[s_class.__name__].append(subscriber_class.__name__)
+
+    def start_workers(self):
+        from django.db import connections
+        connections.close_all()  # each process opens its own connections after fork
+
+        for shard in range(self.processes):
+            queue = multiprocessing.Queue(maxsize=SHARD_QUEUE_SIZE)
+            worker = multiprocessing.Process(
+                target=run_shard_worker, args=(shard, queue, self.subscriber_classes),
+                name=f'TA_worker_shard_{shard}', daemon=True
+            )
+            worker.start()
+            self.queues.append(queue)
+            self.workers.append(worker)
+
+    def stop(self, signum=None, frame=None):
+        logger.info(f'TA dispatcher stopping on signal {signum}, draining {self.processes} worker processes')
+        self.stopping = True
+
+    def run(self):
+        self.start_workers()
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+        receive = self.receive_streams if MESSAGE_TRANSPORT == "streams" else self.receive_pubsub
+        logger.info(f'TA dispatcher ready with {self.processes} worker processes over {MESSAGE_TRANSPORT}')
+
+        for subscriber_class_names, channel_name, data, ack in receive():
+            shard = get_shard(data, self.processes)
+            self.queues[shard].put((subscriber_class_names, channel_name, data, ack))
+
+        self.drain()
+
+    def receive_pubsub(self):
+        pubsub = database.pubsub()
+        pubsub.subscribe(*self.channel_subscribers)
+
+        while not self.stopping:
+            data_event = pubsub.get_message(ignore_subscribe_messages=True, timeout=DISPATCH_BLOCK_SECONDS)
+            if not data_event or data_event.get('type') != 'message':
+                continue
+            channel_name = data_event['channel'].decode("utf-8")
+            yield tuple(self.channel_subscribers[channel_name]), channel_name, data_event['data'], None
+
+        pubsub.close()
+
+    def receive_streams(self):
+        consumer_name = streams.get_consumer_name()
+        groups = []  # (stream_key, consumer_group, channel_name), one consumer group per subscriber class
+        for channel_name, subscriber_class_names in self.channel_subscribers.items():
+            stream_key = streams.get_stream_key(channel_name)
+            for consumer_group in subscriber_class_names:
+                streams.create_group(stream_key, consumer_group)
+                groups.append((stream_key, consumer_group, channel_name))
+
+        # split the wait, so no consumer group waits on another
+        block_ms = max(1, int(DISPATCH_BLOCK_SECONDS * 1000 / len(groups)))
+        last_claim_time = 0
+
+        while not self.stopping:
+            claim = time.time() - last_claim_time > streams.STREAM_CLAIM_IDLE_MS / 1000
+            if claim:
+                last_claim_time = time.time()
+
+            for stream_key, consumer_group, channel_name in groups:
+                messages = []
+                if claim:
+                    # including this dispatcher's own messages left pending by a failed handler,
+                    # a message still waiting in a shard queue after STREAM_CLAIM_IDLE_MS is handled twice
+                    messages += streams.claim_stale_messages(stream_key, consumer_group, consumer_name)
+                messages += streams.read_group([stream_key], consumer_group, consumer_name, block_ms=block_ms)
+
+                for _, message_id, data in messages:
+                    yield (consumer_group,), channel_name, data or b"", (stream_key, consumer_group, message_id)
+
+    def drain(self):
+        for queue in self.queues:
+            queue.put(None)
+
+        deadline = time.time() + DRAIN_TIMEOUT_SECONDS
+        for worker in self.workers:
+            worker.join(max(0, deadline - time.time()))
+            if worker.is_alive():
+                logger.warning(f'{worker.name} did not drain in {DRAIN_TIMEOUT_SECONDS}s, terminating')
+                worker.terminate()
+
+        logger.info("TA dispatcher stopped")
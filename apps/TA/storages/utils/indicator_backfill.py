@@ -0,0 +1,191 @@
+import logging
+import multiprocessing
+
+import numpy as np
+
+from apps.TA.storages.abstract.indicator_subscriber import IndicatorSubscriber
+from apps.TA.storages.data.price import PriceStorage
+from apps.TA.storages.utils.key_layout import get_ticker_key_prefix, split_ticker_key
+from settings.redis_db import database
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_CHUNK_SIZE = 1000  # indicator values per pipelined write
+TICKERS_BATCH_SIZE = 100  # tickers per query_ohlcv_many() and talib kernel evaluation
+
+
+def get_backfill_storage_classes() -> list:
+    """
+    indicator storage classes computed by the standard IndicatorSubscriber.handle() on 5min periods
+    indicators with custom handlers, rollup horizons or requisite indicators keep their own paths
+    """
+    from apps.TA.indicators import get_indicator_subscriber_classes
+    return [
+        subscriber_class.storage_class for subscriber_class in get_indicator_subscriber_classes()
+        if subscriber_class.handle is IndicatorSubscriber.handle and not subscriber_class.storage_class.rollup_horizons
+        and not subscriber_class.storage_class.requisite_indicators
+    ]
+
+
+def get_last_saved_score(storage_class, ticker: str, exchange: str, periods: int):
+    last_member = database.zrange(storage_class.compile_db_key(
+        key=None, key_prefix=get_ticker_key_prefix(ticker, exchange), key_suffix=str(periods)
+    ), -1, -1, withscores=True)
+    return int(last_member[0][1]) if last_member else None
+
+
+def get_price_score_range(ticker: str, exchange: str) -> tuple:
+    """
+    :return: (first_score, last_score) of the close price history, (None, None) if there is none
+    """
+    db_key = PriceStorage.get_index_db_key(ticker, exchange, "close_price")
+    [first_members, last_members] = database.pipeline(transaction=False).zrange(
+        db_key, 0, 0, withscores=True
+    ).zrange(
+        db_key, -1, -1, withscores=True
+    ).execute()
+    if not first_members or not last_members:
+        return None, None
+    return int(round(first_members[0][1])), int(round(last_members[0][1]))
+
+
+def backfill_ticker(ticker: str, exchange: str, storage_classes: list = None, resume: bool = True) -> int:
+    """
+    compute and save every value of the indicators over the whole price history of one ticker
+    the history is read from redis once, each (indicator, periods) is one vectorized call
+    values are the same as computed live, a window with a missing price period has no value
+    signals are not sent for history
+
+    :param storage_classes: indicator storage classes (optional, default get_backfill_storage_classes())
+    :param resume: only save values after the last one already saved for each (indicator, periods)
+    :return: number of values saved
+    """
+    storage_classes = storage_classes or get_backfill_storage_classes()
+    first_score, last_score = get_price_score_range(ticker, exchange)
+    if first_score is None:
+        return 0
+
+    indexes = sorted(set(index for storage_class in storage_classes for index in storage_class.requisite_pv_indexes))
+    scores, matrix = PriceStorage.query_ohlcv(
+        ticker=ticker, exchange=exchange,
+        timestamp=PriceStorage.timestamp_from_score(last_score),
+        periods=last_score - first_score + 1,
+        indexes=indexes
+    )
+    index_rows = {index: matrix[i] for i, index in enumerate(indexes)}
+
+    values_count = 0
+    for storage_class in storage_classes:
+        valid = ~np.isnan(np.array([index_rows[index] for index in storage_class.requisite_pv_indexes])).any(axis=0)
+        if not valid.any():
+            continue
+        valid_scores = scores[valid]
+        arrays = {index: index_rows[index][valid] for index in storage_class.requisite_pv_indexes}
+        # number of valid periods up to and including each position, to find complete windows
+        valid_cumsum = np.concatenate([[0], np.cumsum(valid)])
+
+        storage = storage_class(ticker=ticker, exchange=exchange, timestamp=PriceStorage.timestamp_from_score(last_score))
+        for periods in sorted(storage_class.get_periods_list()):
+            values = storage.compute_series_with_requisite_indexes(arrays, periods)
+
+            if not storage_class.recursive:
+                # live values are computed on the last `periods` 5min periods only, so a gap in them means no value
+                positions = np.flatnonzero(valid)
+                complete = valid_cumsum[positions + 1] - valid_cumsum[np.maximum(positions + 1 - periods, 0)] == periods
+            else:
+                complete = np.ones(len(values), dtype=bool)
+
+            last_saved_score = get_last_saved_score(storage_class, ticker, exchange, periods) if resume else None
+            to_save = [
+                (int(score), value) for score, value, is_complete in zip(valid_scores, values, complete)
+                if value and is_complete and (last_saved_score is None or score > last_saved_score)
+            ]
+
+            storage.periods = periods
+            for chunk_start in range(0, len(to_save), BACKFILL_CHUNK_SIZE):
+                pipeline = database.pipeline(transaction=False)
+                for score, value in to_save[chunk_start:chunk_start + BACKFILL_CHUNK_SIZE]:
+                    storage.unix_timestamp = storage_class.timestamp_from_score(score)
+                    storage.value = value
+                    storage.save(pipeline=pipeline, send_signals=False)
+                pipeline.execute()
+            values_count += len(to_save)
+
+    logger.debug(f'{values_count} indicator values backfilled for {ticker}:{exchange}')
+    return values_count
+
+
+def _backfill_ticker_args(args: tuple) -> int:
+    ticker, exchange, storage_class_names, resume = args
+    storage_classes = [
+        storage_class for storage_class in get_backfill_storage_classes()
+        if not storage_class_names or storage_class.__name__ in storage_class_names
+    ]
+    try:
+        return backfill_ticker(ticker, exchange, storage_classes, resume)
+    except Exception as e:
+        logger.error(f'indicator backfill failed for {ticker}:{exchange}: {str(e)}')
+        return 0
+
+
+def get_registered_ticker_exchanges() -> list:
+    """
+    :return: list of (ticker, exchange) tuples with a registered close price
+    """
+    ticker_exchanges = []
+    for key in PriceStorage.get_registered_keys(match="*:PriceStorage:close_price"):
+        [ticker, exchange, storage_class, index] = split_ticker_key(key)
+        ticker_exchanges.append((ticker, exchange))
+    return ticker_exchanges
+
+
+def compute_all_tickers(timestamp, storage_class_names: list = None) -> int:
+    """
+    compute and save the values of one timestamp for every ticker with a registered close price
+    indicators of the talib kernel are evaluated on TICKERS_BATCH_SIZE tickers at once,
+    the others are computed one ticker at a time
+
+    :param storage_class_names: only these indicator storage classes, eg. ["SmaStorage"] (optional, default all)
+    :return: number of values saved
+    """
+    storage_classes = [
+        storage_class for storage_class in get_backfill_storage_classes()
+        if not storage_class_names or storage_class.__name__ in storage_class_names
+    ]
+    ticker_exchanges = get_registered_ticker_exchanges()
+
+    values_count = 0
+    for storage_class in storage_classes:
+        try:
+            if storage_class.get_kernel_calls():
+                for batch_start in range(0, len(ticker_exchanges), TICKERS_BATCH_SIZE):
+                    values_count += storage_class.compute_and_save_all_values_for_tickers(
+                        ticker_exchanges[batch_start:batch_start + TICKERS_BATCH_SIZE], timestamp
+                    )
+            else:
+                for ticker, exchange in ticker_exchanges:
+                    values_count += storage_class.compute_and_save_all_values_for_timestamp(ticker, exchange, timestamp)
+        except Exception as e:
+            logger.error(f'{storage_class.__name__} failed for timestamp {timestamp}: {str(e)}')
+
+    logger.debug(f'{values_count} indicator values computed for {len(ticker_exchanges)} tickers')
+    return values_count
+
+
+def backfill_all_tickers(processes: int = None, storage_class_names: list = None, resume: bool = True) -> int:
+    """
+    backfill every ticker with a registered close price, one ticker per task in a pool of processes
+
+    :param processes: number of worker processes (optional, default cpu count)
+    :param storage_class_names: only these indicator storage classes, eg. ["SmaStorage"] (optional, default all)
+    :return: number of values saved
+    """
+    tasks = [
+        (ticker, exchange, storage_class_names, resume) for ticker, exchange in get_registered_ticker_exchanges()
+    ]
+
+    from django.db import connections
+    connections.close_all()  # each process opens its own connections after fork
+
+    with multiprocessing.Pool(processes or multiprocessing.cpu_count()) as pool:
+        return sum(pool.imap_unordered(_backfill_ticker_args, tasks))
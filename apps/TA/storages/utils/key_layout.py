@@ -0,0 +1,53 @@
+from apps.TA import REDIS_KEY_HASH_TAGS
+
+# every key of a ticker starts with its prefix, "ETH_BTC:binance" or the hash tagged "{ETH_BTC:binance}"
+# Redis Cluster only hashes what is inside the braces, so all keys of a ticker share a slot
+# and the multi-key pipelines, transactions and scripts of a ticker stay on one node
+
+
+def get_ticker_key_prefix(ticker: str, exchange: str, hash_tags: bool = None) -> str:
+    """
+    :param hash_tags: override REDIS_KEY_HASH_TAGS, eg. when migrating keys
+    :return: eg. "ETH_BTC:binance" or "{ETH_BTC:binance}"
+    """
+    hash_tags = REDIS_KEY_HASH_TAGS if hash_tags is None else hash_tags
+    return f'{{{ticker}:{exchange}}}' if hash_tags else f'{ticker}:{exchange}'
+
+
+def get_ticker_db_key(ticker: str, exchange: str, *key_parts) -> str:
+    """
+    eg. get_ticker_db_key("ETH_BTC", "binance", "PriceStorage", "close_price")
+    :return: eg. "ETH_BTC:binance:PriceStorage:close_price" or "{ETH_BTC:binance}:PriceStorage:close_price"
+    """
+    return ":".join([get_ticker_key_prefix(ticker, exchange)] + [str(part) for part in key_parts])
+
+
+def split_ticker_key(key) -> list:
+    """
+    split a ticker key of either layout
+
+    :param key: eg. b"{ETH_BTC:binance}:PriceStorage:close_price" (str or bytes)
+    :return: eg. ["ETH_BTC", "binance", "PriceStorage", "close_price"]
+    """
+    key = key.decode("utf-8") if isinstance(key, bytes) else key
+    if key.startswith("{"):
+        key = key.replace("}", "", 1)[1:]
+    return key.split(":")
+
+
+def convert_ticker_key(key, hash_tags: bool = None) -> str:
+    """
+    :return: the same key in the other (or requested) layout
+    """
+    [ticker, exchange, *key_parts] = split_ticker_key(key)
+    hash_tags = not (key.startswith(b"{" if isinstance(key, bytes) else "{")) if hash_tags is None else hash_tags
+    return ":".join([get_ticker_key_prefix(ticker, exchange, hash_tags=hash_tags)] + key_parts)
+
+
+def ticker_key_pattern(ticker_pattern: str = "*", exchange_pattern: str = "*", suffix_pattern: str = "*") -> str:
+    """
+    glob pattern for SCAN and SSCAN matching the current layout
+
+    :return: eg. "*_BTC:binance:PriceStorage:*" or "{*_BTC:binance}:PriceStorage:*"
+    """
+    return f'{get_ticker_key_prefix(ticker_pattern, exchange_pattern)}:{suffix_pattern}'
@@ -1,6 +1,9 @@
-# https://stackoverflow.com/questions/16974047/efficient-way-to-find-missing-elements-in-an-integer-sequence/16974075#16974075
 from itertools import islice, chain
 
+import numpy as np
+
+# https://stackoverflow.com/questions/16974047/efficient-way-to-find-missing-elements-in-an-integer-sequence/16974075#16974075
+
 def window(seq, n=2):
     "Returns a sliding window (of width n) over data from the iterable"
     "   s -> (s0,s1,...s[n-1]), (s1,s2,...,sn), ...                   "
@@ -16,3 +19,26 @@ def window(seq, n=2):
 def missing_elements(L):
     missing = chain.from_iterable(range(x + 1, y) for x, y in window(L) if (y - x) > 1)
     return list(missing)
+
+
+def contiguous_ranges(scores) -> list:
+    """
+    :param scores: sorted integer scores, eg. [3, 4, 7, 8, 9]
+    :return: list of (first, last) scores of each run of consecutive scores, eg. [(3, 4), (7, 9)]
+    """
+    scores = np.asarray(scores, dtype=np.int64)
+    if not len(scores):
+        return []
+    break_positions = np.flatnonzero(np.diff(scores) > 1)
+    return list(zip(scores[np.concatenate([[0], break_positions + 1])].tolist(),
+                    scores[np.concatenate([break_positions, [len(scores) - 1]])].tolist()))
+
+
+def missing_ranges(scores) -> list:
+    """
+    :param scores: sorted integer scores, eg. [1, 2, 5, 6, 9]
+    :return: list of (first, last) missing scores of each gap, eg. [(3, 4), (7, 8)]
+    """
+    scores = np.asarray(scores, dtype=np.int64)
+    gap_positions = np.flatnonzero(np.diff(scores) > 1)
+    return list(zip((scores[gap_positions] + 1).tolist(), (scores[gap_positions + 1] - 1).tolist()))
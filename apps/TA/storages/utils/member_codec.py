@@ -0,0 +1,99 @@
+import struct
+import numpy as np
+
+# Sorted set members must be unique per score, so every member carries its own score.
+#
+# TEXT_ENCODING (v0, legacy):   b'9545225909:176255.0'
+#   f'{value}:{score}', any value string is allowed (eg. bbands "upper:middle:lower")
+#
+# PACKED_ENCODING (v1):         b'\x01' + <float64 value> + <float64 score>
+#   17 bytes, fixed width, numeric values only
+#   a list of v1 members joins into one buffer that numpy reads without any python parsing
+
+TEXT_ENCODING, PACKED_ENCODING = 0, 1
+ENCODINGS = (TEXT_ENCODING, PACKED_ENCODING)
+
+PACKED_VERSION_BYTE = bytes([PACKED_ENCODING])
+PACKED_MEMBER_FORMAT = "<Bdd"
+PACKED_MEMBER_DTYPE = np.dtype([('version', 'u1'), ('value', '<f8'), ('score', '<f8')])
+PACKED_MEMBER_SIZE = PACKED_MEMBER_DTYPE.itemsize  # 17 bytes
+
+assert struct.calcsize(PACKED_MEMBER_FORMAT) == PACKED_MEMBER_SIZE
+
+
+class MemberCodecException(Exception):
+    pass
+
+
+def encode_member(value, score, encoding: int = TEXT_ENCODING):
+    """
+    :param value: the value to store, eg. 9545225909 or "1.2:1.1:1.0"
+    :param score: the score as defined by TimeseriesStorage.score_from_timestamp()
+    :param encoding: TEXT_ENCODING or PACKED_ENCODING
+    :return: str for text encoding, bytes for packed encoding
+    """
+    if encoding == TEXT_ENCODING:
+        return f'{value}:{score}'
+    elif encoding == PACKED_ENCODING:
+        try:
+            return struct.pack(PACKED_MEMBER_FORMAT, PACKED_ENCODING, float(value), float(score))
+        except (TypeError, ValueError):
+            raise MemberCodecException(f"value {value} is not numeric, cannot be packed")
+    raise MemberCodecException(f"unknown member encoding: {encoding}")
+
+
+def is_packed_member(member) -> bool:
+    return isinstance(member, bytes) and len(member) == PACKED_MEMBER_SIZE and member[:1] == PACKED_VERSION_BYTE
+
+
+def format_value(value: float) -> str:
+    # render integer values (eg. satoshi prices) the same way the text encoding stored them
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def decode_member(member) -> tuple:
+    """
+    :param member: raw sorted set member from redis, bytes or str, any encoding
+    :return: (value, score) as strings, the same as the legacy "value:score".split(":")
+    """
+    if is_packed_member(member):
+        _, value, score = struct.unpack(PACKED_MEMBER_FORMAT, member)
+        return format_value(value), str(score)
+
+    if isinstance(member, bytes):
+        member = member.decode("utf-8")
+    value, score = member.rsplit(":", 1)
+    return value, score
+
+
+def decode_members_to_arrays(members: list) -> tuple:
+    """
+    decode a redis reply of sorted set members straight into numpy arrays
+
+    :param members: list of raw members (bytes), any mix of encodings, numeric values only
+    :return: (scores, values) as float64 numpy arrays in the same order as members
+    """
+    if not len(members):
+        return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64)
+
+    buffer = b''.join(members)
+
+    # fast path: all members are packed, read the whole reply as one structured array
+    # a text member never contains the version byte, so a mixed reply always fails this check
+    if len(buffer) == PACKED_MEMBER_SIZE * len(members):
+        packed = np.frombuffer(buffer, dtype=PACKED_MEMBER_DTYPE)
+        if (packed['version'] == PACKED_ENCODING).all():
+            return packed['score'].astype(np.float64), packed['value'].astype(np.float64)
+
+    # text path: one split over the joined reply when every member is exactly "value:score"
+    if PACKED_VERSION_BYTE not in buffer:
+        fields = b':'.join(members).split(b':')
+        if len(fields) == 2 * len(members):
+            pairs = np.array(fields).astype(np.float64).reshape(-1, 2)
+            return pairs[:, 1].copy(), pairs[:, 0].copy()
+
+    # mixed encodings (eg. during a migration), decode one by one
+    value_score_pairs = [decode_member(member) for member in members]
+    values = np.array([float(value) for value, score in value_score_pairs], dtype=np.float64)
+    scores = np.array([float(score) for value, score in value_score_pairs], dtype=np.float64)
+    return scores, values
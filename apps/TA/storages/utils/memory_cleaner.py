@@ -1,6 +1,10 @@
 import logging
 import time
+from itertools import islice
 
+from apps.TA import KEY_SCAN_COUNT, PERIODS_1HR, PERIODS_4HR, PERIODS_24HR, PRICE_5MIN_RETENTION_DAYS, \
+    PRICE_1HR_RETENTION_DAYS, PRICE_24HR_RETENTION_DAYS
+from apps.TA.storages.utils.key_layout import get_ticker_db_key, split_ticker_key, ticker_key_pattern
 from apps.common.utilities.multithreading import start_new_thread
 from apps.indicator.models.sma import SMA_LIST
 from settings import STAGE
@@ -31,55 +35,175 @@ def redisCleanup():
     from apps.TA.storages.data.pv_history import PriceVolumeHistoryStorage
     old_score = PriceVolumeHistoryStorage.score_from_timestamp(old_for_pv_history_timestamp)
 
-    pv_history_keys = database.keys(f'*:PriceVolumeHistoryStorage:*')
-    for pv_history_key in pv_history_keys:
-        try:
-            database.zremrangebyscore(pv_history_key, 0, old_score)
-        except Exception as e:
-            logger.error(str(e))
+    trim_registered_keys(PriceVolumeHistoryStorage, 0, old_score)
 
 
     #PriceVolumeHistoryStorage
     from datetime import datetime, timedelta
     from apps.TA.storages.abstract.timeseries_storage import TimeseriesStorage
-    old_score = TimeseriesStorage.score_from_timestamp(datetime(2017, 1, 1).timestamp())
     highest_allowed_score = TimeseriesStorage.score_from_timestamp((datetime.today() + timedelta(days=1)).timestamp())
 
-    for price_history_key in database.keys("*PriceVolumeHistoryStorage*"):
-        # remove anything without a valid score (valid is between jan_1_2017 and today using timeseries score)
-        database.zremrangebyscore(price_history_key, 0, old_score)
-        database.zremrangebyscore(price_history_key, highest_allowed_score, datetime.today().timestamp())
+    # remove anything without a valid score (valid is between jan_1_2017 and today using timeseries score)
+    # scores before jan_1_2017 are already gone with the values 2 hours old or older
+    trim_registered_keys(PriceVolumeHistoryStorage, highest_allowed_score, datetime.today().timestamp())
     #PriceVolumeHistoryStorage
 
 
 
     # PriceStorage
-    # delete all values 200 days old or older
     if STAGE:
+        # delete all values 200 periods old or older
         old_for_price_timestamp = now_timestamp - (5 * SMA_LIST[-1])  # 200 periods on short
+
+        from apps.TA.storages.data.price import PriceStorage
+        old_score = PriceStorage.score_from_timestamp(old_for_price_timestamp)
+
+        trim_registered_keys(PriceStorage, 0, old_score)
+    elif PRICE_5MIN_RETENTION_DAYS:
+        # keep 5min values for PRICE_5MIN_RETENTION_DAYS, then 1hr and 24hr bars only
+        compact_price_history(now_timestamp)
     else:
+        # delete all values 200 days old or older
         old_for_price_timestamp = now_timestamp - (3600 * 24 * SMA_LIST[-1])  # 200 days
 
-    from apps.TA.storages.data.price import PriceStorage
-    old_score = PriceStorage.score_from_timestamp(old_for_price_timestamp)
+        from apps.TA.storages.data.price import PriceStorage
+        old_score = PriceStorage.score_from_timestamp(old_for_price_timestamp)
 
-    price_history_keys = database.keys(f'*:PriceStorage:*')
-    for price_history_key in price_history_keys:
-        try:
-            database.zremrangebyscore(price_history_key, 0, old_score)
-        except Exception as e:
-            logger.error(str(e))
+        trim_registered_keys(PriceStorage, 0, old_score)
 
     if STAGE:
         # remove all poloniex and bittrex data for now
         # todo: remove this and make sure it's not necessary
-        for key in database.keys("*:poloniex:*"):
-            database.delete(key)
-        for key in database.keys("*:bittrex:*"):
-            database.delete(key)
+        delete_exchange_keys("poloniex")
+        delete_exchange_keys("bittrex")
 
 # from apps.TA.storages.data.memory_cleaner import redisCleanup as rC
 
+
+def _chunks(iterable, size: int = KEY_SCAN_COUNT):
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def trim_registered_keys(storage_class, min_score: float, max_score: float, match: str = None) -> int:
+    """
+    remove values by score from every key registered by a storage class, KEY_SCAN_COUNT keys per pipeline
+    keys left empty (deleted by redis) are also removed from the key registry
+
+    :param storage_class: a TimeseriesStorage subclass, eg. PriceStorage
+    :param match: glob pattern on the keys (optional, default all keys)
+    :return: number of values removed
+    """
+    removed_count = 0
+
+    for keys in _chunks(storage_class.get_registered_keys(match=match)):
+        try:
+            pipeline = database.pipeline(transaction=False)
+            for key in keys:
+                pipeline.zremrangebyscore(key, min_score, max_score)
+                pipeline.exists(key)
+            responses = pipeline.execute()
+
+            removed_count += sum(responses[0::2])
+            storage_class.unregister_keys([key for key, exists in zip(keys, responses[1::2]) if not exists])
+        except Exception as e:
+            logger.error(str(e))
+
+    return removed_count
+
+
+def compact_price_history(timestamp: int = None) -> int:
+    """
+    tiered retention of price and volume history
+    5min PriceStorage and VolumeStorage values older than PRICE_5MIN_RETENTION_DAYS are deleted,
+    once the 1hr, 4hr and 24hr RollupStorage bars holding them are complete
+    1hr and 4hr bars are kept for PRICE_1HR_RETENTION_DAYS, 24hr bars for PRICE_24HR_RETENTION_DAYS (0 keeps all)
+    PriceStorage.query_ohlcv() reads the bars where the 5min values are gone
+
+    :param timestamp: now (optional, default time.time())
+    :return: number of 5min values deleted
+    """
+    from apps.TA.storages.data.price import PriceStorage
+    from apps.TA.storages.data.volume import VolumeStorage
+    from apps.TA.storages.data.rollup import RollupStorage, backfill_rollups, get_compaction_score
+
+    compaction_score = get_compaction_score(timestamp)
+    if not compaction_score:
+        return 0  # PRICE_5MIN_RETENTION_DAYS is 0
+
+    # complete the bars of the 5min periods about to be deleted, from each ticker's first period
+    for keys in _chunks(PriceStorage.get_registered_keys(match="*:PriceStorage:close_price")):
+        pipeline = database.pipeline(transaction=False)
+        for key in keys:
+            pipeline.zrange(key, 0, 0, withscores=True)
+        for key, first_members in zip(keys, pipeline.execute()):
+            if not first_members or first_members[0][1] > compaction_score:
+                continue
+            [ticker, exchange, storage_class, index] = split_ticker_key(key)
+            first_score = int(round(first_members[0][1]))
+            try:
+                backfill_rollups(ticker, exchange, RollupStorage.timestamp_from_score(compaction_score),
+                                 compaction_score - first_score + 1)
+            except Exception as e:
+                logger.error(f'cannot compact {ticker}:{exchange}, rollups not saved: {str(e)}')
+                return 0
+
+    deleted_count = trim_registered_keys(PriceStorage, 0, compaction_score)
+    deleted_count += trim_registered_keys(VolumeStorage, 0, compaction_score)
+
+    hour_bars_score = get_compaction_score(timestamp, PRICE_1HR_RETENTION_DAYS)
+    for horizon in [PERIODS_1HR, PERIODS_4HR]:
+        trim_registered_keys(RollupStorage, 0, hour_bars_score, match=f"*:RollupStorage:{horizon}:*")
+    if PRICE_24HR_RETENTION_DAYS:
+        trim_registered_keys(RollupStorage, 0, get_compaction_score(timestamp, PRICE_24HR_RETENTION_DAYS),
+                             match=f"*:RollupStorage:{PERIODS_24HR}:*")
+
+    logger.info(f"{deleted_count} 5min price and volume values compacted up to score {compaction_score}")
+    return deleted_count
+
+
+def delete_exchange_keys(exchange: str) -> int:
+    """
+    delete all keys of an exchange, walking the keyspace with SCAN instead of KEYS
+    including keys saved before the key registries existed, then drop the exchange from the key registries
+
+    :return: number of keys deleted
+    """
+    from apps.TA.storages.abstract.timeseries_storage import TimeseriesStorage, forget_registered_keys
+
+    deleted_count = 0
+    for keys in _chunks(database.scan_iter(match=ticker_key_pattern(exchange_pattern=exchange), count=KEY_SCAN_COUNT)):
+        deleted_count += database.delete(*keys)
+
+    registry_prefix = TimeseriesStorage.key_registry_prefix
+    pipeline = database.pipeline(transaction=False)
+    for registry_key in database.scan_iter(match=f'{registry_prefix}:*:{exchange}', count=KEY_SCAN_COUNT):
+        # eg. "key_registry:PriceStorage:poloniex" is listed in "key_registry:PriceStorage"
+        pipeline.delete(registry_key)
+        pipeline.srem(registry_key.decode("utf-8").rsplit(":", 1)[0], exchange)
+    pipeline.execute()
+    forget_registered_keys()
+
+    return deleted_count
+
+
+def get_pv_history_clear_range(score: float, conservative: bool = True) -> tuple:
+    """
+    :return: (min_score, max_score) of PriceVolumeHistoryStorage values to delete once a 5min period is resampled
+    """
+    from apps.TA.storages.abstract.ticker_subscriber import get_nearest_5min_score
+
+    # 45s/300 is range for deletion, other
+    score = get_nearest_5min_score(score)
+
+    min_score = score - 1 + ((45/300) if conservative else 0)
+    max_score = score - ((255/300) if conservative else 0)
+    return min_score, max_score
+
+
 @start_new_thread
 def clear_pv_history_values(ticker: str, exchange: str, score: float, conservative: bool = True) -> bool:
     """
@@ -91,16 +215,15 @@ def clear_pv_history_values(ticker: str, exchange: str, score: float, conservati
     Default is True, which will not delete values within 45s of the edge of the 5min period
     :return:
     """
-    from apps.TA.storages.abstract.ticker_subscriber import get_nearest_5min_score
-
     # todo: move logic to PriceVolumeHistoryStorage.destroy()
+    from apps.TA.storages.data.pv_history import default_price_indexes
 
-    # 45s/300 is range for deletion, other
-    score = get_nearest_5min_score(score)
-
-    min_score = score - 1 + ((45/300) if conservative else 0)
-    max_score = score - ((255/300) if conservative else 0)
+    min_score, max_score = get_pv_history_clear_range(score, conservative)
 
-    for key in database.keys(f"{ticker}:{exchange}:PriceVolumeHistoryStorage:*price*"):
-        database.zremrangebyscore(key, min_score, max_score)
+    # the keys are known, no need to search for them
+    pipeline = database.pipeline(transaction=False)
+    for index in default_price_indexes:
+        key = get_ticker_db_key(ticker, exchange, "PriceVolumeHistoryStorage", index)
+        pipeline.zremrangebyscore(key, min_score, max_score)
         # logger.debug(f"removing values in {key} for scores {min_score} to {max_score}")
+    pipeline.execute()
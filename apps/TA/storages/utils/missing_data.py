@@ -1,14 +1,22 @@
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
 
 from apps.TA import PRICE_INDEXES, VOLUME_INDEXES, JAN_1_2017_TIMESTAMP
 from apps.TA.storages.abstract.timeseries_storage import TimeseriesStorage
 from apps.TA.storages.data.price import PriceStorage
+from apps.TA.storages.data.pv_history import default_indexes
+from apps.TA.storages.data.rollup import backfill_rollups
 from apps.TA.storages.data.volume import VolumeStorage
-from apps.TA.storages.utils.list_search import missing_elements
-from apps.TA.storages.utils.pv_resampling import generate_pv_storages
+from apps.TA.storages.utils.bulk_restore import MINUTE_COLUMNS, query_price_history_minutes, \
+    resample_minutes_to_5min, save_5min_periods
+from apps.TA.storages.utils.key_layout import get_ticker_db_key
+from apps.TA.storages.utils.list_search import missing_ranges
+from apps.TA.storages.utils.member_codec import decode_member, decode_members_to_arrays
+from apps.TA.storages.utils.pv_resampling import PV_HISTORY_SCORE_TOLERANCE
 from apps.api.helpers import get_source_index, get_counter_currency_index
-from apps.indicator.models import PriceHistory
 from settings.redis_db import database
 
 logger = logging.getLogger(__name__)
@@ -28,77 +36,108 @@ def find_start_score(ticker: str, exchange: str, index: str) -> float:
     """
 
     # eg. key = "ETH_BTC:binance:PriceStorage:close_price"
-    key = f"{ticker}:{exchange}:PriceStorage:{index}"
+    key = get_ticker_db_key(ticker, exchange, "PriceStorage", index)
 
     query_response = database.zrange(key, 0, 0)
-    score = float(query_response[0].decode("utf-8").split(":")[1])
+    score = float(decode_member(query_response[0])[1])
     return score
 
 
-def find_pv_storage_data_gaps(ticker: str, exchange: str, index: str, back_to_the_backlog: bool = False) -> list:
+def find_missing_score_ranges(ticker: str, exchange: str, index: str) -> list:
     """
-    Find and plug up gaps in the data for Price and Volume Storages
+    :return: list of (first, last) missing scores of each gap in the PriceStorage or VolumeStorage index
+    """
+    storage_class = VolumeStorage if index in VOLUME_INDEXES else PriceStorage
+    scores, _ = decode_members_to_arrays(database.zrange(storage_class.get_index_db_key(ticker, exchange, index), 0, -1))
+    return missing_ranges(np.unique(np.rint(scores)))
 
-    :param ticker: eg. "ETH_BTC"
-    :param exchange: eg. "binance"
-    :param index: eg. "close_price", should be found in TA.PRICE_INDEXES or TA.VOLUME_INDEXES
-    :param start_score: optional, default is jan_1_2017
-    :param end_score: optional, default will reset to 2 hours ago from now()
-    :return: list of scores that are still missing gaps, [] empty list means no gaps
+
+def query_pv_history_minutes(ticker: str, exchange: str, first_score: int, last_score: int) -> pd.DataFrame:
     """
-    from apps.TA.management.commands.TA_restore import save_pv_histories_to_redis
+    one pipelined read of the PriceVolumeHistoryStorage values resampled into the 5min periods first_score...last_score
 
-    # validate index and determine storage class
-    if index in PRICE_INDEXES:
-        storage_class = PriceStorage
-    elif index in VOLUME_INDEXES:
-        storage_class = VolumeStorage
-    else:
-        raise Exception("unknown index")
+    :return: DataFrame with MINUTE_COLUMNS like query_price_history_minutes()
+    """
+    pipeline = database.pipeline(transaction=False)
+    for index in default_indexes:
+        pipeline.zrangebyscore(get_ticker_db_key(ticker, exchange, "PriceVolumeHistoryStorage", index),
+                               first_score - 1 - PV_HISTORY_SCORE_TOLERANCE, last_score + PV_HISTORY_SCORE_TOLERANCE)
 
-    storage_instance = storage_class(ticker=ticker, exchange=exchange, index=index, timestamp=JAN_1_2017_TIMESTAMP)
-    redis_zset_withscores = database.zrange(storage_instance.get_db_key(), 0, -1, withscores=True)
-    scores = [int(score) for (value, score) in redis_zset_withscores]
-    missing_scores = missing_elements(scores)
+    index_series = {}
+    for index, query_response in zip(default_indexes, pipeline.execute()):
+        scores, values = decode_members_to_arrays(query_response)
+        timestamps = np.rint(scores * 300).astype(np.int64) + JAN_1_2017_TIMESTAMP
+        index_series[index] = pd.Series(values, index=timestamps).groupby(level=0).last()
 
-    restored_scores = []
+    minutes = pd.DataFrame(index_series, columns=MINUTE_COLUMNS[1:]).sort_index()
+    return minutes.rename_axis("timestamp").reset_index()[MINUTE_COLUMNS]
+
+
+def repair_score_range(ticker: str, exchange: str, index: str, first_score: int, last_score: int,
+                       back_to_the_backlog: bool = False) -> list:
+    """
+    resample one gap of an index from PriceVolumeHistoryStorage, and from one PriceHistory range query if asked
+    restored values are written in one pipeline, values of other indexes are left untouched
+
+    :return: list of restored scores
+    """
+    minutes = query_pv_history_minutes(ticker, exchange, first_score, last_score)
 
     if back_to_the_backlog:
         # let's go "back to the backlog"; try to reach back and deep into the SQL
-        restorable_scores = []
+        [transaction_currency, counter_currency] = ticker.split("_")
+        sql_minutes = query_price_history_minutes(
+            transaction_currency, get_counter_currency_index(counter_currency), get_source_index(exchange),
+            datetime.fromtimestamp(TimeseriesStorage.timestamp_from_score(first_score - 1), timezone.utc),
+            datetime.fromtimestamp(TimeseriesStorage.timestamp_from_score(last_score) + 60, timezone.utc)
+        )
+        # SQL rows are last, so they win where both have a minute
+        minutes = pd.concat([minutes, sql_minutes]).drop_duplicates("timestamp", keep="last").sort_values("timestamp")
+
+    if not len(minutes):
+        return []
 
-        for processing_score in missing_scores:
-            processing_datetime = TimeseriesStorage.datetime_from_score(processing_score)
+    periods = resample_minutes_to_5min(minutes)
+    missing_timestamps = [TimeseriesStorage.timestamp_from_score(score) for score in range(first_score, last_score + 1)]
+    periods = periods.loc[periods.index.isin(missing_timestamps), [index]]
 
-            price_history_objects = PriceHistory.objects.filter(
-                timestamp__gte=processing_datetime - timedelta(minutes=1),
-                timestamp__lte=processing_datetime,
-                source=get_source_index(exchange),
-                counter_currency=get_counter_currency_index(ticker.split("_")[1])
-            )
+    save_5min_periods(ticker, exchange, periods)
+    return [int(round(TimeseriesStorage.score_from_timestamp(timestamp)))
+            for timestamp in periods[index].dropna().index]
 
-            for ph_object in price_history_objects:
-                results = save_pv_histories_to_redis(ph_object)
-                if sum(results):
-                    restorable_scores.append(processing_score)
 
-        if len(restorable_scores):
-            logger.debug("successfully restored missing data from SQL into PriceVolumeHistoryStorage")
+def find_pv_storage_data_gaps(ticker: str, exchange: str, index: str, back_to_the_backlog: bool = False) -> list:
+    """
+    Find and plug up gaps in the data for Price and Volume Storages
+    gaps are found with np.diff and each gap is repaired as one range
+
+    :param ticker: eg. "ETH_BTC"
+    :param exchange: eg. "binance"
+    :param index: eg. "close_price", should be found in TA.PRICE_INDEXES or TA.VOLUME_INDEXES
+    :param back_to_the_backlog: also look for the missing periods in the PriceHistory SQL table
+    :return: list of scores that are still missing gaps, [] empty list means no gaps
+    """
+    if index not in PRICE_INDEXES + VOLUME_INDEXES:
+        raise Exception("unknown index")
 
-    for processing_score in missing_scores:
-        if generate_pv_storages(ticker, exchange, index, processing_score):
-            restored_scores.append(processing_score)
-            continue  # problem solved!
+    missing_scores, restored_scores = [], []
 
-    missing_scores = set(missing_scores) - set(restored_scores)
+    for first_score, last_score in find_missing_score_ranges(ticker, exchange, index):
+        range_restored_scores = repair_score_range(ticker, exchange, index, first_score, last_score,
+                                                   back_to_the_backlog=back_to_the_backlog)
+        restored_scores.extend(range_restored_scores)
+        missing_scores.extend(sorted(set(range(first_score, last_score + 1)) - set(range_restored_scores)))
 
     if len(restored_scores):
-        logger.debug(f"successfully restored {len(restored_scores)} scores from PriceVolumeHistoryStorage")
+        logger.debug(f"successfully restored {len(restored_scores)} scores of {ticker}:{exchange}:{index}")
+        # the rollup bars holding the restored periods
+        backfill_rollups(ticker, exchange, TimeseriesStorage.timestamp_from_score(max(restored_scores)),
+                         max(restored_scores) - min(restored_scores) + 1)
 
     if len(missing_scores):
         logger.debug(f"there are {len(missing_scores)} mores scores not yet restored")
 
-    return list(missing_scores - set(restored_scores))
+    return missing_scores
 
 
 def force_plug_pv_storage_data_gaps(ticker: str, exchange: str, index: str, scores: list = []):
@@ -152,7 +191,7 @@ def test_force_plug_pv_storage_data_gaps():
     ticker = "ETH_BTC"
     exchange = "binance"
     index = "close_price"
-    key = f"{ticker}:{exchange}:PriceStorage:{index}"
+    key = get_ticker_db_key(ticker, exchange, "PriceStorage", index)
     database.zremrangebyscore(key, 155773 + 1, 155773 + 2)
 
     scores = [155773, 155773 + 1, 155773 + 2]
@@ -1,18 +1,32 @@
+import json
 import logging
+import numpy as np
 
-from apps.TA import PRICE_INDEXES, VOLUME_INDEXES
+from apps.TA import PRICE_INDEXES, VOLUME_INDEXES, HORIZONS, PV_MEMBER_ENCODING, MESSAGE_TRANSPORT, STREAM_MAXLEN
 from apps.TA.storages.abstract.ticker_subscriber import get_nearest_5min_score
 from apps.TA.storages.abstract.timeseries_storage import TimeseriesStorage
 from apps.TA.storages.data.price import PriceStorage
-from apps.TA.storages.data.pv_history import PriceVolumeHistoryStorage, derived_price_indexes
+from apps.TA.storages.data.pv_history import PriceVolumeHistoryStorage, derived_price_indexes, \
+    default_price_indexes, default_indexes, ohlcv_indexes
+from apps.TA.storages.data.rollup import RollupStorage, update_rollups, queue_rollup_reads, queue_rollup_writes, \
+    get_bar_score
 from apps.TA.storages.data.volume import VolumeStorage
+from apps.TA.storages.utils.key_layout import get_ticker_db_key, split_ticker_key
+from apps.TA.storages.utils.member_codec import decode_members_to_arrays, format_value
+from apps.TA.storages.utils.memory_cleaner import get_pv_history_clear_range
+from apps.TA.storages.utils import streams
+from settings.redis_db import database
 
 logger = logging.getLogger(__name__)
 
+# same window as the timestamp_tolerance=29 and periods_range=1 queries in generate_pv_storages()
+PV_HISTORY_SCORE_TOLERANCE = 29 / 300
+
 
 def generate_pv_storages(ticker: str, exchange: str, index: str, score: float) -> bool:
     """
     resample values from PriceVolumeHistoryStorage into 5min periods in PriceStorage and VolumeStorage
+    and merge them into the 1hr, 4hr, 24hr bars of RollupStorage
     :param ticker: eg. "ETH_BTC"
     :param exchange: eg. "binance"
     :param index: eg. "close_price"
@@ -74,6 +88,8 @@ def generate_pv_storages(ticker: str, exchange: str, index: str, score: float) -
         return False
 
     if storage.value:
+        # rollups first, so they include this period when subscribers hear about it
+        update_rollups(ticker, exchange, index, score, storage.value)
         storage.save(publish=bool(index == "close_price"))
         # logger.info("saved new thing: " + storage.get_db_key())
 
@@ -119,3 +135,302 @@ def generate_pv_storages(ticker: str, exchange: str, index: str, score: float) -
                 price_storage.save()
 
     return True
+
+
+def resample_pv_values(index_values: dict) -> dict:
+    """
+    :param index_values: dict of default_indexes: numpy arrays of PriceVolumeHistoryStorage values in time order
+    :return: dict of PriceStorage and VolumeStorage index: value for the 5min period, same rules as generate_pv_storages()
+    """
+    resampled_values = {}
+
+    for index, reduce in [("open_price", lambda values: values[0]),
+                          ("high_price", np.max),
+                          ("low_price", np.min),
+                          ("close_price", lambda values: values[-1]),
+                          ("close_volume", lambda values: values[-1])]:
+        if len(index_values.get(index, [])):
+            resampled_values[index] = reduce(index_values[index])
+
+    if "close_price" in resampled_values:
+        all_values = np.unique(np.concatenate([index_values[index] for index in default_price_indexes
+                                               if index in index_values]))  # sorted
+        # the median, or the upper of the two middle values (generate_pv_storages() pops either one from a set)
+        resampled_values["midpoint_price"] = all_values[len(all_values) // 2]
+        resampled_values["mean_price"] = all_values.mean()
+        # price_variance: this is too small of a period size to measure variance
+
+    return resampled_values
+
+
+def get_pv_storage_class(index: str):
+    return VolumeStorage if index in VOLUME_INDEXES else PriceStorage
+
+
+def resample_pv_block(ticker: str, exchange: str, score: float) -> bool:
+    """
+    resample all indexes of one 5min block of PriceVolumeHistoryStorage at once
+    one pipelined read, then one MULTI/EXEC with the PriceStorage, VolumeStorage and RollupStorage values,
+    the PriceVolumeHistoryStorage cleanup, and the close_price publish last
+
+    :param ticker: eg. "ETH_BTC"
+    :param exchange: eg. "binance"
+    :param score: as defined by TimeseriesStorage.score_from_timestamp()
+    :return: True if a close price was resampled for the score, else False
+    """
+    score = get_nearest_5min_score(score)
+    timestamp = TimeseriesStorage.timestamp_from_score(score)
+
+    pipeline = database.pipeline(transaction=False)
+    for index in default_indexes:
+        pipeline.zrangebyscore(get_ticker_db_key(ticker, exchange, "PriceVolumeHistoryStorage", index),
+                               score - 1 - PV_HISTORY_SCORE_TOLERANCE, score + PV_HISTORY_SCORE_TOLERANCE)
+    for index in ohlcv_indexes:
+        queue_rollup_reads(pipeline, ticker, exchange, index, score)
+    query_responses = pipeline.execute()
+
+    index_values = {
+        index: decode_members_to_arrays(query_response)[1]
+        for index, query_response in zip(default_indexes, query_responses)
+    }
+    resampled_values = resample_pv_values(index_values)
+    if "close_price" not in resampled_values:
+        return False
+
+    pipeline = database.pipeline(transaction=True)
+    for index, value in resampled_values.items():
+        if value:
+            get_pv_storage_class(index)(
+                ticker=ticker, exchange=exchange, timestamp=timestamp, index=index, value=format_value(value)
+            ).save(pipeline=pipeline)
+
+    rollup_responses = query_responses[len(default_indexes):]
+    for i, index in enumerate(ohlcv_indexes):
+        if resampled_values.get(index):
+            queue_rollup_writes(pipeline, ticker, exchange, index, score, resampled_values[index],
+                                rollup_responses[i * len(HORIZONS):(i + 1) * len(HORIZONS)])
+
+    min_score, max_score = get_pv_history_clear_range(score)
+    for index in default_price_indexes:
+        pipeline.zremrangebyscore(get_ticker_db_key(ticker, exchange, "PriceVolumeHistoryStorage", index),
+                                  min_score, max_score)
+
+    # publish last, so subscribers find the whole 5min period saved
+    PriceStorage(
+        ticker=ticker, exchange=exchange, timestamp=timestamp, index="close_price",
+        value=format_value(resampled_values["close_price"])
+    ).publish(pipeline)
+
+    pipeline.execute()
+    return True
+
+
+# the same as resample_pv_block(), run inside redis as a single script
+# KEYS and layout are built by get_resample_script_args()
+RESAMPLE_PV_BLOCK_LUA = """
+local config = cjson.decode(ARGV[1])
+local PACKED_ENCODING = 1
+
+local function decode_value(member)
+    if string.len(member) == 17 and string.byte(member, 1) == PACKED_ENCODING then
+        local _, value = struct.unpack('<Bdd', member)
+        return value
+    end
+    return tonumber(string.match(member, '^(.*):[^:]*$'))
+end
+
+local function format_value(value)
+    if value == math.floor(value) then
+        return string.format('%d', value)
+    end
+    -- shortest representation that reads back the same, like python's repr()
+    for precision = 15, 16 do
+        local text = string.format('%.' .. precision .. 'g', value)
+        if tonumber(text) == value then
+            return text
+        end
+    end
+    return string.format('%.17g', value)
+end
+
+local function format_score(score)
+    return string.format('%.1f', score)
+end
+
+local function encode_member(value, score)
+    if config.encoding == PACKED_ENCODING then
+        return struct.pack('<Bdd', PACKED_ENCODING, value, score)
+    end
+    return format_value(value) .. ':' .. format_score(score)
+end
+
+-- read the 5min block of PriceVolumeHistoryStorage
+local index_values = {}
+for _, history in ipairs(config.history) do
+    local values = {}
+    for _, member in ipairs(redis.call('ZRANGEBYSCORE', KEYS[history.key], config.min_score, config.max_score)) do
+        local value = decode_value(member)
+        if value then
+            table.insert(values, value)
+        end
+    end
+    index_values[history.index] = values
+end
+
+local close_prices = index_values['close_price'] or {}
+if #close_prices == 0 then
+    return 0
+end
+
+-- resample, see resample_pv_values()
+local resampled = {}
+local function reduce(index, fn)
+    local values = index_values[index] or {}
+    if #values > 0 then
+        resampled[index] = fn(values)
+    end
+end
+reduce('open_price', function(values) return values[1] end)
+reduce('high_price', function(values) return math.max(unpack(values)) end)
+reduce('low_price', function(values) return math.min(unpack(values)) end)
+reduce('close_price', function(values) return values[#values] end)
+reduce('close_volume', function(values) return values[#values] end)
+
+local unique, all_values, total = {}, {}, 0
+for _, index in ipairs(config.price_indexes) do
+    for _, value in ipairs(index_values[index] or {}) do
+        if not unique[value] then
+            unique[value] = true
+            table.insert(all_values, value)
+            total = total + value
+        end
+    end
+end
+table.sort(all_values)
+resampled['midpoint_price'] = all_values[math.floor(#all_values / 2) + 1]
+resampled['mean_price'] = total / #all_values
+
+-- save 5min values
+for _, output in ipairs(config.outputs) do
+    local value = resampled[output.index]
+    if value and value ~= 0 then
+        redis.call('ZADD', KEYS[output.key], config.score, encode_member(value, config.score))
+    end
+end
+
+-- merge into rollup bars, see merge_bar_value()
+for _, rollup in ipairs(config.rollups) do
+    local value = resampled[rollup.index]
+    if value and value ~= 0 then
+        local bar_members = redis.call('ZRANGEBYSCORE', KEYS[rollup.key], rollup.bar_score, rollup.bar_score)
+        if #bar_members > 0 then
+            local bar_value = decode_value(bar_members[#bar_members])
+            if rollup.index == 'open_price' and not rollup.is_first_period then
+                value = bar_value
+            elseif rollup.index == 'high_price' then
+                value = math.max(bar_value, value)
+            elseif rollup.index == 'low_price' then
+                value = math.min(bar_value, value)
+            end
+        end
+        redis.call('ZREMRANGEBYSCORE', KEYS[rollup.key], rollup.bar_score, rollup.bar_score)
+        redis.call('ZADD', KEYS[rollup.key], rollup.bar_score, encode_member(value, rollup.bar_score))
+    end
+end
+
+-- register the saved keys, see TickerStorage.save_own_existance()
+for _, registry in ipairs(config.registries) do
+    redis.call('SADD', KEYS[registry.class_key], config.exchange)
+    for _, key in ipairs(registry.keys) do
+        redis.call('SADD', KEYS[registry.exchange_key], KEYS[key])
+    end
+end
+
+-- clean up PriceVolumeHistoryStorage
+for _, key in ipairs(config.clear_keys) do
+    redis.call('ZREMRANGEBYSCORE', KEYS[key], config.clear_min_score, config.clear_max_score)
+end
+
+-- publish last, like TimeseriesStorage.publish() the message always uses the text encoding
+local close_name = format_value(resampled['close_price']) .. ':' .. format_score(config.score)
+local message = cjson.encode({
+    key = KEYS[config.publish_key], name = close_name, score = format_score(config.score)
+})
+if config.stream_key then
+    redis.call('XADD', KEYS[config.stream_key], 'MAXLEN', '~', config.stream_maxlen, '*', config.stream_field, message)
+else
+    redis.call('PUBLISH', config.channel, message)
+end
+return 1
+"""
+
+_resample_pv_block_script = None
+
+
+def get_resample_script_args(ticker: str, exchange: str, score: int) -> tuple:
+    """
+    :return: (keys, args) for RESAMPLE_PV_BLOCK_LUA, every key the script touches is declared in keys
+    """
+    keys = []
+
+    def key_position(key):  # lua tables are 1-indexed
+        keys.append(key)
+        return len(keys)
+
+    config = {
+        "score": score,
+        "exchange": exchange,
+        "encoding": PV_MEMBER_ENCODING,
+        "channel": PriceStorage.__name__,
+        "price_indexes": default_price_indexes,
+        "min_score": repr(score - 1 - PV_HISTORY_SCORE_TOLERANCE),
+        "max_score": repr(score + PV_HISTORY_SCORE_TOLERANCE),
+        "history": [
+            {"index": index,
+             "key": key_position(get_ticker_db_key(ticker, exchange, "PriceVolumeHistoryStorage", index))}
+            for index in default_indexes
+        ],
+        "outputs": [
+            {"index": index, "key": key_position(PriceStorage.get_index_db_key(ticker, exchange, index))}
+            for index in ohlcv_indexes + ["midpoint_price", "mean_price"]
+        ],
+        "rollups": [
+            {
+                "index": index,
+                "key": key_position(RollupStorage.get_bar_db_key(ticker, exchange, horizon, index)),
+                "bar_score": get_bar_score(score, horizon),
+                "is_first_period": bool(score == get_bar_score(score, horizon) - horizon + 1),
+            }
+            for index in ohlcv_indexes for horizon in HORIZONS
+        ],
+    }
+    config["clear_min_score"], config["clear_max_score"] = [repr(s) for s in get_pv_history_clear_range(score)]
+    config["clear_keys"] = [history["key"] for history in config["history"] if history["index"] in default_price_indexes]
+    config["registries"] = [
+        {
+            "class_key": key_position(storage_class.get_key_registry_db_key()),
+            "exchange_key": key_position(storage_class.get_key_registry_db_key(exchange)),
+            "keys": [output["key"] for output in config["outputs"] + config["rollups"]
+                     if split_ticker_key(keys[output["key"] - 1])[2] == storage_class.__name__],
+        }
+        for storage_class in [PriceStorage, VolumeStorage, RollupStorage]
+    ]
+    config["publish_key"] = [output["key"] for output in config["outputs"] if output["index"] == "close_price"][0]
+    if MESSAGE_TRANSPORT == "streams":
+        config["stream_key"] = key_position(streams.get_stream_key(PriceStorage.__name__))
+        config["stream_maxlen"] = STREAM_MAXLEN
+        config["stream_field"] = streams.STREAM_DATA_FIELD
+
+    return keys, [json.dumps(config)]
+
+
+def resample_pv_block_lua(ticker: str, exchange: str, score: float) -> bool:
+    """
+    same as resample_pv_block(), in a single round trip running inside redis
+    """
+    global _resample_pv_block_script
+    if _resample_pv_block_script is None:
+        _resample_pv_block_script = database.register_script(RESAMPLE_PV_BLOCK_LUA)
+
+    keys, args = get_resample_script_args(ticker, exchange, get_nearest_5min_score(score))
+    return bool(_resample_pv_block_script(keys=keys, args=args))
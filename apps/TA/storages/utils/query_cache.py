@@ -0,0 +1,205 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from apps.TA import QUERY_CACHE_ENTRIES, QUERY_CACHE_BYTES, QUERY_CACHE_SECONDS, MESSAGE_TRANSPORT
+from apps.TA.storages.utils import streams
+from apps.TA.storages.utils.member_codec import MemberCodecException, encode_member, decode_member
+from apps.common.utilities.multithreading import start_new_thread
+from settings.redis_db import database
+
+logger = logging.getLogger(__name__)
+
+# between two 5min closes the same windows are read again and again (indicators, signals, api views)
+# the cache keeps the raw ZRANGEBYSCORE reply of each (key, min_score, max_score) in process memory
+# a published member is appended to the cached windows it belongs to, a save of this process drops them
+# writes this process never hears about are bounded by QUERY_CACHE_SECONDS, eg. with streams each TA_worker
+# only handles its consumer group's share of the messages, start listen_for_published_members() to see them all
+
+MEMBER_OVERHEAD_BYTES = 50  # python object overhead per cached member, added to its length
+
+
+class QueryCache(object):
+    """
+    LRU of sorted set range replies, bounded by entry count and bytes, safe to share between threads
+    """
+
+    def __init__(self, max_entries: int = QUERY_CACHE_ENTRIES, max_bytes: int = QUERY_CACHE_BYTES,
+                 max_seconds: int = QUERY_CACHE_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.lock = threading.Lock()
+        self.counters = dict(hits=0, misses=0, appends=0, invalidations=0, evictions=0)
+        self.clear()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def clear(self):
+        with self.lock:
+            self.entries = OrderedDict()  # (key, min_score, max_score): dict(members=, encoding=, size=, time=)
+            self.cache_keys_by_db_key = defaultdict(set)
+            self.size = 0
+
+    def get(self, db_key: str, min_score: float, max_score: float):
+        """
+        :return: copy of the cached members, or None
+        """
+        if not self.enabled:
+            return None
+        cache_key = (str(db_key), float(min_score), float(max_score))
+        with self.lock:
+            entry = self.entries.get(cache_key)
+            if entry is not None and time.time() - entry["time"] > self.max_seconds:
+                self._remove(cache_key)
+                entry = None
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            self.entries.move_to_end(cache_key)
+            self.counters["hits"] += 1
+            return list(entry["members"])
+
+    def put(self, db_key: str, min_score: float, max_score: float, members: list, encoding: int):
+        """
+        :param members: raw redis reply of ZRANGEBYSCORE db_key min_score max_score
+        :param encoding: member encoding of the storage class, used for appended members
+        """
+        if not self.enabled:
+            return
+        cache_key = (str(db_key), float(min_score), float(max_score))
+        size = sum(len(member) + MEMBER_OVERHEAD_BYTES for member in members)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if cache_key in self.entries:
+                self._remove(cache_key)
+            self.entries[cache_key] = dict(members=list(members), encoding=encoding, size=size, time=time.time())
+            self.cache_keys_by_db_key[cache_key[0]].add(cache_key)
+            self.size += size
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.counters["evictions"] += 1
+
+    def _remove(self, cache_key: tuple):
+        entry = self.entries.pop(cache_key)
+        self.size -= entry["size"]
+        self.cache_keys_by_db_key[cache_key[0]].discard(cache_key)
+        if not self.cache_keys_by_db_key[cache_key[0]]:
+            del self.cache_keys_by_db_key[cache_key[0]]
+
+    def _covering_cache_keys(self, db_key: str, score: float) -> list:
+        return [cache_key for cache_key in self.cache_keys_by_db_key.get(str(db_key), ())
+                if cache_key[1] <= score <= cache_key[2]]
+
+    def invalidate(self, db_key: str, score: float = None):
+        """
+        drop the cached windows of a key, only those holding score if given
+        """
+        if not self.enabled:
+            return
+        db_key = db_key.decode("utf-8") if isinstance(db_key, bytes) else db_key
+        with self.lock:
+            cache_keys = (list(self.cache_keys_by_db_key.get(db_key, ())) if score is None
+                          else self._covering_cache_keys(db_key, float(score)))
+            for cache_key in cache_keys:
+                self._remove(cache_key)
+                self.counters["invalidations"] += 1
+
+    def invalidate_on_execute(self, pipeline, db_key: str, score: float = None):
+        """
+        invalidate() once the pipeline holding a write to db_key has executed
+        """
+        if not self.enabled:
+            return
+        invalidations = getattr(pipeline, "query_cache_invalidations", None)
+        if invalidations is None:
+            invalidations = pipeline.query_cache_invalidations = []
+            execute = pipeline.execute
+
+            def execute_and_invalidate(*args, **kwargs):
+                try:
+                    return execute(*args, **kwargs)
+                finally:
+                    for invalidation in invalidations:
+                        self.invalidate(*invalidation)
+                    invalidations.clear()
+
+            pipeline.execute = execute_and_invalidate
+        invalidations.append((db_key, score))
+
+    def apply_published(self, event_data: dict):
+        """
+        a member was saved and published, append it to the cached windows of its key
+        windows where it does not land last (an update of an old score) are dropped
+
+        :param event_data: eg. {"key": "ETH_BTC:binance:PriceStorage:close_price",
+                                "name": "9545225909:176255.0", "score": "176255.0"}
+        """
+        if not self.enabled:
+            return
+        value, member_score = decode_member(event_data["name"])
+        score = float(event_data["score"])
+        with self.lock:
+            for cache_key in self._covering_cache_keys(event_data["key"], score):
+                entry = self.entries[cache_key]
+                try:
+                    member = encode_member(value, member_score, entry["encoding"])
+                except MemberCodecException:
+                    member = None
+                member = member.encode("utf-8") if isinstance(member, str) else member
+
+                if entry["members"] and entry["members"][-1] == member:
+                    continue  # already applied, eg. by another subscriber of this process
+                if member is None or (entry["members"] and score <= float(decode_member(entry["members"][-1])[1])):
+                    self._remove(cache_key)
+                    self.counters["invalidations"] += 1
+                    continue
+                entry["members"].append(member)
+                entry["size"] += len(member) + MEMBER_OVERHEAD_BYTES
+                self.size += len(member) + MEMBER_OVERHEAD_BYTES
+                self.counters["appends"] += 1
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return dict(self.counters, entries=len(self.entries), bytes=self.size,
+                        hit_rate=round(self.counters["hits"] / lookups, 4) if lookups else 0.0)
+
+
+query_cache = QueryCache()  # one per process
+
+
+@start_new_thread
+def listen_for_published_members(class_names: list):
+    """
+    for processes without TickerSubscribers (eg. api views), follow the publish events of some storage classes
+    in a daemon thread and apply them to the cache, every message is seen, not only a consumer group's share
+
+    :param class_names: eg. ["PriceStorage"]
+    """
+    if MESSAGE_TRANSPORT == "streams":
+        # stream ids start with a unix time in ms, so this reads the messages added from now on
+        last_ids = {streams.get_stream_key(class_name): f'{int(time.time() * 1000)}-0' for class_name in class_names}
+        while True:
+            try:
+                for stream_key, message_id, data in streams.read(list(last_ids), list(last_ids.values()),
+                                                                 block_ms=1000):
+                    last_ids[stream_key] = message_id
+                    query_cache.apply_published(json.loads(data.decode("utf-8")))
+            except Exception as e:
+                logger.error(f'query cache listener: {str(e)}')
+                query_cache.clear()  # events may have been missed
+                time.sleep(1)
+    else:
+        pubsub = database.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(*class_names)
+        for message in pubsub.listen():
+            try:
+                query_cache.apply_published(json.loads(message["data"].decode("utf-8")))
+            except Exception as e:
+                logger.error(f'query cache listener: {str(e)}')
@@ -0,0 +1,49 @@
+import math
+
+# One-step updates for recursively defined averages.
+# Each average lives in a flat state dict under its own name, so several can be chained
+# (eg. TEMA = EMA of EMA of EMA) and the whole dict saved to a redis hash.
+# Seeding follows talib: the first output is the simple average of the first `periods` inputs.
+
+NAN = float('nan')
+
+
+def _seed(state: dict, name: str, value: float, periods: int) -> float:
+    count = int(state.get(f'{name}_count', 0)) + 1
+    total = float(state.get(f'{name}_sum', 0.0)) + value
+    state[f'{name}_count'], state[f'{name}_sum'] = count, total
+    state[name] = total / count if count == periods else NAN
+    return state[name]
+
+
+def is_seeded(state: dict, name: str, periods: int) -> bool:
+    return int(state.get(f'{name}_count', 0)) >= periods
+
+
+def ema_update(state: dict, name: str, value: float, periods: int) -> float:
+    """
+    :param state: dict holding the running average, updated in place
+    :param name: name of the average in state, eg. "ema1"
+    :param value: next input, NaN inputs are skipped
+    :param periods: EMA periods, alpha = 2 / (periods + 1)
+    :return: the new EMA, NaN while seeding
+    """
+    if math.isnan(value):
+        return state.get(name, NAN)
+    if not is_seeded(state, name, periods):
+        return _seed(state, name, value, periods)
+    state[name] += 2.0 / (periods + 1) * (value - state[name])
+    return state[name]
+
+
+def wilder_update(state: dict, name: str, value: float, periods: int) -> float:
+    """
+    Wilder's smoothing as used by RSI, alpha = 1 / periods
+    same parameters as ema_update()
+    """
+    if math.isnan(value):
+        return state.get(name, NAN)
+    if not is_seeded(state, name, periods):
+        return _seed(state, name, value, periods)
+    state[name] = (state[name] * (periods - 1) + value) / periods
+    return state[name]
@@ -0,0 +1,255 @@
+import json
+import math
+from collections import deque
+
+from settings.redis_db import database
+
+# Rolling statistics for signal checks, updated in O(1) (amortized) per new indicator value.
+# Each statistic covers the last `window` scores, so gaps in the data shorten the window instead of shifting it.
+# A RollingState holds the statistics of one indicator key and lives in a redis hash, one json field per statistic.
+# A new value for the last score replaces the old one, so a recomputed indicator value does not count twice.
+# Updates for older scores are ignored.
+
+NAN = float('nan')
+
+
+class RollingStat(object):
+    kind = ""
+
+    def __init__(self, window: int = 0):
+        self.window = int(window)
+        self.first_score = None
+        self.last_score = None
+
+    def is_new_score(self, score) -> bool:
+        score = float(score)
+        if self.last_score is not None and score <= self.last_score:
+            return False
+        if self.first_score is None:
+            self.first_score = score
+        self.last_score = score
+        return True
+
+    def is_last_score(self, score) -> bool:
+        return self.last_score is not None and float(score) == self.last_score
+
+    def is_full(self) -> bool:
+        """
+        :return: True once the scores seen span the whole window
+        """
+        return self.first_score is not None and self.last_score - self.first_score >= self.window - 1
+
+    def is_expired(self, score: float) -> bool:
+        return score <= self.last_score - self.window
+
+    def to_dict(self) -> dict:
+        return dict(kind=self.kind, window=self.window, first_score=self.first_score, last_score=self.last_score)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        stat = cls(data["window"])
+        stat.first_score, stat.last_score = data["first_score"], data["last_score"]
+        return stat
+
+
+class RollingMinMax(RollingStat):
+    """
+    min and max of the window with monotonic deques of (score, value)
+    """
+    kind = "minmax"
+
+    def __init__(self, window: int = 0):
+        super().__init__(window)
+        self.min_deque = deque()  # values increasing, the min first
+        self.max_deque = deque()  # values decreasing, the max first
+        self.popped_min, self.popped_max = [], []  # popped by the value of the last score, restored on overwrite
+
+    def update(self, score, value: float):
+        if math.isnan(value):
+            return self
+        if self.is_last_score(score):
+            # the value of the last score was overwritten, undo its push
+            for values_deque, popped in [(self.min_deque, self.popped_min), (self.max_deque, self.popped_max)]:
+                if values_deque and values_deque[-1][0] == self.last_score:
+                    values_deque.pop()
+                values_deque.extend(popped)
+        elif not self.is_new_score(score):
+            return self
+        score = float(score)
+        self.popped_min, self.popped_max = [], []
+        while self.min_deque and self.min_deque[-1][1] >= value:
+            self.popped_min.insert(0, self.min_deque.pop())
+        while self.max_deque and self.max_deque[-1][1] <= value:
+            self.popped_max.insert(0, self.max_deque.pop())
+        self.min_deque.append((score, value))
+        self.max_deque.append((score, value))
+        for values_deque in (self.min_deque, self.max_deque):
+            while self.is_expired(values_deque[0][0]):
+                values_deque.popleft()
+        return self
+
+    @property
+    def min(self) -> float:
+        return self.min_deque[0][1] if self.min_deque else NAN
+
+    @property
+    def max(self) -> float:
+        return self.max_deque[0][1] if self.max_deque else NAN
+
+    def to_dict(self) -> dict:
+        return dict(super().to_dict(), min_deque=list(self.min_deque), max_deque=list(self.max_deque),
+                    popped_min=self.popped_min, popped_max=self.popped_max)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        stat = super().from_dict(data)
+        stat.min_deque = deque(tuple(item) for item in data["min_deque"])
+        stat.max_deque = deque(tuple(item) for item in data["max_deque"])
+        stat.popped_min = [tuple(item) for item in data.get("popped_min", [])]
+        stat.popped_max = [tuple(item) for item in data.get("popped_max", [])]
+        return stat
+
+
+class RollingMeanStd(RollingStat):
+    """
+    mean and population standard deviation of the window, with running sums over a deque of (score, value)
+    """
+    kind = "meanstd"
+
+    def __init__(self, window: int = 0):
+        super().__init__(window)
+        self.values = deque()
+        self.total = 0.0
+        self.total_squares = 0.0
+
+    def update(self, score, value: float):
+        if math.isnan(value):
+            return self
+        if self.is_last_score(score):
+            # the value of the last score was overwritten, take the old one out of the sums
+            old_score, old_value = self.values.pop()
+            self.total -= old_value
+            self.total_squares -= old_value * old_value
+        elif not self.is_new_score(score):
+            return self
+        self.values.append((float(score), value))
+        self.total += value
+        self.total_squares += value * value
+        while self.is_expired(self.values[0][0]):
+            old_score, old_value = self.values.popleft()
+            self.total -= old_value
+            self.total_squares -= old_value * old_value
+        return self
+
+    @property
+    def count(self) -> int:
+        return len(self.values)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else NAN
+
+    @property
+    def std(self) -> float:
+        if not self.count:
+            return NAN
+        return math.sqrt(max(0.0, self.total_squares / self.count - self.mean ** 2))
+
+    def zscore(self, value: float) -> float:
+        return (value - self.mean) / self.std if self.std else NAN
+
+    def to_dict(self) -> dict:
+        return dict(super().to_dict(), values=list(self.values))
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        stat = super().from_dict(data)
+        for score, value in data["values"]:
+            stat.values.append((score, value))
+            stat.total += value
+            stat.total_squares += value * value
+        return stat
+
+
+class Crossover(RollingStat):
+    """
+    which of two series is above the other, update() tells when they cross
+    """
+    kind = "crossover"
+
+    def __init__(self, window: int = 0):
+        super().__init__(window)
+        self.side = 0  # 1 when the first series is above, -1 below, 0 unknown
+        self.crossed = 0  # 1 crossed above, -1 crossed below, 0 no cross on the last update
+        self.previous_side = 0  # side before the last score, the cross is evaluated again on overwrite
+
+    def update(self, score, value: float, other_value: float = 0.0):
+        if math.isnan(value) or math.isnan(other_value):
+            return self
+        if self.is_last_score(score):
+            self.side = self.previous_side
+        elif not self.is_new_score(score):
+            return self
+        self.previous_side = self.side
+        side = (value > other_value) - (value < other_value)
+        self.crossed = side if side and self.side and side != self.side else 0
+        self.side = side or self.side
+        return self
+
+    def to_dict(self) -> dict:
+        return dict(super().to_dict(), side=self.side, crossed=self.crossed, previous_side=self.previous_side)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        stat = super().from_dict(data)
+        stat.side, stat.crossed = data["side"], data["crossed"]
+        stat.previous_side = data.get("previous_side", stat.side)
+        return stat
+
+
+ROLLING_STAT_CLASSES = {stat_class.kind: stat_class for stat_class in [RollingMinMax, RollingMeanStd, Crossover]}
+
+
+class RollingState(object):
+    """
+    the rolling statistics of one key, eg. BbandsStorage.get_rolling_db_key()
+    """
+
+    def __init__(self, db_key: str, stats: dict = None):
+        self.db_key = db_key
+        self.stats = stats or {}
+        self.new_names = set()  # statistics created since loading, not seeded from redis
+
+    @classmethod
+    def load(cls, db_key: str):
+        return cls(db_key, {
+            name.decode("utf-8"): cls.stat_from_json(data) for name, data in database.hgetall(db_key).items()
+        })
+
+    @staticmethod
+    def stat_from_json(data) -> RollingStat:
+        data = json.loads(data.decode("utf-8") if isinstance(data, bytes) else data)
+        return ROLLING_STAT_CLASSES[data["kind"]].from_dict(data)
+
+    def get(self, name: str, stat_class, window: int = 0):
+        """
+        :return: the statistic, a new empty one if not saved yet or saved with another window
+        """
+        stat = self.stats.get(name)
+        if not isinstance(stat, stat_class) or stat.window != window:
+            stat = self.stats[name] = stat_class(window)
+            self.new_names.add(name)
+        return stat
+
+    def is_new(self, name: str) -> bool:
+        return name in self.new_names
+
+    def save(self, pipeline=None):
+        """
+        :return: the pipeline if one was given, else the redis response
+        """
+        if not self.stats:
+            return pipeline
+        return (database if pipeline is None else pipeline).hmset(
+            self.db_key, {name: json.dumps(stat.to_dict()) for name, stat in self.stats.items()}
+        )
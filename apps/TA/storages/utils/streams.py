@@ -0,0 +1,189 @@
+import logging
+import os
+import socket
+
+from redis.exceptions import ResponseError
+
+from apps.TA import TAException, STREAM_MAXLEN, REDIS_CLUSTER
+from settings.redis_db import database
+
+logger = logging.getLogger(__name__)
+
+# redis-py 2.10.6 has no stream commands, they are sent with execute_command() and need redis server >= 5.0
+# each storage class publishes into one stream, each subscriber class reads it through its own consumer group,
+# so every subscriber class sees every message, and TA_worker processes running the same class share them
+
+STREAM_DATA_FIELD = "data"
+STREAM_READ_COUNT = 100  # messages per XREADGROUP
+STREAM_CLAIM_IDLE_MS = 60 * 1000  # pending messages of a consumer idle this long are claimed by another
+STREAM_MAX_DELIVERIES = 5  # messages failing this many times are acked and dropped
+
+
+class StreamException(TAException):
+    pass
+
+
+def get_stream_key(class_name: str) -> str:
+    """
+    on a Redis Cluster the streams share the "{stream}" hash tag, so one XREADGROUP or XREAD can read all of them
+
+    :param class_name: the publishing storage class name, eg. "PriceStorage"
+    :return: eg. "stream:PriceStorage", or "{stream}:PriceStorage" with REDIS_CLUSTER
+    """
+    return f'{{stream}}:{class_name}' if REDIS_CLUSTER else f'stream:{class_name}'
+
+
+def get_consumer_name() -> str:
+    # unique per worker process, a restarted worker is a new consumer and its old pending messages get claimed
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _to_str(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+
+def _fields_to_dict(fields) -> dict:
+    # [b'field', b'value', ...] -> {"field": b'value'}, already a dict with RESP3
+    if isinstance(fields, dict):
+        return {_to_str(field): value for field, value in fields.items()}
+    return {_to_str(fields[i]): fields[i + 1] for i in range(0, len(fields or []), 2)}
+
+
+def add_message(class_name: str, message: str, pipeline=None):
+    """
+    XADD a message to the stream of a storage class, trimmed to about STREAM_MAXLEN messages
+    :return: the pipeline if one was given, else the message id
+    """
+    return (database if pipeline is None else pipeline).execute_command(
+        'XADD', get_stream_key(class_name), 'MAXLEN', '~', STREAM_MAXLEN, '*', STREAM_DATA_FIELD, message
+    )
+
+
+def create_group(stream_key: str, group_name: str) -> bool:
+    """
+    create the consumer group if it does not exist yet, starting with new messages only
+
+    :return: True if the group was created
+    """
+    try:
+        database.execute_command('XGROUP', 'CREATE', stream_key, group_name, '$', 'MKSTREAM')
+        return True
+    except ResponseError as e:
+        if "BUSYGROUP" in str(e):
+            return False  # created by another worker
+        raise StreamException(f'cannot create consumer group {group_name} on {stream_key}: {e}')
+
+
+def read_group(stream_keys: list, group_name: str, consumer_name: str,
+               count: int = STREAM_READ_COUNT, block_ms: int = None) -> list:
+    """
+    XREADGROUP new messages for this consumer, they stay pending until ack()
+
+    :param block_ms: wait up to this many ms for a message (optional, default returns immediately)
+    :return: list of (stream_key, message_id, data) with data as bytes
+    """
+    if not stream_keys:
+        return []
+    command = ['XREADGROUP', 'GROUP', group_name, consumer_name, 'COUNT', count]
+    if block_ms is not None:
+        command += ['BLOCK', block_ms]
+    command += ['STREAMS'] + list(stream_keys) + ['>'] * len(stream_keys)
+
+    # reply: [[stream_key, [[message_id, [field, value, ...]], ...]], ...] or None, a dict with RESP3
+    reply = database.execute_command(*command) or []
+    messages = []
+    for stream_key, stream_messages in (reply.items() if isinstance(reply, dict) else reply):
+        for message_id, fields in stream_messages:
+            messages.append((_to_str(stream_key), _to_str(message_id), _fields_to_dict(fields).get(STREAM_DATA_FIELD)))
+    return messages
+
+
+def read(stream_keys: list, last_ids: list, count: int = STREAM_READ_COUNT, block_ms: int = None) -> list:
+    """
+    XREAD messages after last_ids, outside of any consumer group, so nothing is pending or acked
+
+    :param last_ids: one message id per stream key, the last one already read
+    :return: list of (stream_key, message_id, data) with data as bytes
+    """
+    if not stream_keys:
+        return []
+    command = ['XREAD', 'COUNT', count]
+    if block_ms is not None:
+        command += ['BLOCK', block_ms]
+    command += ['STREAMS'] + list(stream_keys) + list(last_ids)
+
+    reply = database.execute_command(*command) or []
+    messages = []
+    for stream_key, stream_messages in (reply.items() if isinstance(reply, dict) else reply):
+        for message_id, fields in stream_messages:
+            messages.append((_to_str(stream_key), _to_str(message_id), _fields_to_dict(fields).get(STREAM_DATA_FIELD)))
+    return messages
+
+
+def ack(stream_key: str, group_name: str, message_ids: list, pipeline=None):
+    if not message_ids:
+        return pipeline
+    return (database if pipeline is None else pipeline).execute_command('XACK', stream_key, group_name, *message_ids)
+
+
+def claim_stale_messages(stream_key: str, group_name: str, consumer_name: str,
+                         min_idle_ms: int = None, count: int = STREAM_READ_COUNT) -> list:
+    """
+    take over the pending messages of dead or stuck consumers (XPENDING + XCLAIM, XAUTOCLAIM needs redis 6.2)
+    messages delivered STREAM_MAX_DELIVERIES times are acked and dropped instead
+
+    :param min_idle_ms: (optional, default STREAM_CLAIM_IDLE_MS)
+    :return: list of (stream_key, message_id, data) now pending for this consumer
+    """
+    if min_idle_ms is None:
+        min_idle_ms = STREAM_CLAIM_IDLE_MS
+    # reply: [[message_id, consumer, idle_ms, deliveries_count], ...]
+    pending = database.execute_command('XPENDING', stream_key, group_name, '-', '+', count)
+    stale_ids, dead_ids = [], []
+    for message_id, consumer, idle_ms, deliveries_count in pending or []:
+        if int(idle_ms) < min_idle_ms:
+            continue
+        if int(deliveries_count) >= STREAM_MAX_DELIVERIES:
+            dead_ids.append(_to_str(message_id))
+        else:
+            stale_ids.append(_to_str(message_id))
+
+    if dead_ids:
+        logger.warning(f'{group_name} dropping {len(dead_ids)} messages of {stream_key} '
+                       f'after {STREAM_MAX_DELIVERIES} failed deliveries: {dead_ids}')
+        ack(stream_key, group_name, dead_ids)
+
+    if not stale_ids:
+        return []
+
+    claimed = database.execute_command('XCLAIM', stream_key, group_name, consumer_name, min_idle_ms, *stale_ids)
+    messages = []
+    for entry in claimed or []:
+        if not entry or entry[1] is None:
+            continue  # trimmed from the stream while pending
+        message_id, fields = entry
+        messages.append((stream_key, _to_str(message_id), _fields_to_dict(fields).get(STREAM_DATA_FIELD)))
+    logger.info(f'{consumer_name} claimed {len(messages)} stale messages of {stream_key} for {group_name}')
+    return messages
+
+
+def get_group_lag(stream_key: str, group_name: str) -> dict:
+    """
+    :return: dict(consumers=, pending=, lag=) for a consumer group
+             pending are read but not acked, lag is messages not read yet (None before redis 7.0)
+             empty dict if the stream or group does not exist
+    """
+    try:
+        groups = database.execute_command('XINFO', 'GROUPS', stream_key)
+    except ResponseError:
+        return {}
+
+    for group in groups or []:
+        info = _fields_to_dict(group)
+        if _to_str(info.get("name")) == group_name:
+            return {
+                "consumers": int(info.get("consumers", 0)),
+                "pending": int(info.get("pending", 0)),
+                "lag": int(info["lag"]) if info.get("lag") is not None else None,
+            }
+    return {}
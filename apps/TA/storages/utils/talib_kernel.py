@@ -0,0 +1,113 @@
+import math
+from collections import namedtuple
+
+import numpy as np
+
+from settings import LOAD_TALIB
+if LOAD_TALIB:
+    import talib
+
+# evaluates many talib functions and parameter sets over one float64 matrix of price and volume indexes,
+# eg. the window of an IndicatorContext or of PriceStorage.query_ohlcv_many(), instead of one query and
+# one array conversion per indicator. Rows are passed to talib as views, periods missing in any input of a call are
+# dropped once for all the calls with the same inputs (the only copy, and only when there are gaps).
+# A value is complete when its window had no missing period, the same rule as the live compute_value()
+
+# key identifies the result, eg. ("SmaStorage", 20), inputs are index names, eg. ["close_price"]
+# function_name is a talib function, eg. "SMA", params its keyword arguments, eg. {"timeperiod": 20}
+# window is the number of periods of the value, checked for gaps, eg. 20
+KernelCall = namedtuple("KernelCall", ["key", "function_name", "inputs", "params", "window"])
+
+
+class KernelResult(object):
+    """
+    outputs of the kernel calls for one row of a matrix, eg. one ticker
+    """
+
+    def __init__(self, scores: np.ndarray, valid_masks: dict, outputs: dict):
+        """
+        :param scores: scores of the matrix columns, or None
+        :param valid_masks: dict of call key: bool array over the matrix columns, False where an input was missing
+        :param outputs: dict of call key: tuple of output arrays, one value per valid column
+        """
+        self.scores = scores
+        self.valid_masks = valid_masks
+        self.outputs = outputs
+
+    def get_scores(self, key) -> np.ndarray:
+        # scores the outputs of a call are aligned on
+        return self.scores[self.valid_masks[key]]
+
+    def is_complete(self, call: KernelCall) -> bool:
+        valid = self.valid_masks[call.key]
+        return len(valid) >= call.window and bool(valid[-call.window:].all())
+
+    def get_last_values(self, key) -> tuple:
+        return tuple(float(output[-1]) if len(output) else math.nan for output in self.outputs[key])
+
+    def get_value(self, call: KernelCall) -> str:
+        """
+        :return: the last value formatted like compute_value_with_requisite_indexes(), "" if none or incomplete
+        """
+        if call.key not in self.outputs or not self.is_complete(call):
+            return ""
+        last_values = self.get_last_values(call.key)
+        if any(math.isnan(value) for value in last_values):
+            return ""
+        return ":".join(str(value) for value in last_values)
+
+
+def get_input_rows(matrix: np.ndarray, indexes: list, inputs: tuple) -> tuple:
+    """
+    :param inputs: index names, eg. ("high_price", "low_price", "close_price")
+    :return: (dict of index: row, valid column mask), rows are views of the matrix if none of them has a NaN,
+             else copies without the columns where any of them has one
+    """
+    rows = [matrix[indexes.index(index)] for index in inputs]
+    valid = ~np.isnan(rows[0]) if len(rows) == 1 else ~np.isnan(np.vstack(rows)).any(axis=0)
+    if not valid.all():
+        rows = [row[valid] for row in rows]
+    return dict(zip(inputs, rows)), valid
+
+
+def bind_calls(calls: list) -> list:
+    # look up the talib functions once, eg. for all the tickers of evaluate_many()
+    return [(call, getattr(talib, call.function_name)) for call in calls]
+
+
+def evaluate(matrix: np.ndarray, indexes: list, calls: list, scores: np.ndarray = None,
+             bound_calls: list = None) -> KernelResult:
+    """
+    :param matrix: 2d float64 array, matrix[i] holds the values of indexes[i], NaN where missing
+    :param indexes: eg. ["high_price", "low_price", "open_price", "close_price"]
+    :param calls: list of KernelCall, their inputs must be in indexes
+    :param scores: scores of the matrix columns (optional)
+    :return: KernelResult
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    input_rows = {}  # inputs: (rows, valid), calls with the same inputs share their rows
+    outputs, valid_masks = {}, {}
+    for call, function in (bound_calls or bind_calls(calls)):
+        inputs = tuple(call.inputs)
+        if inputs not in input_rows:
+            input_rows[inputs] = get_input_rows(matrix, list(indexes), inputs)
+        rows, valid = input_rows[inputs]
+        valid_masks[call.key] = valid
+        if not valid.any():
+            outputs[call.key] = ()
+            continue
+        output = function(*[rows[index] for index in inputs], **call.params)
+        outputs[call.key] = output if isinstance(output, (tuple, list)) else (output,)
+    return KernelResult(scores, valid_masks, outputs)
+
+
+def evaluate_many(matrices: np.ndarray, indexes: list, calls: list, scores: np.ndarray = None) -> list:
+    """
+    the same calls on many tickers stacked on the first axis, eg. the matrices of PriceStorage.query_ohlcv_many()
+
+    :param matrices: 3d float64 array of shape (tickers, len(indexes), periods)
+    :return: list of KernelResult, one per ticker
+    """
+    bound_calls = bind_calls(calls)
+    return [evaluate(matrix, indexes, calls, scores, bound_calls) for matrix in matrices]
+
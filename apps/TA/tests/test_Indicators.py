@@ -142,6 +142,46 @@ class IndicatorsTestCase(TestCase):
 
     # END INDICATORS
 
+    def test_context_matches_direct_query(self):
+        from apps.TA.indicators.overlap.sma import SmaStorage
+        from apps.TA.storages.abstract.indicator_context import IndicatorContext
+
+        indexes = ["high_price", "low_price", "close_price"]
+
+        # setUp saves each index after the other, the arrays need all indexes at the same timestamps
+        timestamp = self.last_price_storage.unix_timestamp
+        for _ in range(PERIODS_24HR):
+            timestamp += 300
+            for index in indexes:
+                PriceStorage(ticker=ticker, exchange=exchange, index=index, timestamp=timestamp,
+                             value=np.random.random()).save()
+
+        context = IndicatorContext(ticker, exchange, timestamp, periods=PERIODS_24HR)
+
+        for periods in [12, 48, 288]:
+            direct = SmaStorage(ticker=ticker, exchange=exchange, timestamp=timestamp)
+            shared = SmaStorage(ticker=ticker, exchange=exchange, timestamp=timestamp, context=context)
+            direct_arrays = direct.get_denoted_price_arrays(indexes, periods)
+            shared_arrays = shared.get_denoted_price_arrays(indexes, periods)
+            for index in indexes:
+                self.assertEqual(len(direct_arrays[index]), periods)
+                np.testing.assert_array_equal(direct_arrays[index], shared_arrays[index])
+
+        self.assertEqual(context.redis_round_trips, 1)
+
+    def test_sweep_subscriber(self):
+        from apps.TA.indicators.overlap.sma import SmaStorage, SmaSubscriber
+        from apps.TA.storages.abstract.indicator_subscriber import IndicatorsSweepSubscriber
+
+        subscriber = IndicatorsSweepSubscriber(indicator_subscriber_classes=[SmaSubscriber])
+        subscriber()
+        self.last_price_storage.save(publish=True)
+        time.sleep(0.1)
+        subscriber()
+        subscriber()
+
+        self.assertTrue(len(database.keys(f"*{ticker}:{exchange}:{SmaStorage.__name__}*")))
+
     def tearDown(self):
         for key in database.keys(f"*:{ticker}:*"):
             database.delete(key)
@@ -0,0 +1,60 @@
+import numpy as np
+from django.test import TestCase
+
+from apps.TA import JAN_1_2017_TIMESTAMP
+from apps.TA.storages.data.price import PriceStorage
+from apps.TA.storages.data.pv_history import PriceVolumeHistoryStorage, default_indexes, ohlcv_indexes
+from apps.TA.storages.utils.pv_resampling import generate_pv_storages, resample_pv_block, resample_pv_values
+from settings.redis_db import database
+
+ticker = "CWC_ETH"
+exchange = "binance"
+score = 10
+
+
+class PvResamplingTestCase(TestCase):
+
+    def setUp(self):
+        np.random.seed(2017)
+        self.history = {index: 1000 + np.random.randint(0, 500, 5) for index in default_indexes}
+
+        for minute in range(5):
+            for index in default_indexes:
+                PriceVolumeHistoryStorage(
+                    ticker=ticker, exchange=exchange, index=index,
+                    timestamp=JAN_1_2017_TIMESTAMP + 300 * (score - 1) + 60 * (minute + 1),
+                    value=int(self.history[index][minute])
+                ).save()
+
+    def test_resample_values(self):
+        resampled_values = resample_pv_values({"close_price": np.array([3, 1, 2]),
+                                               "high_price": np.array([4, 5]),
+                                               "close_volume": np.array([7, 8])})
+        self.assertEqual(resampled_values["close_price"], 2)
+        self.assertEqual(resampled_values["high_price"], 5)
+        self.assertEqual(resampled_values["close_volume"], 8)
+        self.assertEqual(resampled_values["midpoint_price"], 3)
+        self.assertEqual(resampled_values["mean_price"], 3)
+        self.assertNotIn("open_price", resampled_values)
+
+    def test_block_matches_generate_pv_storages(self):
+        timestamp = JAN_1_2017_TIMESTAMP + 300 * score
+
+        for index in default_indexes:
+            generate_pv_storages(ticker, exchange, index, score)
+        _, legacy_matrix = PriceStorage.query_ohlcv(ticker, exchange, timestamp, periods=1, indexes=ohlcv_indexes)
+
+        for key in database.keys(f"{ticker}:{exchange}:*Storage:*"):
+            if b"PriceVolumeHistoryStorage" not in key:
+                database.delete(key)
+
+        self.assertTrue(resample_pv_block(ticker, exchange, score))
+        _, matrix = PriceStorage.query_ohlcv(ticker, exchange, timestamp, periods=1, indexes=ohlcv_indexes)
+        np.testing.assert_array_equal(matrix, legacy_matrix)
+
+    def test_empty_block_is_not_resampled(self):
+        self.assertFalse(resample_pv_block(ticker, exchange, score + 10))
+
+    def tearDown(self):
+        for key in database.keys(f"{ticker}:{exchange}:*"):
+            database.delete(key)
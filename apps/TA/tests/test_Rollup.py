@@ -0,0 +1,66 @@
+import numpy as np
+from django.test import TestCase
+
+from apps.TA import JAN_1_2017_TIMESTAMP, HORIZONS, PERIODS_1HR
+from apps.TA.storages.data.price import PriceStorage
+from apps.TA.storages.data.pv_history import ohlcv_indexes
+from apps.TA.storages.data.rollup import RollupStorage, RollupException, update_rollups, backfill_rollups
+from apps.TA.storages.data.volume import VolumeStorage
+from settings.redis_db import database
+
+ticker = "CWC_ETH"
+exchange = "binance"
+periods = 300
+
+
+class RollupTestCase(TestCase):
+
+    def setUp(self):
+        np.random.seed(2017)
+        self.values = {index: 1000 + np.random.randint(0, 500, periods + 1) for index in ohlcv_indexes}
+        self.last_timestamp = JAN_1_2017_TIMESTAMP + 300 * periods
+
+        for score in range(1, periods + 1):
+            for index in ohlcv_indexes:
+                storage_class = VolumeStorage if index == "close_volume" else PriceStorage
+                storage_class(ticker=ticker, exchange=exchange, index=index,
+                              timestamp=JAN_1_2017_TIMESTAMP + 300 * score,
+                              value=int(self.values[index][score])).save()
+                update_rollups(ticker, exchange, index, score, int(self.values[index][score]))
+
+    def test_first_hour_bar(self):
+        scores, matrix = RollupStorage.query_bars(ticker, exchange, PERIODS_1HR,
+                                                  JAN_1_2017_TIMESTAMP + 300 * PERIODS_1HR, bars=1)
+        self.assertEqual(list(scores), [PERIODS_1HR])
+        self.assertEqual(list(matrix[:, 0]), [
+            self.values["open_price"][1],
+            self.values["high_price"][1:13].max(),
+            self.values["low_price"][1:13].min(),
+            self.values["close_price"][12],
+            self.values["close_volume"][12],
+        ])
+
+    def test_backfill_matches_updates(self):
+        updated_bars = {
+            horizon: RollupStorage.query_bars(ticker, exchange, horizon, self.last_timestamp, bars=periods // horizon + 1)
+            for horizon in HORIZONS
+        }
+        for key in database.keys(f"{ticker}:{exchange}:RollupStorage:*"):
+            database.delete(key)
+
+        backfill_rollups(ticker, exchange, self.last_timestamp, periods)
+
+        for horizon in HORIZONS:
+            scores, matrix = RollupStorage.query_bars(ticker, exchange, horizon, self.last_timestamp,
+                                                      bars=periods // horizon + 1)
+            np.testing.assert_array_equal(scores, updated_bars[horizon][0])
+            np.testing.assert_array_equal(matrix, updated_bars[horizon][1])
+
+    def test_bar_timestamp_must_end_a_bar(self):
+        rollup = RollupStorage(ticker=ticker, exchange=exchange, horizon=PERIODS_1HR, index="close_price",
+                               timestamp=JAN_1_2017_TIMESTAMP + 300, value=1000)
+        self.assertRaises(RollupException, rollup.save)
+
+    def tearDown(self):
+        for key in database.keys(f"{ticker}:{exchange}:*"):
+            database.delete(key)
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+from django.test import TestCase
+
+from apps.TA import JAN_1_2017_TIMESTAMP
+from apps.TA.storages.data.price import PriceStorage
+from apps.TA.storages.data.pv_history import ohlcv_indexes
+from apps.TA.storages.data.volume import VolumeStorage
+from apps.TA.storages.utils.bulk_restore import resample_minutes_to_5min, save_5min_periods, MINUTE_COLUMNS
+from apps.TA.storages.utils.pv_resampling import resample_pv_values
+from settings.redis_db import database
+
+ticker = "CWC_ETH"
+exchange = "binance"
+
+
+class BulkRestoreTestCase(TestCase):
+
+    def setUp(self):
+        np.random.seed(2017)
+        minutes_count = 300
+        close_prices = np.random.randint(1000, 1010, minutes_count).astype(np.float64)
+        self.minutes = pd.DataFrame({
+            "timestamp": JAN_1_2017_TIMESTAMP + 60 * np.arange(1, minutes_count + 1),
+            "open_price": close_prices + np.random.randint(-2, 3, minutes_count),
+            "high_price": close_prices + 3,
+            "low_price": close_prices - 3,
+            "close_price": close_prices,
+            "close_volume": np.random.random(minutes_count),
+        }, columns=MINUTE_COLUMNS)
+        self.minutes.loc[::7, "close_price"] = np.nan
+        self.minutes.loc[::11, "open_price"] = 0
+
+    def test_resample_matches_pv_resampling(self):
+        periods = resample_minutes_to_5min(self.minutes)
+        self.assertEqual(len(periods), 60)
+
+        for timestamp, period_values in periods.iterrows():
+            in_period = self.minutes[(self.minutes["timestamp"] > timestamp - 300 + 29) &
+                                     (self.minutes["timestamp"] <= timestamp + 29)]
+            index_values = {}
+            for index in MINUTE_COLUMNS[1:]:
+                values = in_period[index].values
+                index_values[index] = values[~np.isnan(values) & (values > 0)]
+
+            for index, value in resample_pv_values(index_values).items():
+                self.assertAlmostEqual(period_values[index], value, msg=f"{index} at {timestamp}")
+
+    def test_save_5min_periods(self):
+        periods = resample_minutes_to_5min(self.minutes)
+        values_count = save_5min_periods(ticker, exchange, periods)
+        self.assertEqual(values_count, int(periods.count().sum()))
+
+        scores, matrix = PriceStorage.query_ohlcv(ticker, exchange, int(periods.index[-1]), len(periods))
+        np.testing.assert_allclose(matrix, periods[ohlcv_indexes].values.T)
+
+    def tearDown(self):
+        for storage_class in [PriceStorage, VolumeStorage]:
+            storage_class.unregister_keys(list(storage_class.get_registered_keys(exchange=exchange)))
+        for key in database.keys(f"{ticker}:{exchange}:*"):
+            database.delete(key)
@@ -0,0 +1,66 @@
+from unittest import mock
+
+import numpy as np
+from django.test import TestCase
+
+from apps.TA import JAN_1_2017_TIMESTAMP, PERIODS_1HR, PERIODS_24HR
+from apps.TA.storages.data.price import PriceStorage
+from apps.TA.storages.data.rollup import RollupStorage
+from apps.TA.storages.utils.memory_cleaner import compact_price_history
+from settings.redis_db import database
+
+ticker = "CWC_ETH"
+exchange = "binance"
+periods = 3 * PERIODS_24HR
+retention_days = 30
+
+
+class CompactionTestCase(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch("apps.TA.storages.data.rollup.PRICE_5MIN_RETENTION_DAYS", retention_days)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        for score in range(1, periods + 1):
+            PriceStorage(ticker=ticker, exchange=exchange, index="close_price",
+                         timestamp=JAN_1_2017_TIMESTAMP + 300 * score, value=1000 + score).save()
+
+        # the first 2 days are past the 5min retention
+        now_timestamp = JAN_1_2017_TIMESTAMP + (retention_days + 2) * 24 * 3600
+        compact_price_history(now_timestamp)
+        self.compaction_score = 2 * PERIODS_24HR
+
+    def test_5min_values_replaced_by_bars(self):
+        close_price_key = f"{ticker}:{exchange}:PriceStorage:close_price"
+        self.assertEqual(database.zrange(close_price_key, 0, 0, withscores=True)[0][1], self.compaction_score + 1)
+
+        bar_scores, bar_matrix = RollupStorage.query_bars(ticker, exchange, PERIODS_1HR,
+                                                          JAN_1_2017_TIMESTAMP + 300 * periods,
+                                                          bars=periods // PERIODS_1HR, indexes=["close_price"])
+        compacted = bar_scores <= self.compaction_score
+        self.assertEqual(list(bar_matrix[0][compacted]), list(1000.0 + bar_scores[compacted]))
+
+    def test_queries_stitch_tiers(self):
+        scores, matrix = PriceStorage.query_ohlcv(ticker, exchange, JAN_1_2017_TIMESTAMP + 300 * periods, periods,
+                                                  indexes=["close_price"])
+        # compacted periods hold the close of their 1hr bar
+        hour_bar_scores = -(-scores // PERIODS_1HR) * PERIODS_1HR
+        expected = np.where(scores <= self.compaction_score, 1000 + hour_bar_scores, 1000 + scores)
+        np.testing.assert_array_equal(matrix[0], expected)
+
+        # query() returns 5min periods only, no bars
+        query_results = PriceStorage.query(ticker=ticker, exchange=exchange, index="close_price",
+                                           timestamp=JAN_1_2017_TIMESTAMP + 300 * periods, periods_range=periods)
+        self.assertEqual(query_results['values_count'], periods - self.compaction_score)
+        self.assertEqual(query_results['values'][0], str(1000 + self.compaction_score + 1))
+
+    def test_no_compaction_by_default(self):
+        with mock.patch("apps.TA.storages.data.rollup.PRICE_5MIN_RETENTION_DAYS", 0):
+            self.assertEqual(compact_price_history(JAN_1_2017_TIMESTAMP + 300 * periods), 0)
+
+    def tearDown(self):
+        for storage_class in [PriceStorage, RollupStorage]:
+            storage_class.unregister_keys(list(storage_class.get_registered_keys(exchange=exchange)))
+        for key in database.keys(f"{ticker}:{exchange}:*"):
+            database.delete(key)
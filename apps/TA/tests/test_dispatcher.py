@@ -0,0 +1,24 @@
+import json
+
+from django.test import SimpleTestCase
+
+from apps.TA.storages.utils.dispatcher import get_shard
+
+
+def message(key: str) -> bytes:
+    return json.dumps({"key": key, "name": "176760000:1.0", "score": "1.0"}).encode("utf-8")
+
+
+class DispatcherTestCase(SimpleTestCase):
+
+    def test_ticker_events_share_a_shard(self):
+        shard = get_shard(message("ETH_BTC:binance:PriceStorage:close_price"), 8)
+        self.assertIn(shard, range(8))
+        self.assertEqual(get_shard(message("ETH_BTC:binance:VolumeStorage:close_volume"), 8), shard)
+
+    def test_tickers_spread_over_shards(self):
+        shards = {get_shard(message(f"T{i}_BTC:binance:PriceStorage:close_price"), 4) for i in range(100)}
+        self.assertEqual(shards, {0, 1, 2, 3})
+
+    def test_bad_message_goes_to_first_shard(self):
+        self.assertEqual(get_shard(b"not json", 4), 0)
@@ -0,0 +1,68 @@
+import numpy as np
+from django.test import SimpleTestCase
+
+from apps.TA import JAN_1_2017_TIMESTAMP
+
+ticker = "CWC_ETH"
+exchange = "binance"
+
+
+class IncrementalIndicatorsTestCase(SimpleTestCase):
+    """
+    stepping the recursive state over a price series gives the same value as talib over the same series
+    """
+
+    def setUp(self):
+        np.random.seed(2017)
+        self.close_prices = 1000 + np.cumsum(np.random.randn(600))
+
+    def assert_matches_talib(self, storage_class, periods):
+        storage = storage_class(ticker=ticker, exchange=exchange, timestamp=JAN_1_2017_TIMESTAMP + 300)
+        arrays = {"close_price": self.close_prices}
+
+        state = {}
+        for i in range(len(self.close_prices)):
+            storage.advance_state(state, arrays, i, periods)
+
+        incremental_value = storage.value_from_state(state, periods)
+        full_value = storage.compute_value_with_requisite_indexes(arrays, periods)
+        np.testing.assert_allclose(
+            np.array(incremental_value.split(":"), dtype=np.float64),
+            np.array(full_value.split(":"), dtype=np.float64),
+            rtol=1e-9
+        )
+
+    def test_ema(self):
+        from apps.TA.indicators.overlap.ema import EmaStorage
+        self.assert_matches_talib(EmaStorage, 30)
+
+    def test_dema(self):
+        from apps.TA.indicators.overlap.dema import DemaStorage
+        self.assert_matches_talib(DemaStorage, 30)
+
+    def test_tema(self):
+        from apps.TA.indicators.overlap.tema import TemaStorage
+        self.assert_matches_talib(TemaStorage, 30)
+
+    def test_kama(self):
+        from apps.TA.indicators.overlap.kama import KamaStorage
+        self.assert_matches_talib(KamaStorage, 30)
+
+    def test_trix(self):
+        from apps.TA.indicators.momentum.trix import TrixStorage
+        self.assert_matches_talib(TrixStorage, 30)
+
+    def test_macd(self):
+        from apps.TA.indicators.momentum.macd import MacdStorage
+        self.assert_matches_talib(MacdStorage, 26)
+
+    def test_rsi(self):
+        from apps.TA.indicators.momentum.rsi import RsiStorage
+        self.assert_matches_talib(RsiStorage, 1)
+
+    def test_rsi_saved_under_horizons(self):
+        from apps.TA import HORIZONS
+        from apps.TA.indicators.momentum.rsi import RsiStorage
+        self.assertEqual(RsiStorage.get_periods_list(), set(HORIZONS))
+        storage = RsiStorage(ticker=ticker, exchange=exchange, timestamp=JAN_1_2017_TIMESTAMP + 300, periods=12)
+        self.assertEqual(storage.get_rsi_timeperiod(), 12 * 14)
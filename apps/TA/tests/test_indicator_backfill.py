@@ -0,0 +1,123 @@
+from unittest import mock
+
+import numpy as np
+from django.test import TestCase
+
+from apps.TA import JAN_1_2017_TIMESTAMP
+from apps.TA.indicators.overlap.sma import SmaStorage
+from apps.TA.indicators.overlap.ema import EmaStorage
+from apps.TA.storages.data.price import PriceStorage
+from apps.TA.storages.utils.indicator_backfill import backfill_ticker, get_backfill_storage_classes
+from settings.redis_db import database
+
+ticker = "SNM_ETH"  # not shared with other tests, backfill reads the whole history
+exchange = "binance"
+periods = min(SmaStorage.get_periods_list())  # 108
+
+
+def assert_values_close(test_case, first_value, second_value, rtol=1e-9):
+    test_case.assertEqual(bool(first_value), bool(second_value))
+    if first_value:
+        np.testing.assert_allclose(np.array(first_value.split(":"), dtype=np.float64),
+                                   np.array(second_value.split(":"), dtype=np.float64), rtol=rtol)
+
+
+class IndicatorBackfillTestCase(TestCase):
+
+    def setUp(self):
+        np.random.seed(2017)
+        self.close_prices = 1000 + np.cumsum(np.random.randn(300))
+        self.gap_score = 150  # no price for this period
+        for score, close_price in enumerate(self.close_prices, start=1):
+            if score != self.gap_score:
+                PriceStorage(ticker=ticker, exchange=exchange, index="close_price",
+                             timestamp=JAN_1_2017_TIMESTAMP + 300 * score, value=close_price).save()
+
+    def test_series_match_window_values(self):
+        from apps.TA.indicators.overlap.bbands import BbandsStorage
+        from apps.TA.indicators.momentum.macd import MacdStorage
+        arrays = {"close_price": self.close_prices}
+
+        for storage_class in [SmaStorage, BbandsStorage]:
+            storage = storage_class(ticker=ticker, exchange=exchange, timestamp=JAN_1_2017_TIMESTAMP + 300)
+            series = storage.compute_series_with_requisite_indexes(arrays, periods)
+            for i in [periods - 2, periods - 1, len(self.close_prices) - 1]:
+                window = {"close_price": self.close_prices[max(0, i + 1 - periods):i + 1]}
+                assert_values_close(self, series[i], storage.compute_value_with_requisite_indexes(window, periods))
+
+        for storage_class in [EmaStorage, MacdStorage]:
+            storage = storage_class(ticker=ticker, exchange=exchange, timestamp=JAN_1_2017_TIMESTAMP + 300)
+            # recursive values converge once the history is several times longer than periods
+            series = storage.compute_series_with_requisite_indexes(arrays, 26)
+            state = {}
+            for i in range(len(self.close_prices)):
+                storage.advance_state(state, arrays, i, 26)
+            assert_values_close(self, series[-1], storage.value_from_state(state, 26))
+
+    def test_single_call_indicators_backfilled(self):
+        storage_class_names = [storage_class.__name__ for storage_class in get_backfill_storage_classes()]
+        for storage_class_name in ["CciStorage", "WillrStorage", "StochStorage", "StochfStorage", "AroonStorage",
+                                   "AroonOscStorage", "MomStorage", "RocStorage", "RocpStorage", "RocrStorage",
+                                   "MfiStorage", "UltoscStorage", "MidpriceStorage", "TrimaStorage", "DemaStorage",
+                                   "TemaStorage", "KamaStorage", "TrixStorage", "BopStorage", "CmoStorage", "DxStorage"]:
+            self.assertIn(storage_class_name, storage_class_names)
+
+    def test_talib_function_series_match_window_values(self):
+        random = np.random.RandomState(7)
+        close_prices = 1000 + np.cumsum(random.randn(2000))
+        arrays = {
+            "open_price": close_prices + random.randn(2000), "close_price": close_prices,
+            "high_price": close_prices + np.abs(random.randn(2000)) + 1,
+            "low_price": close_prices - np.abs(random.randn(2000)) - 1,
+            "close_volume": np.abs(random.randn(2000)) * 1000,
+        }
+
+        for storage_class in get_backfill_storage_classes():
+            if not storage_class.talib_function:
+                continue
+            storage = storage_class(ticker=ticker, exchange=exchange, timestamp=JAN_1_2017_TIMESTAMP + 300)
+            storage_periods = min(storage_class.get_periods_list())
+            inputs = {index: arrays[index] for index in storage_class.requisite_pv_indexes}
+            series = storage.compute_series_with_requisite_indexes(inputs, storage_periods)
+            self.assertEqual(len(series), 2000)
+            self.assertTrue(series[-1], storage_class.__name__)
+            self.assertEqual(len(series[-1].split(":")), len(storage_class.value_names))
+            if not storage_class.recursive:
+                lookback = storage.get_lookback(storage_periods)
+                window = {index: values[-lookback:] for index, values in inputs.items()}
+                # wilder smoothed values converge over the warm up
+                assert_values_close(self, series[-1],
+                                    storage.compute_value_with_requisite_indexes(window, storage_periods),
+                                    rtol=1e-3 if hasattr(storage_class, "warmup") else 1e-9)
+
+    def test_subscriber_handles_declared_indexes(self):
+        from apps.TA.indicators.momentum.cci import CciStorage, CciSubscriber
+        subscriber = CciSubscriber(subscribe=False)
+        subscriber.ticker, subscriber.exchange, subscriber.timestamp = ticker, exchange, JAN_1_2017_TIMESTAMP + 300
+        with mock.patch.object(CciStorage, "compute_and_save_all_values_for_timestamp") as compute_and_save:
+            for subscriber.key_suffix in ["high_price", "low_price", "close_price"]:
+                subscriber.handle("PriceStorage", {})
+        compute_and_save.assert_called_once_with(ticker, exchange, JAN_1_2017_TIMESTAMP + 300, context=None)
+
+    def test_backfill_skips_gaps_and_resumes(self):
+        values_count = backfill_ticker(ticker, exchange, [SmaStorage])
+        self.assertGreater(values_count, 0)
+        self.assertEqual(backfill_ticker(ticker, exchange, [SmaStorage]), 0)
+
+        sma_scores = [int(score) for member, score in database.zrange(
+            f"{ticker}:{exchange}:SmaStorage:{periods}", 0, -1, withscores=True)]
+        self.assertEqual(sma_scores[0], periods)
+        self.assertNotIn(self.gap_score, sma_scores)
+        self.assertNotIn(self.gap_score + periods - 1, sma_scores)
+        self.assertIn(self.gap_score + periods, sma_scores)
+
+        sma = SmaStorage(ticker=ticker, exchange=exchange, timestamp=JAN_1_2017_TIMESTAMP + 300 * 300, periods=periods)
+        saved_value = sma.query(ticker=ticker, exchange=exchange, timestamp=sma.unix_timestamp,
+                                periods_key=periods)['values'][-1]
+        assert_values_close(self, saved_value, sma.compute_value(periods))
+
+    def tearDown(self):
+        for storage_class in [PriceStorage, SmaStorage]:
+            storage_class.unregister_keys(list(storage_class.get_registered_keys(exchange=exchange)))
+        for key in database.keys(f"{ticker}:{exchange}:*"):
+            database.delete(key)
@@ -0,0 +1,64 @@
+from unittest import mock
+
+import numpy as np
+from django.test import TestCase
+
+from apps.TA import JAN_1_2017_TIMESTAMP
+from apps.TA.indicators.overlap.sma import SmaStorage
+from apps.TA.storages.abstract.indicator import BULLISH
+from apps.TA.storages.abstract.indicator_context import IndicatorContext
+from apps.TA.storages.data.price import PriceStorage
+from settings.redis_db import database
+
+ticker = "CWC_ETH"
+exchange = "binance"
+
+
+class SignalingSmaStorage(SmaStorage):
+    class_periods_list = [1]
+
+    def produce_signal(self):
+        self.send_signal(trend=BULLISH)
+
+
+prices_count = max(SignalingSmaStorage.get_periods_list())
+
+
+class IndicatorBatchTestCase(TestCase):
+
+    def setUp(self):
+        pipeline = database.pipeline(transaction=False)
+        for score in range(1, prices_count + 1):
+            PriceStorage(ticker=ticker, exchange=exchange, index="close_price",
+                         timestamp=JAN_1_2017_TIMESTAMP + 300 * score, value=1000 + score).save(pipeline=pipeline)
+        pipeline.execute()
+        self.timestamp = JAN_1_2017_TIMESTAMP + 300 * prices_count
+
+    def test_values_saved_and_signals_batched(self):
+        context = IndicatorContext(ticker, exchange, self.timestamp)
+        with mock.patch("apps.TA.storages.abstract.indicator.Signal.objects") as signal_objects, \
+                mock.patch("apps.TA.storages.abstract.indicator.EMIT_SIGNALS", False):
+            signal_objects.bulk_create.side_effect = lambda signals: signals
+            values_count = SignalingSmaStorage.compute_and_save_all_values_for_timestamp(
+                ticker, exchange, self.timestamp, context=context)
+
+        periods_list = SignalingSmaStorage.get_periods_list()
+        self.assertEqual(values_count, len(periods_list))
+        signal_objects.create.assert_not_called()
+        signal_objects.bulk_create.assert_called_once()
+        signals = signal_objects.bulk_create.call_args[0][0]
+        self.assertEqual(sorted(signal.resample_period for signal in signals),
+                         sorted(periods * 5 for periods in periods_list))
+        self.assertTrue(all(signal.price == 1000 + prices_count for signal in signals))
+
+        for periods in periods_list:
+            saved_value = SignalingSmaStorage.query(ticker=ticker, exchange=exchange, timestamp=self.timestamp,
+                                                    periods_key=periods)['values'][-1]
+            self.assertAlmostEqual(float(saved_value), np.mean(1000 + np.arange(prices_count - periods + 1,
+                                                                                prices_count + 1)))
+
+    def tearDown(self):
+        for storage_class in [PriceStorage, SignalingSmaStorage]:
+            storage_class.unregister_keys(list(storage_class.get_registered_keys(exchange=exchange)))
+        for key in database.keys(f"{ticker}:{exchange}:*"):
+            database.delete(key)
@@ -0,0 +1,103 @@
+from unittest import mock
+
+import numpy as np
+import talib
+from django.test import TestCase
+
+from apps.TA import JAN_1_2017_TIMESTAMP
+from apps.TA.indicators.momentum.adx import AdxSubscriber
+from apps.TA.indicators.momentum.adxr import AdxrStorage, AdxrSubscriber
+from apps.TA.indicators.momentum.ppo import PpoStorage
+from apps.TA.indicators.momentum.rsi import RsiStorage, RsiSubscriber
+from apps.TA.indicators.momentum.stochrsi import StochrsiStorage, StochrsiSubscriber
+from apps.TA.storages.abstract.indicator_context import IndicatorContext
+from apps.TA.storages.abstract.indicator_graph import IndicatorGraph, IndicatorGraphException
+from apps.TA.storages.abstract.indicator_subscriber import IndicatorSubscriber
+from apps.TA.storages.data.price import PriceStorage
+from settings.redis_db import database
+
+ticker = "CWC_ETH"
+exchange = "binance"
+prices_count = 600
+
+
+class IndicatorGraphTestCase(TestCase):
+
+    def setUp(self):
+        np.random.seed(2017)
+        close_prices = 1000 + np.cumsum(np.random.randn(prices_count))
+        self.prices = {
+            "close_price": close_prices,
+            "high_price": close_prices + np.random.rand(prices_count),
+            "low_price": close_prices - np.random.rand(prices_count),
+            "open_price": close_prices,
+        }
+        pipeline = database.pipeline(transaction=False)
+        for index, values in self.prices.items():
+            for score, value in enumerate(values, 1):
+                PriceStorage(ticker=ticker, exchange=exchange, index=index,
+                             timestamp=JAN_1_2017_TIMESTAMP + 300 * score, value=value).save(pipeline=pipeline)
+        pipeline.execute()
+        self.timestamp = JAN_1_2017_TIMESTAMP + 300 * prices_count
+
+    def test_topological_order(self):
+        graph = IndicatorGraph([StochrsiSubscriber, AdxrSubscriber, RsiSubscriber, AdxSubscriber])
+        self.assertEqual([node.name for node in graph.nodes],
+                         ["RsiSubscriber", "AdxSubscriber", "StochrsiSubscriber", "AdxrSubscriber"])
+        self.assertEqual(graph.nodes[3].pv_inputs, ["close_price", "high_price", "low_price"])
+
+        class CycleStorage(RsiStorage):
+            pass
+        CycleStorage.requisite_indicators = [CycleStorage]
+
+        class CycleSubscriber(IndicatorSubscriber):
+            storage_class = CycleStorage
+
+        with self.assertRaises(IndicatorGraphException):
+            IndicatorGraph([CycleSubscriber])
+
+    def test_shared_requisite_arrays(self):
+        context = IndicatorContext(ticker, exchange, self.timestamp, periods=prices_count)
+        close, high, low = self.prices["close_price"], self.prices["high_price"], self.prices["low_price"]
+
+        stochrsi = StochrsiStorage(ticker=ticker, exchange=exchange, timestamp=self.timestamp, context=context)
+        fastk, fastd = talib.STOCHRSI(close, timeperiod=14, fastk_period=5, fastd_period=3, fastd_matype=0)
+        np.testing.assert_allclose(np.array(stochrsi.compute_value(14).split(":"), dtype=np.float64),
+                                   [fastk[-1], fastd[-1]], rtol=1e-9)
+
+        adxr = AdxrStorage(ticker=ticker, exchange=exchange, timestamp=self.timestamp, context=context)
+        self.assertAlmostEqual(float(adxr.compute_value(14)), talib.ADXR(high, low, close, timeperiod=14)[-1])
+
+        ppo = PpoStorage(ticker=ticker, exchange=exchange, timestamp=self.timestamp, context=context)
+        self.assertAlmostEqual(float(ppo.compute_value(26)), talib.PPO(close, 12, 26, matype=0)[-1])
+
+        # computed once on the context, shared by every dependent
+        self.assertEqual(sorted(context.indicator_arrays),
+                         [("AdxStorage", 14), ("RsiStorage", 1), ("SmaStorage", 12), ("SmaStorage", 26)])
+        self.assertEqual(context.redis_round_trips, 1)
+
+    def test_unchanged_inputs_skipped(self):
+        graph = IndicatorGraph([StochrsiSubscriber, RsiSubscriber])
+        data = {"key": f"{ticker}:{exchange}:PriceStorage:close_price",
+                "name": f"{self.prices['close_price'][-1]}:{prices_count}", "score": str(prices_count)}
+
+        with mock.patch.object(IndicatorSubscriber, "handle") as handle:
+            results = graph.evaluate("PriceStorage", data, IndicatorContext(ticker, exchange, self.timestamp))
+            self.assertEqual(results, {"RsiSubscriber": True, "StochrsiSubscriber": True})
+
+            # the same close price again
+            results = graph.evaluate("PriceStorage", data, IndicatorContext(ticker, exchange, self.timestamp))
+            self.assertEqual(results, {"RsiSubscriber": False, "StochrsiSubscriber": False})
+
+            PriceStorage(ticker=ticker, exchange=exchange, index="close_price", timestamp=self.timestamp,
+                         value=self.prices["close_price"][-1] + 1).save()
+            results = graph.evaluate("PriceStorage", data, IndicatorContext(ticker, exchange, self.timestamp))
+            self.assertEqual(results, {"RsiSubscriber": True, "StochrsiSubscriber": True})
+
+        self.assertEqual(handle.call_count, 4)
+
+    def tearDown(self):
+        for storage_class in [PriceStorage]:
+            storage_class.unregister_keys(list(storage_class.get_registered_keys(exchange=exchange)))
+        for key in database.keys(f"*{ticker}:{exchange}*"):
+            database.delete(key)
@@ -0,0 +1,55 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from apps.TA import JAN_1_2017_TIMESTAMP
+from apps.TA.management.commands.TA_migrate_key_layout import rename_keys
+from apps.TA.storages.data.price import PriceStorage
+from apps.TA.storages.utils.key_layout import get_ticker_key_prefix, split_ticker_key, convert_ticker_key
+from settings.redis_db import database
+
+ticker = "CWC_ETH"
+exchange = "binance"
+
+
+class KeyLayoutTestCase(TestCase):
+
+    def setUp(self):
+        with mock.patch("apps.TA.storages.utils.key_layout.REDIS_KEY_HASH_TAGS", False):
+            for score in [1, 2]:
+                PriceStorage(ticker=ticker, exchange=exchange, index="close_price",
+                             timestamp=JAN_1_2017_TIMESTAMP + 300 * score, value=1000 + score).save()
+
+    def test_key_helpers(self):
+        self.assertEqual(get_ticker_key_prefix(ticker, exchange, hash_tags=True), "{CWC_ETH:binance}")
+        self.assertEqual(get_ticker_key_prefix(ticker, exchange, hash_tags=False), "CWC_ETH:binance")
+        for key in ["CWC_ETH:binance:PriceStorage:close_price", b"{CWC_ETH:binance}:PriceStorage:close_price"]:
+            self.assertEqual(split_ticker_key(key), ["CWC_ETH", "binance", "PriceStorage", "close_price"])
+        self.assertEqual(convert_ticker_key("CWC_ETH:binance:PriceStorage:close_price"),
+                         "{CWC_ETH:binance}:PriceStorage:close_price")
+        self.assertEqual(convert_ticker_key("{CWC_ETH:binance}:PriceStorage:close_price"),
+                         "CWC_ETH:binance:PriceStorage:close_price")
+
+    def test_migrate_to_hash_tags(self):
+        plain_key = f"{ticker}:{exchange}:PriceStorage:close_price"
+        tagged_key = f"{{{ticker}:{exchange}}}:PriceStorage:close_price"
+
+        self.assertEqual(rename_keys([plain_key.encode("utf-8"), b"key_registry:PriceStorage:binance"], True), 1)
+        self.assertEqual(rename_keys([tagged_key.encode("utf-8")], True), 0)  # already migrated
+        self.assertFalse(database.exists(plain_key))
+        self.assertEqual(database.zcard(tagged_key), 2)
+
+        registered_keys = [key.decode("utf-8") for key in PriceStorage.get_registered_keys(exchange=exchange)]
+        self.assertIn(tagged_key, registered_keys)
+        self.assertNotIn(plain_key, registered_keys)
+
+        with mock.patch("apps.TA.storages.utils.key_layout.REDIS_KEY_HASH_TAGS", True):
+            self.assertEqual(PriceStorage.get_index_db_key(ticker, exchange, "close_price"), tagged_key)
+            query_results = PriceStorage.query(ticker=ticker, exchange=exchange, index="close_price",
+                                               timestamp=JAN_1_2017_TIMESTAMP + 600, periods_range=2)
+            self.assertEqual(query_results['values'], ["1001", "1002"])
+
+    def tearDown(self):
+        PriceStorage.unregister_keys(list(PriceStorage.get_registered_keys(exchange=exchange)))
+        for key in database.keys(f"*{ticker}:{exchange}*"):
+            database.delete(key)
@@ -0,0 +1,72 @@
+from django.test import TestCase
+
+from apps.TA import JAN_1_2017_TIMESTAMP
+from apps.TA.storages.abstract.timeseries_storage import forget_registered_keys
+from apps.TA.storages.data.price import PriceStorage
+from apps.TA.storages.utils.memory_cleaner import trim_registered_keys, delete_exchange_keys
+from settings.redis_db import database
+
+ticker = "CWC_ETH"
+exchange = "binance"
+other_exchange = "bittrex"
+
+
+class KeyRegistryTestCase(TestCase):
+
+    def setUp(self):
+        forget_registered_keys()  # other tests delete keys and registries without unregistering
+        for score, this_exchange in [(1, exchange), (2, exchange), (1, other_exchange)]:
+            PriceStorage(ticker=ticker, exchange=this_exchange, index="close_price",
+                         timestamp=JAN_1_2017_TIMESTAMP + 300 * score, value=1000 + score).save()
+        PriceStorage(ticker=ticker, exchange=exchange, index="open_price",
+                     timestamp=JAN_1_2017_TIMESTAMP + 300, value=1000).save()
+
+    def registered_keys(self, **kwargs):
+        return sorted(key.decode("utf-8") for key in PriceStorage.get_registered_keys(**kwargs)
+                      if key.decode("utf-8").startswith(ticker))
+
+    def test_save_registers_keys_by_exchange(self):
+        self.assertIn(exchange, PriceStorage.get_registered_exchanges())
+        self.assertEqual(self.registered_keys(exchange=exchange), [
+            f"{ticker}:{exchange}:PriceStorage:close_price",
+            f"{ticker}:{exchange}:PriceStorage:open_price",
+        ])
+        self.assertEqual(self.registered_keys(match="*:close_price"), [
+            f"{ticker}:{exchange}:PriceStorage:close_price",
+            f"{ticker}:{other_exchange}:PriceStorage:close_price",
+        ])
+
+    def test_registered_on_first_save_only(self):
+        price = PriceStorage(ticker=ticker, exchange=exchange, index="close_price",
+                             timestamp=JAN_1_2017_TIMESTAMP + 900, value=1003)
+        pipeline = price.save(pipeline=database.pipeline(transaction=False))
+        self.assertEqual(len(pipeline.execute()), 1)  # the zadd only
+
+    def test_registered_again_after_unregister(self):
+        db_key = f"{ticker}:{exchange}:PriceStorage:close_price"
+        PriceStorage.unregister_keys([db_key])
+        self.assertNotIn(db_key, self.registered_keys(exchange=exchange))
+
+        PriceStorage(ticker=ticker, exchange=exchange, index="close_price",
+                     timestamp=JAN_1_2017_TIMESTAMP + 900, value=1003).save()
+        self.assertIn(db_key, self.registered_keys(exchange=exchange))
+
+    def test_trim_unregisters_empty_keys(self):
+        trim_registered_keys(PriceStorage, 0, 1)
+
+        self.assertEqual(database.zcard(f"{ticker}:{exchange}:PriceStorage:close_price"), 1)
+        self.assertEqual(self.registered_keys(exchange=exchange), [f"{ticker}:{exchange}:PriceStorage:close_price"])
+        self.assertEqual(self.registered_keys(exchange=other_exchange), [])
+
+    def test_delete_exchange_keys(self):
+        delete_exchange_keys(other_exchange)
+
+        self.assertFalse(database.exists(f"{ticker}:{other_exchange}:PriceStorage:close_price"))
+        self.assertNotIn(other_exchange, PriceStorage.get_registered_exchanges())
+        self.assertEqual(len(self.registered_keys(exchange=exchange)), 2)
+
+    def tearDown(self):
+        for this_exchange in [exchange, other_exchange]:
+            PriceStorage.unregister_keys(list(PriceStorage.get_registered_keys(exchange=this_exchange)))
+            for key in database.keys(f"{ticker}:{this_exchange}:*"):
+                database.delete(key)
@@ -0,0 +1,66 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from apps.TA.management.commands.TA_migrate_encoding import migrate_key_encoding
+from apps.TA.storages.utils.member_codec import TEXT_ENCODING, PACKED_ENCODING, PACKED_MEMBER_SIZE, \
+    encode_member, decode_member, decode_members_to_arrays, is_packed_member
+from settings.redis_db import database
+
+
+class MemberCodecTestCase(SimpleTestCase):
+
+    def test_text_round_trip(self):
+        member = encode_member(9545225909, 176255.0, TEXT_ENCODING)
+        self.assertEqual(member, "9545225909:176255.0")
+        self.assertEqual(decode_member(member.encode("utf-8")), ("9545225909", "176255.0"))
+
+    def test_text_keeps_multi_part_values(self):
+        member = encode_member("1.2:1.1:1.0", 176255, TEXT_ENCODING)
+        self.assertEqual(decode_member(member.encode("utf-8")), ("1.2:1.1:1.0", "176255"))
+
+    def test_packed_round_trip(self):
+        member = encode_member(9545225909, 176255.0, PACKED_ENCODING)
+        self.assertEqual(len(member), PACKED_MEMBER_SIZE)
+        self.assertTrue(is_packed_member(member))
+        self.assertEqual(decode_member(member), ("9545225909", "176255.0"))
+
+    def test_decode_arrays_for_each_encoding(self):
+        values, scores = [9545225909, 1.5, 42], [176255.0, 176256.0, 176257.0]
+        for encoding in [TEXT_ENCODING, PACKED_ENCODING]:
+            members = [encode_member(v, s, encoding) for v, s in zip(values, scores)]
+            members = [m.encode("utf-8") if isinstance(m, str) else m for m in members]
+            decoded_scores, decoded_values = decode_members_to_arrays(members)
+            self.assertEqual(list(decoded_scores), scores)
+            self.assertEqual(list(decoded_values), values)
+
+    def test_decode_arrays_for_mixed_encodings(self):
+        members = [encode_member(10, 1.0, PACKED_ENCODING), b"20:2.0", encode_member(30, 3.0, PACKED_ENCODING)]
+        decoded_scores, decoded_values = decode_members_to_arrays(members)
+        self.assertEqual(list(decoded_scores), [1.0, 2.0, 3.0])
+        self.assertEqual(list(decoded_values), [10, 20, 30])
+
+    def test_decode_arrays_empty(self):
+        decoded_scores, decoded_values = decode_members_to_arrays([])
+        self.assertEqual(len(decoded_scores), 0)
+        self.assertEqual(len(decoded_values), 0)
+
+
+class MigrateEncodingTestCase(TestCase):
+    db_key = "CWC_ETH:binance:PriceStorage:migrate_test"
+
+    def test_every_member_rewritten_once(self):
+        scores = [1.0, 2.0, 2.0, 2.0, 3.0, 4.0, 5.0]  # a run of equal scores across the chunk boundary
+        for value, score in enumerate(scores):
+            database.zadd(self.db_key, encode_member(value, score, TEXT_ENCODING), score)
+
+        with mock.patch("apps.TA.management.commands.TA_migrate_encoding.CHUNK_SIZE", 2):
+            self.assertEqual(migrate_key_encoding(self.db_key, PACKED_ENCODING), len(scores))
+
+        members = database.zrangebyscore(self.db_key, "-inf", "+inf")
+        self.assertTrue(all(is_packed_member(member) for member in members))
+        decoded_scores, decoded_values = decode_members_to_arrays(members)
+        self.assertEqual(sorted(decoded_values), list(range(len(scores))))
+
+    def tearDown(self):
+        database.delete(self.db_key)
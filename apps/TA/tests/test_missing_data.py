@@ -0,0 +1,48 @@
+from django.test import TestCase
+
+from apps.TA import JAN_1_2017_TIMESTAMP
+from apps.TA.storages.data.price import PriceStorage
+from apps.TA.storages.data.pv_history import PriceVolumeHistoryStorage, default_price_indexes
+from apps.TA.storages.utils.list_search import missing_ranges, contiguous_ranges, missing_elements
+from apps.TA.storages.utils.missing_data import find_missing_score_ranges, find_pv_storage_data_gaps
+from settings.redis_db import database
+
+ticker = "CWC_ETH"
+exchange = "binance"
+
+
+class MissingDataTestCase(TestCase):
+
+    def setUp(self):
+        # 5min periods 1 to 10, without 4, 5 and 8
+        for score in [1, 2, 3, 6, 7, 9, 10]:
+            PriceStorage(ticker=ticker, exchange=exchange, index="close_price",
+                         timestamp=JAN_1_2017_TIMESTAMP + 300 * score, value=1000 + score).save()
+
+        # minute history is still there for period 4 only
+        for minute in range(1, 6):
+            for index in default_price_indexes:
+                PriceVolumeHistoryStorage(ticker=ticker, exchange=exchange, index=index,
+                                          timestamp=JAN_1_2017_TIMESTAMP + 300 * 3 + 60 * minute,
+                                          value=2000 + minute).save()
+
+    def test_ranges(self):
+        scores = [1, 2, 3, 6, 7, 9, 10]
+        self.assertEqual(missing_ranges(scores), [(4, 5), (8, 8)])
+        self.assertEqual(contiguous_ranges(missing_elements(scores)), [(4, 5), (8, 8)])
+        self.assertEqual(contiguous_ranges([]), [])
+        self.assertEqual(find_missing_score_ranges(ticker, exchange, "close_price"), [(4, 5), (8, 8)])
+
+    def test_gaps_repaired_from_pv_history(self):
+        self.assertEqual(find_pv_storage_data_gaps(ticker, exchange, "close_price"), [5, 8])
+
+        close_price = PriceStorage.query(ticker=ticker, exchange=exchange, index="close_price",
+                                         timestamp=JAN_1_2017_TIMESTAMP + 300 * 4, timestamp_tolerance=0)
+        self.assertEqual(close_price['values'][-1], "2005")
+        self.assertEqual(find_missing_score_ranges(ticker, exchange, "close_price"), [(5, 5), (8, 8)])
+
+    def tearDown(self):
+        for storage_class in [PriceStorage, PriceVolumeHistoryStorage]:
+            storage_class.unregister_keys(list(storage_class.get_registered_keys(exchange=exchange)))
+        for key in database.keys(f"{ticker}:{exchange}:*"):
+            database.delete(key)
@@ -0,0 +1,92 @@
+import json
+from unittest import mock
+
+from django.test import TestCase
+
+from apps.TA import JAN_1_2017_TIMESTAMP
+from apps.TA.storages.data.price import PriceStorage
+from apps.TA.storages.utils.member_codec import TEXT_ENCODING
+from apps.TA.storages.utils.query_cache import QueryCache
+from settings.redis_db import database
+
+ticker = "CWC_ETH"
+exchange = "binance"
+close_price_key = f"{ticker}:{exchange}:PriceStorage:close_price"
+
+
+class QueryCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.query_cache = QueryCache(max_entries=10, max_bytes=10000, max_seconds=300)
+        self.patch = mock.patch("apps.TA.storages.abstract.timeseries_storage.query_cache", self.query_cache)
+        self.patch.start()
+        for score in [1, 2, 3]:
+            self.save_price(score)
+
+    def save_price(self, score):
+        PriceStorage(ticker=ticker, exchange=exchange, index="close_price",
+                     timestamp=JAN_1_2017_TIMESTAMP + 300 * score, value=1000 + score).save()
+
+    def query_values(self, score=4):
+        return PriceStorage.query(ticker=ticker, exchange=exchange, index="close_price",
+                                  timestamp=JAN_1_2017_TIMESTAMP + 300 * score, periods_range=4)['values']
+
+    def test_hits_and_published_appends(self):
+        self.assertEqual(self.query_values(), ["1001", "1002", "1003"])
+        self.assertEqual(self.query_values(), ["1001", "1002", "1003"])
+        self.assertEqual(self.query_cache.get_stats()["hits"], 1)
+
+        # saved by another process, only heard as a publish event, so only the cache has it
+        price = PriceStorage(ticker=ticker, exchange=exchange, index="close_price",
+                             timestamp=JAN_1_2017_TIMESTAMP + 300 * 4, value=1004)
+        event_data = json.loads(json.dumps(price.get_z_add_data(encoding=TEXT_ENCODING)))
+        self.query_cache.apply_published(event_data)
+        self.query_cache.apply_published(event_data)  # a second subscriber of the same process
+        self.assertEqual(self.query_values(), ["1001", "1002", "1003", "1004"])
+
+        stats = self.query_cache.get_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["appends"]), (2, 1, 1))
+        self.assertEqual(stats["hit_rate"], round(2 / 3, 4))
+
+    def test_invalidation_and_bounds(self):
+        self.query_values()
+        self.query_values(score=10)
+        self.assertEqual(self.query_cache.get_stats()["entries"], 2)
+
+        self.save_price(2)  # saved by this process, only the window holding score 2 is dropped
+        self.assertEqual(self.query_cache.get_stats()["entries"], 1)
+
+        self.query_cache.apply_published({"key": close_price_key, "name": "999:1.0", "score": "1.0"})
+        self.assertEqual(self.query_cache.get_stats()["entries"], 1)  # outside the cached window
+        self.query_values()
+        self.query_cache.apply_published({"key": close_price_key, "name": "999:1.0", "score": "1.0"})
+        self.assertEqual(self.query_cache.get_stats()["invalidations"], 2)  # an old score was updated
+
+        small_cache = QueryCache(max_entries=2, max_bytes=200, max_seconds=300)
+        for score in range(3):
+            small_cache.put(close_price_key, score, score + 1, [b"1000:1.0"], TEXT_ENCODING)
+        self.assertEqual(small_cache.get_stats()["entries"], 2)
+        self.assertIsNone(small_cache.get(close_price_key, 0, 1))  # least recently used
+        small_cache.put(close_price_key, 5, 6, [b"1000:1.0"] * 10, TEXT_ENCODING)
+        self.assertIsNone(small_cache.get(close_price_key, 5, 6))  # larger than max_bytes
+
+    def test_windows_on_5min_scores(self):
+        self.query_values()
+        values = PriceStorage.query(ticker=ticker, exchange=exchange, index="close_price",
+                                    timestamp=JAN_1_2017_TIMESTAMP + 300 * 4, periods_range=3.5)['values']
+        self.assertEqual(values, ["1001", "1002", "1003"])
+        self.assertEqual(self.query_cache.get_stats()["hits"], 1)  # the same periods, the same entry
+
+    def test_invalidated_after_pipeline_executes(self):
+        pipeline = database.pipeline(transaction=False)
+        PriceStorage(ticker=ticker, exchange=exchange, index="close_price",
+                     timestamp=JAN_1_2017_TIMESTAMP + 300 * 4, value=1004).save(pipeline=pipeline)
+        self.query_values()  # read between the save and the write
+        pipeline.execute()
+        self.assertEqual(self.query_values(), ["1001", "1002", "1003", "1004"])
+
+    def tearDown(self):
+        self.patch.stop()
+        PriceStorage.unregister_keys(list(PriceStorage.get_registered_keys(exchange=exchange)))
+        for key in database.keys(f"{ticker}:{exchange}:*"):
+            database.delete(key)
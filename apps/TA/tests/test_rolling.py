@@ -0,0 +1,86 @@
+import json
+from unittest import mock
+
+import numpy as np
+from django.test import TestCase
+
+from apps.TA import JAN_1_2017_TIMESTAMP
+from apps.TA.indicators.overlap.bbands import BbandsStorage, SQUEEZE_PERIODS
+from apps.TA.storages.utils.rolling import RollingState, RollingMinMax, RollingMeanStd, Crossover
+from settings.redis_db import database
+
+ticker = "CWC_ETH"
+exchange = "binance"
+
+
+class RollingTestCase(TestCase):
+
+    def test_matches_brute_force(self):
+        db_key = f"{ticker}:{exchange}:rolling:test"
+        random = np.random.RandomState(7)
+        scores = np.cumsum(random.randint(1, 3, 500))  # some gaps
+        values = random.normal(100, 10, 500)
+
+        for i, (score, value) in enumerate(zip(scores, values)):
+            rolling_state = RollingState.load(db_key)  # saved and loaded each time, as in produce_signal()
+            min_max = rolling_state.get("min_max", RollingMinMax, 30).update(score, value + random.normal(0, 20))
+            mean_std = rolling_state.get("mean_std", RollingMeanStd, 30).update(score, value + 1)
+            rolling_state.save()
+            rolling_state = RollingState.load(db_key)
+            # same score again replaces the value
+            min_max = rolling_state.get("min_max", RollingMinMax, 30).update(score, value)
+            mean_std = rolling_state.get("mean_std", RollingMeanStd, 30).update(score, value)
+            rolling_state.save()
+
+            window_values = values[:i + 1][scores[:i + 1] > score - 30]
+            self.assertEqual(min_max.min, window_values.min())
+            self.assertEqual(min_max.max, window_values.max())
+            self.assertAlmostEqual(mean_std.mean, window_values.mean(), places=6)
+            self.assertAlmostEqual(mean_std.std, window_values.std(), places=6)
+            self.assertEqual(min_max.is_full(), score - scores[0] >= 29)
+
+        database.delete(db_key)
+
+    def test_crossover(self):
+        crossover = Crossover()
+        crossed = [crossover.update(score, value, 10).crossed for score, value in enumerate([9, 11, 12, 10, 8, 9, 11])]
+        self.assertEqual(crossed, [0, 1, 0, 0, -1, 0, 1])
+
+    def test_crossover_overwrite(self):
+        crossover = Crossover().update(0, 9, 10)
+        self.assertEqual(crossover.update(1, 11, 10).crossed, 1)
+        self.assertEqual(crossover.update(1, 9, 10).crossed, 0)  # recomputed below, no cross after all
+        self.assertEqual(crossover.side, -1)
+        crossover = RollingState.stat_from_json(json.dumps(crossover.to_dict()))
+        self.assertEqual(crossover.update(1, 12, 10).crossed, 1)
+        self.assertEqual(crossover.update(2, 8, 10).crossed, -1)
+
+    def test_bbands_squeeze(self):
+        # width 0.2 then narrowing from the last SQUEEZE_PERIODS // 2 periods on
+        pipeline = database.pipeline(transaction=False)
+        for score in range(1, SQUEEZE_PERIODS + 1):
+            half_width = 10 - max(0, score - SQUEEZE_PERIODS // 2) * 0.1
+            bbands = BbandsStorage(ticker=ticker, exchange=exchange, timestamp=JAN_1_2017_TIMESTAMP + 300 * score,
+                                   periods=5)
+            bbands.value = f"{100 + half_width}:100:{100 - half_width}"
+            bbands.save(pipeline=pipeline, send_signals=False)
+        pipeline.execute()
+
+        bbands = BbandsStorage(ticker=ticker, exchange=exchange, periods=5,
+                               timestamp=JAN_1_2017_TIMESTAMP + 300 * SQUEEZE_PERIODS)
+        bbands.value = "101.0:100:99.0"  # as set by produce_signals()
+        with mock.patch.object(BbandsStorage, "send_signal") as send_signal, \
+                mock.patch.object(BbandsStorage, "get_signal_price", return_value=120):
+            bbands.produce_signal()  # seeds the rolling state from the saved bands
+            bbands.produce_signal()  # same period again, reads only the rolling state
+
+        self.assertEqual(send_signal.call_count, 2)
+        self.assertEqual(send_signal.call_args[1]["type"], "BBands")
+        width_range = RollingState.load(bbands.get_rolling_db_key()).get("width", RollingMinMax, SQUEEZE_PERIODS)
+        self.assertTrue(width_range.is_full())
+        self.assertAlmostEqual(width_range.max, 0.2)
+
+    def tearDown(self):
+        BbandsStorage.unregister_keys(list(BbandsStorage.get_registered_keys(exchange=exchange)))
+        for key in database.keys(f"*{ticker}:{exchange}*"):
+            database.delete(key)
@@ -0,0 +1,69 @@
+import json
+from unittest import mock
+
+from django.test import TestCase
+
+from apps.TA.storages.abstract.ticker_subscriber import TickerSubscriber
+from apps.TA.storages.utils import streams
+from settings.redis_db import database
+
+
+class StreamTestStorage:
+    pass
+
+
+class StreamTestSubscriber(TickerSubscriber):
+    classes_subscribing_to = [StreamTestStorage]
+
+    def handle(self, channel, data, *args, **kwargs):
+        if self.failing:
+            raise ValueError("failing on purpose")
+        self.handled.append((channel, data["name"]))
+
+
+stream_key = streams.get_stream_key(StreamTestStorage.__name__)
+group_name = StreamTestSubscriber.__name__
+
+
+def add_test_message(name: str):
+    streams.add_message(StreamTestStorage.__name__, json.dumps({"key": "key", "name": name, "score": "1.0"}))
+
+
+class StreamsTestCase(TestCase):
+
+    def new_subscriber(self, consumer_name: str, failing: bool = False):
+        with mock.patch("apps.TA.storages.abstract.ticker_subscriber.MESSAGE_TRANSPORT", "streams"), \
+                mock.patch.object(streams, "get_consumer_name", return_value=consumer_name):
+            subscriber = StreamTestSubscriber()
+        subscriber.handled, subscriber.failing = [], failing
+        return subscriber
+
+    def test_workers_share_and_ack_messages(self):
+        first_worker, second_worker = self.new_subscriber("first"), self.new_subscriber("second")
+        for name in ["a", "b", "c"]:
+            add_test_message(name)
+
+        self.assertEqual(first_worker.consume_streams(), 3)
+        self.assertEqual(second_worker.consume_streams(), 0)
+        self.assertEqual(first_worker.handled, [("StreamTestStorage", name) for name in ["a", "b", "c"]])
+        self.assertEqual(first_worker.get_lag()[stream_key]["pending"], 0)
+
+    def test_failed_message_is_claimed_by_another_worker(self):
+        dead_worker, live_worker = self.new_subscriber("dead", failing=True), self.new_subscriber("live")
+        add_test_message("a")
+        self.assertEqual(dead_worker.consume_streams(), 0)
+        self.assertEqual(streams.get_group_lag(stream_key, group_name)["pending"], 1)
+
+        with mock.patch.object(streams, "STREAM_CLAIM_IDLE_MS", 0):
+            self.assertEqual(live_worker.consume_streams(), 1)
+        self.assertEqual(live_worker.handled, [("StreamTestStorage", "a")])
+        self.assertEqual(streams.get_group_lag(stream_key, group_name)["pending"], 0)
+
+    def test_stream_keys_share_a_slot_on_cluster(self):
+        with mock.patch.object(streams, "REDIS_CLUSTER", True):
+            stream_keys = [streams.get_stream_key(class_name) for class_name in ["PriceStorage", "VolumeStorage"]]
+        # Redis Cluster hashes the part in braces only
+        self.assertEqual([key[key.index("{") + 1:key.index("}")] for key in stream_keys], ["stream", "stream"])
+
+    def tearDown(self):
+        database.delete(stream_key)
@@ -0,0 +1,118 @@
+from unittest import mock
+
+import numpy as np
+import talib
+from django.test import TestCase
+
+from apps.TA import JAN_1_2017_TIMESTAMP
+from apps.TA.indicators.overlap.bbands import BbandsStorage
+from apps.TA.indicators.overlap.sma import SmaStorage
+from apps.TA.storages.abstract.indicator_context import IndicatorContext
+from apps.TA.storages.data.price import PriceStorage
+from apps.TA.storages.utils import indicator_backfill, talib_kernel
+from settings.redis_db import database
+
+tickers = ["CWC_ETH", "CWC_BTC"]
+exchange = "binance"
+prices_count = 300
+
+
+class KernelSmaStorage(SmaStorage):
+    class_periods_list = [1]  # 12, 48 and 288 periods
+
+    def produce_signal(self):
+        pass
+
+
+class TalibKernelTestCase(TestCase):
+
+    def setUp(self):
+        np.random.seed(2017)
+        pipeline = database.pipeline(transaction=False)
+        for ticker in tickers:
+            for score, value in enumerate(1000 + np.cumsum(np.random.randn(prices_count)), 1):
+                if score == prices_count - 30:
+                    continue  # a gap, inside the 48 and 288 windows only
+                PriceStorage(ticker=ticker, exchange=exchange, index="close_price",
+                             timestamp=JAN_1_2017_TIMESTAMP + 300 * score, value=value).save(pipeline=pipeline)
+        pipeline.execute()
+        self.timestamp = JAN_1_2017_TIMESTAMP + 300 * prices_count
+
+    def test_evaluate(self):
+        matrix = np.random.rand(2, 100)
+        matrix[1, 50] = np.nan
+        calls = [talib_kernel.KernelCall("sma", "SMA", ["close_price"], dict(timeperiod=10), 10),
+                 talib_kernel.KernelCall("bbands", "BBANDS", ["close_price"], dict(timeperiod=5), 5)]
+        result = talib_kernel.evaluate(matrix, ["high_price", "close_price"], calls)
+
+        close_prices = np.delete(matrix[1], 50)
+        np.testing.assert_array_equal(result.outputs["sma"][0], talib.SMA(close_prices, timeperiod=10))
+        self.assertEqual(len(result.outputs["bbands"]), 3)
+        self.assertEqual(result.get_value(calls[0]), str(talib.SMA(close_prices, timeperiod=10)[-1]))
+        self.assertFalse(result.is_complete(calls[0]._replace(window=60)))  # the window holds the gap
+
+    def test_same_values_as_compute_value(self):
+        context = IndicatorContext(tickers[0], exchange, self.timestamp, periods=prices_count,
+                                   kernel_calls=BbandsStorage.get_kernel_calls())
+        storage = KernelSmaStorage(ticker=tickers[0], exchange=exchange, timestamp=self.timestamp, context=context)
+        kernel_values = storage.compute_kernel_values()
+
+        self.assertEqual(sorted(kernel_values), [12, 48, 288])
+        for periods, value in kernel_values.items():
+            # the rolling sums of talib over the longer window may differ in the last digit
+            computed_value = storage.compute_value(periods)
+            self.assertEqual(bool(value), bool(computed_value))
+            if value:
+                self.assertAlmostEqual(float(value), float(computed_value), places=9)
+        self.assertEqual(kernel_values[48], "")  # gap in the window, no value, same as compute_value()
+        self.assertIn(("BbandsStorage", 60), context.kernel_values)  # evaluated in the same pass
+        self.assertEqual(context.redis_round_trips, 1)
+
+    def test_matrix_sliced_to_longest_window(self):
+        context = IndicatorContext(tickers[0], exchange, self.timestamp, periods=prices_count)
+        storage = KernelSmaStorage(ticker=tickers[0], exchange=exchange, timestamp=self.timestamp, context=context)
+        with mock.patch.object(talib_kernel, "evaluate", wraps=talib_kernel.evaluate) as evaluate:
+            storage.compute_kernel_values()
+        matrix, indexes, calls, scores = evaluate.call_args[0]
+        self.assertEqual(matrix.shape[1], 288)
+        self.assertEqual(scores[-1], context.scores[-1])
+
+    def test_evaluate_many(self):
+        matrices = np.random.rand(3, 2, 100)
+        matrices[1, 1, 50] = np.nan
+        calls = [talib_kernel.KernelCall("sma", "SMA", ["close_price"], dict(timeperiod=10), 10),
+                 talib_kernel.KernelCall("bbands", "BBANDS", ["close_price"], dict(timeperiod=5), 5)]
+        results = talib_kernel.evaluate_many(matrices, ["high_price", "close_price"], calls)
+
+        self.assertEqual(len(results), 3)
+        for matrix, result in zip(matrices, results):
+            expected = talib_kernel.evaluate(matrix, ["high_price", "close_price"], calls)
+            for call in calls:
+                for output, expected_output in zip(result.outputs[call.key], expected.outputs[call.key]):
+                    np.testing.assert_array_equal(output, expected_output)
+                self.assertEqual(result.get_value(call), expected.get_value(call))
+
+    def test_many_tickers(self):
+        ticker_exchanges = [(ticker, exchange) for ticker in tickers]
+        self.assertEqual(KernelSmaStorage.compute_and_save_all_values_for_tickers(ticker_exchanges, self.timestamp), 2)
+
+        for ticker in tickers:
+            storage = KernelSmaStorage(ticker=ticker, exchange=exchange, timestamp=self.timestamp)
+            saved = KernelSmaStorage.query(ticker=ticker, exchange=exchange, timestamp=self.timestamp,
+                                           periods_key=12)['values']
+            self.assertAlmostEqual(float(saved[-1]), float(storage.compute_value(12)), places=3)
+
+    def test_compute_all_tickers(self):
+        with mock.patch.object(indicator_backfill, "get_backfill_storage_classes", return_value=[KernelSmaStorage]), \
+                mock.patch.object(indicator_backfill, "TICKERS_BATCH_SIZE", 1), \
+                mock.patch.object(KernelSmaStorage, "compute_and_save_all_values_for_tickers",
+                                  wraps=KernelSmaStorage.compute_and_save_all_values_for_tickers) as compute:
+            self.assertEqual(indicator_backfill.compute_all_tickers(self.timestamp), 2)
+        self.assertEqual(compute.call_count, 2)  # one batch per ticker
+
+    def tearDown(self):
+        for storage_class in [PriceStorage, KernelSmaStorage]:
+            storage_class.unregister_keys(list(storage_class.get_registered_keys(exchange=exchange)))
+        for ticker in tickers:
+            for key in database.keys(f"*{ticker}:{exchange}*"):
+                database.delete(key)
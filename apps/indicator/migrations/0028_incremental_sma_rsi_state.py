@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.1 on 2026-10-18 12:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('indicator', '0027_priceresampl_volume_variance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rsi',
+            name='average_down',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='rsi',
+            name='average_up',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='rsi',
+            name='ewm_weight',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='sma',
+            name='close_price_sum',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='sma',
+            name='high_price_sum',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='sma',
+            name='midpoint_price_sum',
+            field=models.FloatField(null=True),
+        ),
+    ]
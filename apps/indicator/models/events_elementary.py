@@ -11,9 +11,7 @@ if LOAD_TALIB:
 
 from django.db import models
 from apps.indicator.models.abstract_indicator import AbstractIndicator
-from apps.indicator.models.price_resampl import get_n_last_resampl_df
-from apps.indicator.models.sma import get_n_last_sma_df
-from apps.indicator.models.rsi import Rsi
+from apps.indicator.pair_context import PairContext
 from apps.signal.models.signal import Signal
 
 from apps.user.models.user import get_horizon_value_from_string
@@ -87,9 +85,14 @@ VBI_VOLUME_PERIOD = 50
 VBI_PRICE_CROSS_PERCENT = 0.02  # TODO just for the time being it is here, should move later
 VBI_VOLUME_CROSS_PERCENT = 0.02
 
+# resampled prices and sma records read back in time by check_events
+LAST_RECORDS = ichi_displacement * ichi_displacement + 10
+SMA_LOW, SMA_HIGH = [50, 200]
+EVENTS_SMA_PERIODS = sorted({SMA_LOW, SMA_HIGH, VBI_PRICE_PERIOD})
 
 
-def _process_ai_simple(horizon, ann_classif_df, **kwargs):
+
+def _process_ai_simple(horizon, context, ann_classif_df, **kwargs):
     '''
     very simple strategy: emit signal anytime it changes state from up to down
     '''
@@ -122,7 +125,7 @@ def _process_ai_simple(horizon, ann_classif_df, **kwargs):
                 event_name="ann_price_2class_simple",
                 event_value= -int(df.iloc[-1]['class_change']),
             )
-            if MODIFY_DB: new_instance.save()
+            if MODIFY_DB: context.save(new_instance)
             logger.debug("   >>> ANN event detected and saved")
 
             signal_ai = Signal(
@@ -144,7 +147,7 @@ def _process_ai_simple(horizon, ann_classif_df, **kwargs):
         logger.debug("   ... no AI event generated (predicts no changes in price")
 
 
-def _process_ai_anomaly(horizon, ann_classif_df, **kwargs):
+def _process_ai_anomaly(horizon, context, ann_classif_df, **kwargs):
     '''
     yet another strategy based on ai indicator
     '''
@@ -182,7 +185,7 @@ def _process_ai_anomaly(horizon, ann_classif_df, **kwargs):
                 event_name="ann_price_anomaly",
                 event_value=p,
             )
-            if MODIFY_DB: new_instance.save()
+            if MODIFY_DB: context.save(new_instance)
 
             signal_ai = Signal(
                 **kwargs,
@@ -208,12 +211,12 @@ def _process_ai_anomaly(horizon, ann_classif_df, **kwargs):
 
 
 
-def _process_rsi(horizon, **kwargs)->int:
+def _process_rsi(horizon, context, **kwargs)->int:
     '''
     at every time point get the last fresh RSI value, check the brackets of RSI
     and if we are less 25 or more 75 save this as an event in events and emit an RSI signal
     '''
-    rs_obj = Rsi.objects.filter(**kwargs).last()
+    rs_obj = context.get_rsi_object()
 
     if (rs_obj is not None):
         rsi_bracket = rs_obj.get_rsi_bracket_value() # get current rsi object
@@ -226,7 +229,7 @@ def _process_rsi(horizon, **kwargs)->int:
                     event_value = rsi_bracket,
                     event_second_value = rs_obj.rsi,
                 )
-                if MODIFY_DB: new_instance.save()  # save if not in DEBUG mode
+                if MODIFY_DB: context.save(new_instance)  # save if not in DEBUG mode
                 logger.debug("   >>> RSI bracket event detected and saved")
 
                 if EMIT_RSI:
@@ -251,7 +254,7 @@ def _process_rsi(horizon, **kwargs)->int:
         return False
 
 
-def _process_sma_crossovers(horizon, prices_df, **kwargs):
+def _process_sma_crossovers(horizon, context, prices_df, **kwargs):
     '''
     check if at given moment of time there is an SMA crossover event
     if so, emit a signal
@@ -288,7 +291,7 @@ def _process_sma_crossovers(horizon, prices_df, **kwargs):
                     event_name=event_name,
                     event_value=int(1),
                 )
-                if MODIFY_DB: sma_event.save()
+                if MODIFY_DB: context.save(sma_event)
             except Exception as e:
                 logger.error(" #Error saving SMA elementary event ")
 
@@ -311,7 +314,7 @@ def _process_sma_crossovers(horizon, prices_df, **kwargs):
                     logger.error(" #Error firing SMA signal ")
 
 
-def _process_ben_volume_based(horizon, price_volume_df, **kwargs):
+def _process_ben_volume_based(horizon, context, price_volume_df, **kwargs):
     # DESCRIPTION of indicator:
     # if price crosses the mean by some percent AND volume is already greater than mean by some other percent)
     # OR (volume crosses the mean by some percent AND price is already greater than mean by some other
@@ -347,7 +350,7 @@ def _process_ben_volume_based(horizon, price_volume_df, **kwargs):
                     event_name=event_name,
                     event_value=int(1),
                 )
-                if MODIFY_DB: ben_event.save()
+                if MODIFY_DB: context.save(ben_event)
             except Exception as e:
                 logger.error(" #Error saving Ben elementary event ")
 
@@ -369,37 +372,29 @@ class EventsElementary(AbstractIndicator):
 
 
     @staticmethod
-    def check_events(cls, **kwargs):
+    def check_events(cls, context=None, **kwargs):
         horizon = get_horizon_value_from_string(display_string=HORIZONS_TIME2NAMES[kwargs['resample_period']])
-
-        # create a param dict to pass inside get_n_last_resampl_df
-        no_time_params = {
-            'source' : kwargs['source'],
-            'transaction_currency' : kwargs['transaction_currency'],
-            'counter_currency' : kwargs['counter_currency'],
-            'resample_period' : kwargs['resample_period']
-        }
-
+        # resampled prices and sma of the pair, read once for all the events
+        context = context or PairContext(**kwargs)
 
         # load nessesary resampled prices from price resampled
         # we only need last_records back in time
-        last_records = ichi_displacement * ichi_displacement + 10
-        prices_df = get_n_last_resampl_df(last_records, **no_time_params)
+        last_records = LAST_RECORDS
+        prices_df = context.get_resampl_df(last_records)
         prices_df = prices_df.fillna(value=0)
 
         logger.info('   ::::  Start analysing ELEMENTARY events ::::')
 
         ############## check for RSI events, save and emit signal
         logger.info("   ... Check RSI Events: ")
-        _process_rsi(horizon, **kwargs)
+        _process_rsi(horizon, context, **kwargs)
 
 
         ############## check SMA cross over events
         logger.info("   ... Check SMA Events: ")
-        SMA_LOW, SMA_HIGH = [50,200]
 
-        sma_low_df = get_n_last_sma_df(last_records, SMA_LOW, **no_time_params).tail(10)
-        sma_high_df = get_n_last_sma_df(last_records, SMA_HIGH, **no_time_params).tail(10)
+        sma_low_df = context.get_sma_df(last_records, SMA_LOW).tail(10)
+        sma_high_df = context.get_sma_df(last_records, SMA_HIGH).tail(10)
         small_prices_df = prices_df.tail(10).copy()
 
         # form a small price dataframe and add SMA to price dataframe
@@ -411,14 +406,14 @@ class EventsElementary(AbstractIndicator):
 
 
         # todo - add return value, and say if any crossovers have happend
-        _process_sma_crossovers(horizon, small_prices_df, **kwargs)
+        _process_sma_crossovers(horizon, context, small_prices_df, **kwargs)
         
 
         ############### check Ben Volume Based events ###############
         logger.info("   ... Check Ben Elementary Events: ")
 
         if RUN_BEN and kwargs['resample_period'] <= MEDIUM: # can't handle volume data for 1440 until we use PriceHistory
-            prices_avg = get_n_last_sma_df(last_records, VBI_PRICE_PERIOD, **no_time_params)
+            prices_avg = context.get_sma_df(last_records, VBI_PRICE_PERIOD)
 
             # TODO: read resampled volumes from the DB when they're live
             volumes_avg = talib.SMA(np.array(prices_df['close_volume'], dtype=float),
@@ -427,7 +422,7 @@ class EventsElementary(AbstractIndicator):
 
             prices_df = prices_df.join(prices_avg).dropna()
 
-            _process_ben_volume_based(horizon, prices_df, **kwargs)
+            _process_ben_volume_based(horizon, context, prices_df, **kwargs)
 
 
         ############## calculate and save ICHIMOKU elementary events
@@ -543,7 +538,7 @@ class EventsElementary(AbstractIndicator):
                         event_name=event_name,
                         event_value=int(1),
                     )
-                    if MODIFY_DB: ichi_event.save()
+                    if MODIFY_DB: context.save(ichi_event)
                 except Exception as e:
                     logger.error(" Error saving  " + event_name + " elementary event ")
         logger.info(" || Ichi calculation completed, " + str(horizon) + " in time " + str(time.time() - ichi_start_time))
@@ -561,8 +556,8 @@ class EventsElementary(AbstractIndicator):
                 logger.error('  get_n_last_ann: something wrong with AI indicators... we dont have it ...')
             else:
                 logger.info("   ... Check  AI Elementary Events for PERIOD: " + str(kwargs['resample_period']))
-                _process_ai_simple(horizon, ann_classif_df, **kwargs)
-                _process_ai_anomaly(horizon, ann_classif_df, **kwargs)
+                _process_ai_simple(horizon, context, ann_classif_df, **kwargs)
+                _process_ai_anomaly(horizon, context, ann_classif_df, **kwargs)
         else:
             logger.info("   ... ANN elementary event calculation has been skipped")
 
@@ -584,8 +579,15 @@ def get_current_elementory_events_df(timestamp, source, transaction_currency, co
         transaction_currency=transaction_currency,
         counter_currency=counter_currency,
         resample_period=resample_period,
-    ).order_by('-timestamp').values('timestamp','event_name','event_value'))
+    ).order_by('-timestamp').values(*EVENTS_DF_FIELDS))
+
+    return elementory_events_df_from_records(last_events)
+
+
+EVENTS_DF_FIELDS = ['timestamp', 'event_name', 'event_value']
+
 
+def elementory_events_df_from_records(last_events)->pd.DataFrame:
     # convert several records into one line of dataFrame
     df = pd.DataFrame()
     if last_events:
@@ -3,8 +3,8 @@ from settings import HORIZONS_TIME2NAMES, LONG, MODIFY_DB
 
 from apps.indicator.models.abstract_indicator import AbstractIndicator
 from apps.signal.models.signal import Signal
-from apps.indicator.models.events_elementary import get_current_elementory_events_df, get_last_ever_entered_elementory_events_df
-from apps.indicator.models.rsi import Rsi
+from apps.indicator.models.events_elementary import get_last_ever_entered_elementory_events_df
+from apps.indicator.pair_context import PairContext
 from apps.user.models.user import get_horizon_value_from_string
 
 import pandas as pd
@@ -19,14 +19,15 @@ class EventsLogical(AbstractIndicator):
     event_value = models.IntegerField(null=True)
 
     @staticmethod
-    def check_events(cls, **kwargs):
+    def check_events(cls, context=None, **kwargs):
         resample_period = kwargs['resample_period']
+        context = context or PairContext(**kwargs)
         horizon = get_horizon_value_from_string(display_string=HORIZONS_TIME2NAMES[resample_period])
 
         logger.info('   ::::  Start analysing LOGICAL events ::::')
         # get all elementory events
         # always one line!
-        last_events_df = get_current_elementory_events_df(**kwargs)
+        last_events_df = context.get_current_events_df()
 
         if not last_events_df.empty:
             ###################### Ichi kumo breakout UP
@@ -49,7 +50,7 @@ class EventsLogical(AbstractIndicator):
                         event_name='kumo_breakout_up_signal',
                         event_value=int(1),
                     )
-                    if MODIFY_DB: kumo_event_up.save()   # do not modify DB in debug mode
+                    if MODIFY_DB: context.save(kumo_event_up)   # do not modify DB in debug mode
 
                     signal_kumo_up = Signal(
                         **kwargs,
@@ -86,7 +87,7 @@ class EventsLogical(AbstractIndicator):
                         event_name='kumo_breakout_down_signal',
                         event_value=int(1),
                     )
-                    if MODIFY_DB: kumo_event_down.save()
+                    if MODIFY_DB: context.save(kumo_event_down)
 
                     signal_kumo_down = Signal(
                         **kwargs,
@@ -118,7 +119,7 @@ class EventsLogical(AbstractIndicator):
             long_period_events_df = get_last_ever_entered_elementory_events_df(**long_param_dict)
 
             # get last rsi object for current period
-            rs_obj = Rsi.objects.filter(**kwargs).last()
+            rs_obj = context.get_rsi_object()
 
             # add a long period signal to the current signals
             if not long_period_events_df.empty:
@@ -153,7 +154,7 @@ class EventsLogical(AbstractIndicator):
                             event_value= rs_obj.rsi
                             #np.sign(last_events_df['rsi_bracket'].tail(1).values[0]),
                         )
-                        if MODIFY_DB: rsi_cum_up.save()
+                        if MODIFY_DB: context.save(rsi_cum_up)
 
                         signal_rsi_cum_up = Signal(
                             **kwargs,
@@ -181,7 +182,7 @@ class EventsLogical(AbstractIndicator):
                             event_value= rs_obj.rsi
                             #np.sign(last_events_df['rsi_bracket'].tail(1).values[0]),
                         )
-                        if MODIFY_DB: rsi_cum_down.save()
+                        if MODIFY_DB: context.save(rsi_cum_down)
 
                         signal_rsi_cum_down = Signal(
                             **kwargs,
@@ -232,7 +233,7 @@ class EventsLogical(AbstractIndicator):
                         event_name='ben_volume_based_buy',
                         event_value=int(1),
                     )
-                    if MODIFY_DB: ben_buy.save()
+                    if MODIFY_DB: context.save(ben_buy)
 
                     signal_ben_buy = Signal(
                         **kwargs,
@@ -1,7 +1,7 @@
 from datetime import timedelta, datetime
 import numpy as np
 import pandas as pd
-from django.db import models
+from django.db import models, connection
 from apps.indicator.models.abstract_indicator import AbstractIndicator
 from apps.indicator.models.price_history import PriceHistory
 import time
@@ -67,7 +67,7 @@ class PriceResampl(AbstractIndicator):
                 counter_currency=self.counter_currency,
                 timestamp__lte=datetime_now,   # TODO: PriceHistory.timestamp is of DateTime type... not timestamp
                 timestamp__gte=datetime_now - timedelta(minutes=self.resample_period)
-            ).values('timestamp', 'close', 'volume').order_by('-timestamp'))
+            ).values('timestamp', 'close', 'volume').order_by('timestamp'))  # open is the first price of the period
 
         # skip the currency if there is no given price
         if transaction_currency_price_list:
@@ -94,6 +94,80 @@ class PriceResampl(AbstractIndicator):
             return False
 
 
+# one row per pair of a source: first/last values over the window of each pair, then aggregates over its rows
+# the timestamp range filter lets postgres skip the PriceHistory partitions outside the window
+RESAMPLE_ALL_PAIRS_SQL = '''
+    SELECT transaction_currency, counter_currency,
+           min(first_close), min(last_close), min(close), max(close), avg(close), var_pop(close),
+           min(first_volume), min(last_volume), min(volume), max(volume), var_pop(volume)
+    FROM (
+        SELECT transaction_currency, counter_currency, close, volume,
+               first_value(close) OVER pair_window AS first_close,
+               last_value(close) OVER pair_window AS last_close,
+               first_value(volume) OVER pair_window AS first_volume,
+               last_value(volume) OVER pair_window AS last_volume
+        FROM {table}
+        WHERE source = %s AND timestamp >= %s AND timestamp <= %s AND close IS NOT NULL
+        WINDOW pair_window AS (
+            PARTITION BY transaction_currency, counter_currency ORDER BY timestamp
+            ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+        )
+    ) AS window_prices
+    GROUP BY transaction_currency, counter_currency
+'''
+
+
+def resample_all_pairs(source, resample_period, timestamp, pairs=None, save=True) -> list:
+    '''
+    Set-based PriceResampl.compute() for all the pairs of a source in one query,
+    instead of one query and one numpy pass per pair
+
+    :param timestamp: unix timestamp of the end of the resample window, as for PriceResampl.compute()
+    :param pairs: (transaction_currency, counter_currency) pairs to keep, all the pairs with prices if None
+    :param save: bulk_create the records
+    :return: list of PriceResampl, one per pair with prices in the window
+    '''
+    datetime_now = datetime.utcfromtimestamp(timestamp)  # PriceHistory.timestamp is stored in UTC
+    with connection.cursor() as cursor:
+        cursor.execute(
+            RESAMPLE_ALL_PAIRS_SQL.format(table=PriceHistory._meta.db_table),
+            [source, datetime_now - timedelta(minutes=resample_period), datetime_now]
+        )
+        rows = cursor.fetchall()
+
+    pairs = set(map(tuple, pairs)) if pairs is not None else None
+    resampled_prices = []
+    for (transaction_currency, counter_currency,
+         open_price, close_price, low_price, high_price, mean_price, price_variance,
+         open_volume, close_volume, low_volume, high_volume, volume_variance) in rows:
+        if pairs is not None and (transaction_currency, counter_currency) not in pairs:
+            continue
+        resampled_prices.append(PriceResampl(
+            source=source,
+            transaction_currency=transaction_currency,
+            counter_currency=counter_currency,
+            resample_period=resample_period,
+            timestamp=timestamp,
+            open_price=int(open_price),
+            close_price=int(close_price),
+            low_price=int(low_price),
+            high_price=int(high_price),
+            midpoint_price=int((high_price + low_price) / 2),
+            mean_price=int(mean_price),
+            price_variance=float(price_variance),
+            # the aggregates skip missing volumes, all of them may be missing
+            open_volume=float(open_volume) if open_volume is not None else None,
+            close_volume=float(close_volume) if close_volume is not None else None,
+            low_volume=float(low_volume) if low_volume is not None else None,
+            high_volume=float(high_volume) if high_volume is not None else None,
+            volume_variance=float(volume_variance) if volume_variance is not None else None,
+        ))
+
+    if save and resampled_prices:
+        PriceResampl.objects.bulk_create(resampled_prices)
+    return resampled_prices
+
+
 ############## get n last records from resampled table as a DataFrame
 # NOTE: no kwargs because we dont have timestamp here
 def get_n_last_resampl_df(n, source, transaction_currency, counter_currency, resample_period)->pd.DataFrame:
@@ -104,8 +178,17 @@ def get_n_last_resampl_df(n, source, transaction_currency, counter_currency, res
         transaction_currency=transaction_currency,
         counter_currency=counter_currency,
         timestamp__gte = datetime.now() - timedelta(minutes=resample_period * n)
-    ).values('timestamp', 'low_price', 'high_price', 'close_price', 'midpoint_price','mean_price','price_variance','close_volume','volume_variance').order_by('-timestamp'))
+    ).values(*RESAMPL_DF_FIELDS).order_by('-timestamp'))
+
+    return resampl_df_from_records(last_prices)
+
+
+RESAMPL_DF_FIELDS = ['timestamp', 'low_price', 'high_price', 'close_price', 'midpoint_price', 'mean_price',
+                     'price_variance', 'close_volume', 'volume_variance']
+
 
+def resampl_df_from_records(last_prices)->pd.DataFrame:
+    # the frame of get_n_last_resampl_df() from its records, newest first
     df = pd.DataFrame()
     if last_prices:
         # todo - reverse order or make sure I get values in the same order!
@@ -1,15 +1,25 @@
 from django.db import models
 from apps.indicator.models.abstract_indicator import AbstractIndicator
 from apps.indicator.models import price_resampl
+from apps.indicator.pair_context import PairContext
 from settings import MODIFY_DB
 import numpy as np
 import logging
 
 logger = logging.getLogger(__name__)
 
+RSI_COM = 14  # center of mass of the up/down EWMAs
+RSI_UPDATE_RECORDS = 5  # resampled records to update the previous averages from
+
+
 class Rsi(AbstractIndicator):
     relative_strength = models.FloatField(null=True)  # relative strength
 
+    # EWMA state to update the next period from, relative_strength = average_up / average_down
+    average_up = models.FloatField(null=True)
+    average_down = models.FloatField(null=True)
+    ewm_weight = models.FloatField(null=True)  # sum of the weights of the adjusted EWMAs
+
     class Meta:
         indexes = [
             models.Index(fields=['transaction_currency', 'counter_currency', 'source', 'resample_period']),
@@ -48,18 +58,32 @@ class Rsi(AbstractIndicator):
         return rsi_strength
 
 
-    def compute_rs(self)->float:
+    def compute_rs(self, context=None)->float:
         '''
         Relative Strength calculation.
         The RSI is calculated a a property, we only save RS
         (RSI is a momentum oscillator that measures the speed and change of price movements.)
+        The averages of the previous period are updated with the newest close price if there was no gap since,
+        else they are computed again over all the close prices
+        :param context: PairContext to read the resampled prices and the previous Rsi from
         :return:
         '''
-
-        resampl_price_df = price_resampl.get_n_last_resampl_df(
-            20 * self.resample_period,
-            self.source, self.transaction_currency, self.counter_currency, self.resample_period
-        )
+        previous_rsi = None
+        if context is not None:
+            previous_rsis = context.get_previous_indicators(Rsi)
+            previous_rsi = previous_rsis[0] if previous_rsis else None
+        if previous_rsi is not None and previous_rsi.ewm_weight is not None:
+            close_prices = context.get_resampl_df(RSI_UPDATE_RECORDS).close_price
+            if close_prices.size >= 2 and self.update_rs(previous_rsi, close_prices.iloc[-1] - close_prices.iloc[-2]):
+                return self.relative_strength
+
+        if context is not None:
+            resampl_price_df = context.get_resampl_df(20 * self.resample_period)
+        else:
+            resampl_price_df = price_resampl.get_n_last_resampl_df(
+                20 * self.resample_period,
+                self.source, self.transaction_currency, self.counter_currency, self.resample_period
+            )
 
         resampl_close_price_ts = resampl_price_df.close_price
         logger.debug( '  RSI:   current period=' + str(self.resample_period) + ', close prices available for that period=' + str(resampl_close_price_ts.size))
@@ -75,12 +99,19 @@ class Rsi(AbstractIndicator):
 
             # Calculate the 14 period back EWMA for each up/down trends
             # QUESTION: shall this 14 perid depends on period 15,60, 360?
-            roll_up = up.ewm(com = 14, min_periods=3).mean()
-            roll_down = np.abs(down.ewm(com = 14, min_periods=3).mean())
+            roll_up = up.ewm(com = RSI_COM, min_periods=3).mean()
+            roll_down = np.abs(down.ewm(com = RSI_COM, min_periods=3).mean())
 
             rs_ts = roll_up / roll_down
 
             self.relative_strength = float(rs_ts.tail(1))  # get the last element for the last time point
+
+            # state of the adjusted EWMAs, the weights of the missing deltas are left out as pandas does
+            if not np.isnan(self.relative_strength):
+                decay = 1 - 1 / (1 + RSI_COM)
+                weights = decay ** np.arange(delta.size - 1, -1, -1)
+                self.average_up, self.average_down = float(roll_up.iloc[-1]), float(roll_down.iloc[-1])
+                self.ewm_weight = float(weights[delta.notnull().values].sum())
             return self.relative_strength
         else:
             logger.debug(':RSI was not calculated:: Not enough closing prices')
@@ -88,15 +119,35 @@ class Rsi(AbstractIndicator):
             return None
 
 
+    def update_rs(self, previous_rsi, delta)->bool:
+        '''
+        O(1) update of the averages of the previous period with the newest close price difference,
+        same as compute_rs() over all the close prices
+        :return: False if the difference is missing, the averages have to be computed again
+        '''
+        if np.isnan(delta):
+            return False
+        decay = 1 - 1 / (1 + RSI_COM)
+        previous_weight = decay * previous_rsi.ewm_weight
+        self.ewm_weight = 1 + previous_weight
+        self.average_up = (max(delta, 0) + previous_weight * previous_rsi.average_up) / self.ewm_weight
+        self.average_down = (max(-delta, 0) + previous_weight * previous_rsi.average_down) / self.ewm_weight
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.relative_strength = float(np.float64(self.average_up) / self.average_down)
+        return True
+
+
     @staticmethod
-    def compute_all(cls, **kwargs):
+    def compute_all(cls, context=None, **kwargs):
 
         # now we avoid creating DB record if no rsi has been computed
         # the object is only saved if cls.objects.create called
+        context = context or PairContext(**kwargs)
         new_instance = cls(**kwargs)
-        rs = new_instance.compute_rs()
+        rs = new_instance.compute_rs(context)
         if rs and MODIFY_DB: # modify_db is for debug mode
-            new_instance.save()
+            context.save(new_instance)
+            context.set_rsi_object(new_instance)  # read by the RSI events
             logger.info("   ...RS calculation completed and saved.")
         else:
             logger.info("       RSI was not saved (either no value or debug model")
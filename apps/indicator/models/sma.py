@@ -1,6 +1,7 @@
 from django.db import models
 from apps.indicator.models.abstract_indicator import AbstractIndicator
 from apps.indicator.models import price_resampl
+from apps.indicator.pair_context import PairContext
 from settings import time_speed, MODIFY_DB
 import numpy as np
 import pandas as pd
@@ -17,6 +18,11 @@ class Sma(AbstractIndicator):
     sma_close_price = models.BigIntegerField(null=True)
     sma_midpoint_price = models.BigIntegerField(null=True)
 
+    # running sums of the full window, to update the next period from, null if the window has missing prices
+    close_price_sum = models.FloatField(null=True)
+    high_price_sum = models.FloatField(null=True)
+    midpoint_price_sum = models.FloatField(null=True)
+
 
     class Meta:
         indexes = [
@@ -27,59 +33,105 @@ class Sma(AbstractIndicator):
     def _compute_sma(self):
         # get neccesary records from price_resample
         resampl_prices_df = price_resampl.get_n_last_resampl_df(
-            self.resample_period * self.sma_period + 5,
+            self.sma_period + 5,
             self.source,
             self.transaction_currency,
             self.counter_currency,
             self.resample_period
         )
-        resampl_close_price_ts = resampl_prices_df.close_price
-        resampl_high_price_ts = resampl_prices_df.high_price
-        resampl_midpoint_price_ts = resampl_prices_df.midpoint_price
-        time_max = np.max(resampl_prices_df.index)
-
-        # reduce sma window if we are in test mode
-        sma_window = int(self.sma_period/time_speed)
+        sma_values, sma_sums = compute_sma_values(resampl_prices_df, [self.sma_period])[self.sma_period]
+        self.sma_close_price, self.sma_high_price, self.sma_midpoint_price = sma_values
+        self.close_price_sum, self.high_price_sum, self.midpoint_price_sum = sma_sums
 
-        #calculte sma if one third of the nessesary time points are present
-        min_per = int(sma_window/4) if sma_window > 10 else None
 
-        if not resampl_close_price_ts.empty:
-            sma_close_ts = resampl_close_price_ts.rolling(window=sma_window, center=False, min_periods=min_per).mean()
-            if not np.isnan(sma_close_ts[time_max]):
-                self.sma_close_price = int(sma_close_ts[time_max])
-        else:
-            logger.debug(' Not enough CLOSE prices for SMA calculation, resample_period=' + str(self.resample_period) )
+    @staticmethod
+    def compute_all(cls, context=None, **kwargs):
+        # get the records of the longest sma once, the shorter ones are the last rows of the same frame
+        context = context or PairContext(**kwargs)
+        try:
+            resampl_prices_df = context.get_resampl_df(max(SMA_LIST) + 5)
+            if resampl_prices_df.empty:
+                logger.debug(' No resampled prices for SMA calculation, resample_period=' + str(kwargs['resample_period']))
+                return
+            # the sums of the previous period are updated with the newest prices, if there was no gap since
+            previous_sums = {
+                sma.sma_period: (sma.close_price_sum, sma.high_price_sum, sma.midpoint_price_sum)
+                for sma in context.get_previous_indicators(cls)
+            }
+            sma_values = compute_sma_values(resampl_prices_df, SMA_LIST, previous_sums)
+        except Exception as e:
+            logger.error(" SMA Compute Exception: " + str(e))
+            return
+
+        sma_instances = [
+            cls(**kwargs, sma_period=sma_period,
+                sma_close_price=sma_close_price, sma_high_price=sma_high_price, sma_midpoint_price=sma_midpoint_price,
+                close_price_sum=close_price_sum, high_price_sum=high_price_sum, midpoint_price_sum=midpoint_price_sum)
+            for sma_period, ((sma_close_price, sma_high_price, sma_midpoint_price),
+                             (close_price_sum, high_price_sum, midpoint_price_sum)) in sma_values.items()
+        ]
+        if MODIFY_DB: context.save_all(sma_instances)  # one bulk_create
+        logger.info("   ...All SMA calculations have been done and saved.")
 
-        if not resampl_high_price_ts.empty:
-            # calculate SMA
-            sma_high_ts = resampl_high_price_ts.rolling(window=sma_window, center=False, min_periods=min_per).mean()
-            if not np.isnan(sma_high_ts[time_max]):
-                self.sma_high_price = int(sma_high_ts[time_max])
-        else:
-            logger.debug(' Not enough HIGH prices for SMA calculation, resample_period=' + str(self.resample_period) )
 
+SMA_PRICE_COLUMNS = ['close_price', 'high_price', 'midpoint_price']
 
-        if not resampl_midpoint_price_ts.empty:
-            sma_midpoint_ts = resampl_midpoint_price_ts.rolling(window=sma_window, center=False, min_periods=min_per).mean()
-            if not np.isnan(sma_midpoint_ts[time_max]):
-                self.sma_midpoint_price = int(sma_midpoint_ts[time_max])
-        else:
-            logger.debug(' Not enough MIDPOINT prices for SMA calculation, resample_period=' + str(self.resample_period))
 
+def compute_sma_values(resampl_prices_df, sma_periods, previous_sums=None) -> dict:
+    """
+    last value of the rolling mean of each price column for each sma period, in one pass over the frame
+    same result as resampl_prices_df[column].rolling(window=sma_window, min_periods=min_per).mean()[-1]
 
-    @staticmethod
-    def compute_all(cls,**kwargs):
-        # todo - avoid creation empty record if no sma was computed..it also mith be fine
-        for sma_period in SMA_LIST:
-            try:
-                sma_instance = cls(**kwargs, sma_period = sma_period)
-                sma_instance._compute_sma()
-                if MODIFY_DB: sma_instance.save()
-            except Exception as e:
-                logger.error(" SMA " + str(sma_period) + " Compute Exception: " + str(e))
-        logger.info("   ...All SMA calculations have been done and saved.")
+    :param resampl_prices_df: frame of get_n_last_resampl_df(), from past to future
+    :param sma_periods: eg. SMA_LIST
+    :param previous_sums: dict of sma_period: window sums of the columns at the row before the last one,
+                          eg. of the Sma rows of the previous period, they are updated with the rows entering
+                          and leaving the window instead of summing it again
+    :return: dict of sma_period: ((sma_close_price, sma_high_price, sma_midpoint_price), (the window sums)),
+             None where not computed, sums are None if the window is not full
+    """
+    previous_sums = previous_sums or {}
+    prices = resampl_prices_df.reindex(columns=SMA_PRICE_COLUMNS).values.astype(np.float64)
+    present = ~np.isnan(prices)
+    cumulative = None
 
+    sma_values = {}
+    for sma_period in sma_periods:
+        # reduce sma window if we are in test mode
+        sma_window = int(sma_period/time_speed)
+        # calculte sma if one fourth of the nessesary time points are present
+        min_per = int(sma_window/4) if sma_window > 10 else sma_window
+
+        window_sums = np.full(len(SMA_PRICE_COLUMNS), np.nan)
+        previous = previous_sums.get(sma_period)
+        if previous is not None and len(prices) > sma_window:
+            # O(1) update, NaN for the columns without a previous sum or with a missing price
+            previous = np.array([np.nan if value is None else value for value in previous], dtype=np.float64)
+            window_sums = previous + prices[-1] - prices[-sma_window - 1]
+        window_counts = np.where(np.isnan(window_sums), 0, sma_window)
+
+        if np.isnan(window_sums).any():
+            if cumulative is None:
+                # sums and counts of the present prices up to each row, a window is the difference of two rows
+                cumulative = (
+                    np.vstack([np.zeros(len(SMA_PRICE_COLUMNS)), np.cumsum(np.where(present, prices, 0), axis=0)]),
+                    np.vstack([np.zeros(len(SMA_PRICE_COLUMNS)), np.cumsum(present, axis=0)]),
+                )
+            sums, counts = cumulative
+            first_row = max(0, len(prices) - sma_window)
+            recomputed = np.isnan(window_sums)
+            window_sums = np.where(recomputed, sums[-1] - sums[first_row], window_sums)
+            window_counts = np.where(recomputed, counts[-1] - counts[first_row], window_counts)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            window_means = window_sums / window_counts
+        sma_values[sma_period] = (
+            tuple(int(mean) if len(prices) and count >= max(min_per, 1) else None
+                  for mean, count in zip(window_means, window_counts)),
+            tuple(float(window_sum) if count == sma_window else None
+                  for window_sum, count in zip(window_sums, window_counts)),
+        )
+    return sma_values
 
 
 
@@ -95,8 +147,16 @@ def get_n_last_sma_df(n, sma_period, source, transaction_currency, counter_curre
         counter_currency=counter_currency,
         resample_period=resample_period,
         sma_period=sma_period,
-    ).order_by('-timestamp').values('timestamp','sma_close_price','sma_midpoint_price'))
+    ).order_by('-timestamp').values(*SMA_DF_FIELDS))
+
+    return sma_df_from_records(last_prices)
+
+
+SMA_DF_FIELDS = ['timestamp', 'sma_close_price', 'sma_midpoint_price']
+
 
+def sma_df_from_records(last_prices)->pd.DataFrame:
+    # the frame of get_n_last_sma_df() from its records, newest first
     df = pd.DataFrame()
     if last_prices:
         ts = [rec['timestamp'] for rec in last_prices]
@@ -0,0 +1,350 @@
+from datetime import timedelta, datetime
+import logging
+
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+
+PREVIOUS_TIMESTAMP_RECORDS = 5  # resampled records to look for the previous timestamp in
+GAP_TOLERANCE = 0.5  # of a resample period, between the previous and the newest resampled prices
+
+
+class QueryCounter(object):
+    '''
+    django execute_wrapper counting the SQL queries run in its block,
+    even if settings.DEBUG is off and connection.queries is empty
+
+    with connection.execute_wrapper(query_counter):
+        ...
+    '''
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class PairContext(object):
+    '''
+    Data of one (source, transaction_currency, counter_currency, resample_period) at one timestamp,
+    shared by all the stages of taskapp.helpers.indicators._compute_indicators_for.
+    Each frame is loaded from the DB on first use and memoized, a later request for fewer records
+    is a slice of the frame already loaded.
+    Load it after a stage writes the rows it reads, eg. the SMA frames after Sma.compute_all
+    '''
+
+    def __init__(self, timestamp, source, transaction_currency, counter_currency, resample_period,
+                 defer_saves=False):
+        '''
+        :param defer_saves: keep the indicator rows passed to save() in pending_rows, for save_pending_rows()
+        '''
+        self.timestamp = timestamp
+        self.source = source
+        self.transaction_currency = transaction_currency
+        self.counter_currency = counter_currency
+        self.resample_period = resample_period
+
+        self.defer_saves = defer_saves
+        self.pending_rows = []
+        self.query_counter = QueryCounter()
+        self._resampl_df, self._resampl_records = None, 0
+        self._sma_dfs = {}  # sma_period: (frame, records)
+        self._rsi_object, self._rsi_loaded = None, False
+        self._signals_now = None
+        self._current_events_df = None
+        self._previous_timestamp, self._previous_timestamp_loaded = None, False
+        self._previous_indicators = {}  # model: rows at the previous timestamp
+
+    def __str__(self):
+        return f"{self.source}_{self.transaction_currency}_{self.counter_currency}_{self.resample_period}"
+
+    @property
+    def params(self) -> dict:
+        # the indicator_params_dict of the pair, eg. for cls(**context.params)
+        return {
+            'timestamp': self.timestamp,
+            'source': self.source,
+            'transaction_currency': self.transaction_currency,
+            'counter_currency': self.counter_currency,
+            'resample_period': self.resample_period,
+        }
+
+    @property
+    def no_time_params(self) -> dict:
+        return {
+            'source': self.source,
+            'transaction_currency': self.transaction_currency,
+            'counter_currency': self.counter_currency,
+            'resample_period': self.resample_period,
+        }
+
+    @property
+    def pair(self) -> tuple:
+        return self.transaction_currency, self.counter_currency
+
+    ############## query count
+    @property
+    def query_count(self) -> int:
+        return self.query_counter.count
+
+    def counting_queries(self):
+        '''
+        with context.counting_queries():
+            ... # every SQL query run in the block adds to context.query_count
+        '''
+        return connection.execute_wrapper(self.query_counter)
+
+    ############## saving
+    def save(self, instance):
+        # save an indicator or event row of the pair, later in one bulk_create if saves are deferred
+        if self.defer_saves:
+            self.pending_rows.append(instance)
+        else:
+            instance.save()
+
+    def save_all(self, instances):
+        if self.defer_saves:
+            self.pending_rows.extend(instances)
+        elif instances:
+            type(instances[0]).objects.bulk_create(instances)
+
+    ############## memoized data
+    def _last_minutes(self, df, minutes):
+        # same time filter as the get_n_last_*_df functions, on a frame loaded for more records
+        return df[df.index >= datetime.now() - timedelta(minutes=minutes)].copy()
+
+    def get_resampl_df(self, n):
+        # price_resampl.get_n_last_resampl_df(n, ...) of the pair
+        from apps.indicator.models.price_resampl import get_n_last_resampl_df
+
+        if self._resampl_df is None or n > self._resampl_records:
+            self._resampl_df = get_n_last_resampl_df(n, **self.no_time_params)
+            self._resampl_records = n
+        if self._resampl_df.empty:
+            return self._resampl_df.copy()
+        return self._last_minutes(self._resampl_df, self.resample_period * n)
+
+    def get_sma_df(self, n, sma_period):
+        # sma.get_n_last_sma_df(n, sma_period, ...) of the pair
+        from apps.indicator.models.sma import get_n_last_sma_df
+
+        sma_df, records = self._sma_dfs.get(sma_period, (None, 0))
+        if sma_df is None or n > records:
+            sma_df = get_n_last_sma_df(n, sma_period, **self.no_time_params)
+            self._sma_dfs[sma_period] = (sma_df, n)
+        if sma_df.empty:
+            return sma_df.copy()
+        return self._last_minutes(sma_df, self.resample_period * sma_period * n)
+
+    def set_resampl_df(self, df, n):
+        self._resampl_df, self._resampl_records = df, n
+
+    def set_sma_df(self, sma_period, df, n):
+        self._sma_dfs[sma_period] = (df, n)
+
+    def get_previous_timestamp(self):
+        '''
+        timestamp of the resampled prices before the ones at the context timestamp, if they follow them without a gap,
+        the indicators at that timestamp can be updated with the newest prices instead of computed again
+        :return: datetime of the previous PriceResampl, None if missing or a gap
+        '''
+        if not self._previous_timestamp_loaded:
+            self._previous_timestamp, self._previous_timestamp_loaded = None, True
+            resampl_df = self.get_resampl_df(PREVIOUS_TIMESTAMP_RECORDS)
+            if len(resampl_df) >= 2:
+                newest, previous = resampl_df.index[-1].to_pydatetime(), resampl_df.index[-2].to_pydatetime()
+                period = self.resample_period * 60
+                if abs(newest.timestamp() - self.timestamp) < 60 and \
+                        abs(newest.timestamp() - previous.timestamp() - period) < period * GAP_TOLERANCE:
+                    self._previous_timestamp = previous
+        return self._previous_timestamp
+
+    def get_previous_indicators(self, model) -> list:
+        # rows of an indicator model of the pair at get_previous_timestamp(), eg. the Sma of each sma_period
+        if model not in self._previous_indicators:
+            previous_timestamp = self.get_previous_timestamp()
+            self._previous_indicators[model] = [] if previous_timestamp is None else list(
+                model.objects.filter(**self.no_time_params, timestamp=previous_timestamp)
+            )
+        return self._previous_indicators[model]
+
+    def set_previous_indicators(self, model, rows):
+        self._previous_indicators[model] = rows
+
+    def get_rsi_object(self):
+        # the Rsi of the pair at the timestamp, or None
+        from apps.indicator.models.rsi import Rsi
+
+        if not self._rsi_loaded:
+            self.set_rsi_object(Rsi.objects.filter(**self.params).last())
+        return self._rsi_object
+
+    def set_rsi_object(self, rsi_object):
+        # eg. the Rsi just saved by Rsi.compute_all, no need to read it back
+        self._rsi_object, self._rsi_loaded = rsi_object, True
+
+    def get_current_events_df(self):
+        # events_elementary.get_current_elementory_events_df() of the pair, after the elementary events are saved
+        from apps.indicator.models.events_elementary import get_current_elementory_events_df
+
+        if self._current_events_df is None:
+            self._current_events_df = get_current_elementory_events_df(**self.params)
+        return self._current_events_df.copy()
+
+    def set_current_events_df(self, df):
+        self._current_events_df = df
+
+    def get_signals_now(self) -> dict:
+        # signal.get_all_signals_names_now() of the pair, read once for all the strategies
+        from apps.signal.models.signal import get_all_signals_names_now
+
+        if self._signals_now is None:
+            self._signals_now = get_all_signals_names_now(**self.params)
+        return self._signals_now
+
+    def set_signals_now(self, signals_now):
+        self._signals_now = signals_now
+
+
+############## many pairs of one source, resample_period and timestamp
+# each function reads the data of all the pair contexts in one query
+
+def _get_batch_params(contexts) -> dict:
+    context = contexts[0]
+    assert all((c.timestamp, c.source, c.resample_period) == (context.timestamp, context.source, context.resample_period)
+               for c in contexts), 'pair contexts of different sources, resample periods or timestamps'
+    return {
+        'source': context.source,
+        'resample_period': context.resample_period,
+        'transaction_currency__in': {c.transaction_currency for c in contexts},
+        'counter_currency__in': {c.counter_currency for c in contexts},
+    }
+
+
+def _group_records_by_pair(contexts, records) -> dict:
+    # the records of each pair context, in the query order, skipping the other pairs of the currencies
+    records_by_pair = {context.pair: [] for context in contexts}
+    for record in records:
+        pair = (record['transaction_currency'], record['counter_currency'])
+        if pair in records_by_pair:
+            records_by_pair[pair].append(record)
+    return records_by_pair
+
+
+def load_resampl_dfs(contexts, n):
+    # context.get_resampl_df(n) of all the contexts
+    from apps.indicator.models.price_resampl import PriceResampl, RESAMPL_DF_FIELDS, resampl_df_from_records
+
+    if not contexts:
+        return
+    records = PriceResampl.objects.filter(
+        **_get_batch_params(contexts),
+        timestamp__gte=datetime.now() - timedelta(minutes=contexts[0].resample_period * n),
+    ).values(*RESAMPL_DF_FIELDS, 'transaction_currency', 'counter_currency').order_by('-timestamp')
+
+    records_by_pair = _group_records_by_pair(contexts, records)
+    for context in contexts:
+        context.set_resampl_df(resampl_df_from_records(records_by_pair[context.pair]), n)
+
+
+def load_sma_dfs(contexts, n, sma_periods):
+    # context.get_sma_df(n, sma_period) of all the contexts and sma periods
+    from apps.indicator.models.sma import Sma, SMA_DF_FIELDS, sma_df_from_records
+
+    if not contexts:
+        return
+    resample_period = contexts[0].resample_period
+    records = Sma.objects.filter(
+        **_get_batch_params(contexts),
+        sma_period__in=sma_periods,
+        timestamp__gte=datetime.now() - timedelta(minutes=resample_period * max(sma_periods) * n),
+    ).values(*SMA_DF_FIELDS, 'sma_period', 'transaction_currency', 'counter_currency').order_by('-timestamp')
+
+    records_by_pair = _group_records_by_pair(contexts, records)
+    for sma_period in sma_periods:
+        # the time range of each sma period is shorter than the range of the query
+        from_time = datetime.now() - timedelta(minutes=resample_period * sma_period * n)
+        for context in contexts:
+            sma_records = [record for record in records_by_pair[context.pair]
+                           if record['sma_period'] == sma_period and record['timestamp'] >= from_time]
+            context.set_sma_df(sma_period, sma_df_from_records(sma_records), n)
+
+
+def load_previous_indicators(contexts, model):
+    # context.get_previous_indicators(model) of all the contexts, after their resampled prices are loaded
+    if not contexts:
+        return
+    previous_timestamps = {context.pair: context.get_previous_timestamp() for context in contexts}
+    rows_by_pair = {pair: [] for pair in previous_timestamps}
+    if any(previous_timestamps.values()):
+        rows = model.objects.filter(
+            **_get_batch_params(contexts),
+            timestamp__in={timestamp for timestamp in previous_timestamps.values() if timestamp is not None},
+        )
+        for row in rows:
+            pair = (row.transaction_currency, row.counter_currency)
+            # the previous timestamp of another pair may be a gap for this one
+            if pair in rows_by_pair and row.timestamp == previous_timestamps[pair]:
+                rows_by_pair[pair].append(row)
+    for context in contexts:
+        context.set_previous_indicators(model, rows_by_pair[context.pair])
+
+
+def load_current_events_dfs(contexts):
+    # context.get_current_events_df() of all the contexts
+    from apps.indicator.models.events_elementary import EventsElementary, EVENTS_DF_FIELDS, \
+        elementory_events_df_from_records
+
+    if not contexts:
+        return
+    records = EventsElementary.objects.filter(
+        **_get_batch_params(contexts),
+        timestamp=contexts[0].timestamp,
+    ).values(*EVENTS_DF_FIELDS, 'transaction_currency', 'counter_currency').order_by('-timestamp')
+
+    records_by_pair = _group_records_by_pair(contexts, records)
+    for context in contexts:
+        context.set_current_events_df(elementory_events_df_from_records(records_by_pair[context.pair]))
+
+
+def load_signals_now(contexts):
+    # context.get_signals_now() of all the contexts
+    from apps.signal.models.signal import get_all_signals_names_now_for_pairs
+
+    if not contexts:
+        return
+    signals_sets = get_all_signals_names_now_for_pairs(
+        [context.pair for context in contexts],
+        timestamp=contexts[0].timestamp, source=contexts[0].source, resample_period=contexts[0].resample_period
+    )
+    for context in contexts:
+        context.set_signals_now(signals_sets[context.pair])
+
+
+def save_pending_rows(contexts) -> int:
+    # one bulk_create per model of the rows deferred by all the contexts,
+    # if it fails the rows of the model are saved one by one, so a bad row only loses itself
+    rows_by_model = {}
+    for context in contexts:
+        for row in context.pending_rows:
+            rows_by_model.setdefault(type(row), []).append((context, row))
+        context.pending_rows = []
+
+    saved_count = 0
+    for model, context_rows in rows_by_model.items():
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create([row for context, row in context_rows])
+            saved_count += len(context_rows)
+        except Exception as e:
+            logger.error(f"{model.__name__} bulk_create of {len(context_rows)} rows failed, saving them one by one: {e}")
+            for context, row in context_rows:
+                try:
+                    row.save()
+                    saved_count += 1
+                except Exception as e:
+                    logger.error(f">>>>{context} {model.__name__} not saved: {e}")
+    return saved_count
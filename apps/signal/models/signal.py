@@ -319,6 +319,33 @@ def get_all_signals_names_now(**kwargs):
     return signals_set
 
 
+def get_all_signals_names_now_for_pairs(pairs, timestamp, source, resample_period)->dict:
+    '''
+    get_all_signals_names_now() of many pairs of one source in one query
+    Return: {(transaction_currency, counter_currency): {signal name: signal id}} for each of the pairs
+    '''
+    pairs = [tuple(pair) for pair in pairs]
+    signals_queryset = Signal.objects.filter(
+        timestamp=timestamp,
+        source=source,
+        resample_period=resample_period,
+        transaction_currency__in={transaction_currency for transaction_currency, _ in pairs},
+        counter_currency__in={counter_currency for _, counter_currency in pairs},
+    ).values('id', 'signal', 'trend', 'strength_value',
+             'transaction_currency', 'counter_currency').order_by('timestamp')
+
+    signals_sets = {pair: {} for pair in pairs}
+    for signal in signals_queryset:
+        pair = (signal['transaction_currency'], signal['counter_currency'])
+        if pair not in signals_sets:
+            continue  # a pair of the other currencies, not asked for
+        unique_name = _get_signal_idname(signal)
+        if unique_name:
+            signals_sets[pair][unique_name] = signal['id']
+
+    return signals_sets
+
+
 def get_prevous_signal_name(**kwargs):
     pass
 
@@ -20,7 +20,10 @@ class AbstractStrategy(ABC):
     signal_now_set = None
 
 
-    def __init__(self, **parameters):
+    def __init__(self, context=None, **parameters):
+        '''
+        :param context: PairContext of the parameters, the signals now are read once for all the strategies
+        '''
         self.timestamp = parameters['timestamp']
         self.source = parameters['source']
         self.resample_period = parameters['resample_period']
@@ -28,11 +31,15 @@ class AbstractStrategy(ABC):
         self.counter_currency = parameters['counter_currency']
 
         self.parameters = parameters
+        self.context = context
 
 
     def check_signals_now(self)->dict:
         # get all signals emitted now
-        current_signals_set = get_all_signals_names_now(**self.parameters)
+        if self.context is not None:
+            current_signals_set = self.context.get_signals_now()
+        else:
+            current_signals_set = get_all_signals_names_now(**self.parameters)
 
 
         # check if any of them belongs to our strategy
@@ -287,6 +287,8 @@ RUN_BEN = True
 RUN_SENTIMENT = os.environ.get('RUN_SENTIMENT', False)
 RUN_BACKTESTING = os.environ.get('RUN_BACKTESTING', False)
 MODIFY_DB = True
+# hourly indicators: pairs of a source are split in this many batches computed together, 0 for one task per pair
+INDICATORS_PAIR_BATCHES = int(os.environ.get('INDICATORS_PAIR_BATCHES', 10))
 
 EMIT_SIGNALS = os.environ.get("EMIT_SIGNALS", "true").lower() == "true" # emit if no variable set or when it set to 'true', env variables are strings
 
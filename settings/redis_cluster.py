@@ -0,0 +1,108 @@
+import logging
+from collections import OrderedDict
+
+import redis
+from rediscluster import RedisCluster  # optional dependency, pip install redis-py-cluster==1.3.6
+
+logger = logging.getLogger('redis_db')
+
+# Redis Cluster client for TA_REDIS_CLUSTER=1, see settings/redis_db.py
+# rediscluster pipelines cannot run transactions, TA writes a 5min block of a ticker in one MULTI/EXEC
+# so commands are grouped by hash slot and each group is a transaction on the master of its slot
+# with TA_REDIS_KEY_HASH_TAGS=1 every key of a ticker is in one slot, only the key registries are not,
+# the streams all share one slot, see apps/TA/storages/utils/streams.py
+
+
+def get_command_key(args: tuple):
+    """
+    :param args: a command and its arguments, eg. ("ZADD", key, score, member)
+    :return: the first key of the command, the one it is routed on
+    """
+    command = str(args[0]).upper()
+    if command in ("XREAD", "XREADGROUP"):
+        # eg. XREADGROUP GROUP group consumer COUNT 100 STREAMS key1 key2 > >
+        return args[[str(arg).upper() for arg in args].index("STREAMS") + 1]
+    if command in ("XGROUP", "XINFO"):
+        return args[2]  # eg. XGROUP CREATE key group $
+    return args[1] if len(args) > 1 else args[0]
+
+
+class SlotGroupedPipeline(redis.Redis):
+    """
+    commands are queued, then sent with one pipeline per slot, responses are returned in queued order
+    the slot of a command is the slot of its first key, see get_command_key()
+    """
+
+    def __init__(self, cluster, transaction: bool = True):
+        # no connection pool, commands are only queued here
+        self.cluster = cluster
+        self.transaction = transaction
+        self.command_stack = []
+
+    def __len__(self):
+        return len(self.command_stack)
+
+    def execute_command(self, *args, **options):
+        self.command_stack.append((args, options))
+        return self
+
+    def execute(self, raise_on_error: bool = True) -> list:
+        commands_by_slot = OrderedDict()
+        for position, (args, options) in enumerate(self.command_stack):
+            commands_by_slot.setdefault(self.cluster.get_command_slot(args), []).append((position, args, options))
+
+        responses = [None] * len(self.command_stack)
+        self.command_stack = []
+        for slot, commands in commands_by_slot.items():
+            for position, response in zip([command[0] for command in commands],
+                                          self.execute_slot_commands(slot, commands, raise_on_error)):
+                responses[position] = response
+        return responses
+
+    def execute_slot_commands(self, slot: int, commands: list, raise_on_error: bool, retry: bool = True) -> list:
+        pipeline = self.cluster.get_slot_client(slot).pipeline(transaction=self.transaction and len(commands) > 1)
+        for position, args, options in commands:
+            pipeline.execute_command(*args, **options)
+        try:
+            return pipeline.execute(raise_on_error=raise_on_error)
+        except redis.exceptions.ResponseError as e:
+            if not retry or not str(e).startswith(("MOVED", "ASK")):
+                raise
+            # the slot moved to another node while resharding, reload the slots table and try once more
+            logger.warning(f'slot {slot} moved, reloading cluster slots: {str(e)}')
+            self.cluster.reload_slots()
+            return self.execute_slot_commands(slot, commands, raise_on_error, retry=False)
+
+
+class SlotGroupedRedisCluster(RedisCluster):
+    """
+    RedisCluster (legacy redis.Redis command signatures) with transactional pipelines grouped by slot
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.slot_clients = {}  # node name: redis.Redis connected to that master
+
+    def pipeline(self, transaction: bool = True, shard_hint=None):
+        return SlotGroupedPipeline(self, transaction=transaction)
+
+    def get_command_slot(self, args: tuple) -> int:
+        return self.connection_pool.nodes.keyslot(get_command_key(args))
+
+    def _determine_slot(self, *args):
+        # RedisCluster routes every command but EVAL and EVALSHA on args[1], eg. "GROUP" for XREADGROUP
+        if str(args[0]).upper() in ("XREAD", "XREADGROUP", "XGROUP", "XINFO"):
+            return self.get_command_slot(args)
+        return super()._determine_slot(*args)
+
+    def get_slot_client(self, slot: int) -> redis.Redis:
+        node = self.connection_pool.get_master_node_by_slot(slot)
+        if node["name"] not in self.slot_clients:
+            self.slot_clients[node["name"]] = redis.Redis(
+                host=node["host"], port=node["port"], password=self.connection_pool.connection_kwargs.get("password")
+            )
+        return self.slot_clients[node["name"]]
+
+    def reload_slots(self):
+        self.connection_pool.nodes.initialize()
+        self.slot_clients = {}
@@ -1,7 +1,7 @@
 import os
 import logging
 import redis
-from apps.TA import deployment_type
+from apps.TA import deployment_type, REDIS_CLUSTER
 from settings import DEBUG
 
 SIMULATED_ENV = deployment_type == "LOCAL"
@@ -11,18 +11,22 @@ logger = logging.getLogger('redis_db')
 
 if deployment_type == "LOCAL":
     from settings.local_settings import TA_REDIS_URL
-    if TA_REDIS_URL:
-        database = redis.from_url(TA_REDIS_URL)
-    else:
-        REDIS_HOST, REDIS_PORT = "127.0.0.1:6379".split(":")
-        pool = redis.ConnectionPool(host=REDIS_HOST, port=REDIS_PORT, db=0)
-        database = redis.Redis(connection_pool=pool)
 else:
-    database = redis.from_url(os.environ.get("TA_REDIS_URL"))
+    TA_REDIS_URL = os.environ.get("TA_REDIS_URL")
 
-if DEBUG:
+if REDIS_CLUSTER:
+    # TA_REDIS_URL is any node of the cluster, the others are discovered
+    from settings.redis_cluster import SlotGroupedRedisCluster
+    database = SlotGroupedRedisCluster.from_url(TA_REDIS_URL, skip_full_coverage_check=True)
+elif deployment_type == "LOCAL" and not TA_REDIS_URL:
+    REDIS_HOST, REDIS_PORT = "127.0.0.1:6379".split(":")
+    pool = redis.ConnectionPool(host=REDIS_HOST, port=REDIS_PORT, db=0)
+    database = redis.Redis(connection_pool=pool)
+else:
+    database = redis.from_url(TA_REDIS_URL)
+
+if DEBUG and not REDIS_CLUSTER:  # a cluster answers INFO for each node
     logger.info("Redis connection established for app database.")
     used_memory, maxmemory = int(database.info()['used_memory']), int(database.info()['maxmemory'])
     maxmemory_human = database.info()['maxmemory_human']
     logger.info(f"Redis currently consumes {round(100*used_memory/maxmemory, 2)}% out of {maxmemory_human}")
-
@@ -5,13 +5,15 @@ import time
 from django.db import connection
 
 from apps.common.utilities.sqs import send_sqs
-from apps.indicator.models.price_resampl import PriceResampl
+from apps.indicator.models.price_resampl import PriceResampl, resample_all_pairs
 from apps.indicator.models.rsi import Rsi
 from apps.indicator.models.sma import Sma
+from apps.indicator.pair_context import PairContext, QueryCounter, load_resampl_dfs, load_sma_dfs, \
+    load_previous_indicators, load_current_events_dfs, load_signals_now, save_pending_rows
 from apps.strategy.models.strategy_ref import get_all_strategy_classes
 from apps.user.models.user import get_horizon_value_from_string
 from settings import SHORT, MEDIUM, HORIZONS_TIME2NAMES, RUN_ANN, MODIFY_DB
-from taskapp.helpers.common import get_currency_pairs, quad_formatted
+from taskapp.helpers.common import get_currency_pairs, get_source_name, quad_formatted
 
 # from taskapp.helpers.backtesting import _backtest_all_strategies
 
@@ -75,13 +77,35 @@ def _compute_ann(source, resample_period):
     K.clear_session()
 
 
-def _compute_indicators_for(source, transaction_currency, counter_currency, resample_period):
+def _resample_prices_for(source, pairs, resample_period):
+    '''
+    Resample prices of all the pairs of a source in one query, see resample_all_pairs()
+    Return: timestamp of the resampled records, to compute the other indicators of the pairs at
+    '''
+    timestamp = time.time() // (1 * 60) * (1 * 60)  # current time rounded to a minute
+    try:
+        resampled_prices = resample_all_pairs(source, resample_period, timestamp, pairs=pairs, save=MODIFY_DB)
+        logger.debug(
+            f">>>>{get_source_name(source)}_{resample_period} ... Resampled {len(resampled_prices)} of {len(pairs)} pairs,"
+            f"  ELAPSED Time: {time.time() - timestamp}")
+    except Exception as e:
+        logger.error(f">>>>{get_source_name(source)}_{resample_period} -> RESAMPLE EXCEPTION: {e}")
+    return timestamp
+
+
+def _compute_indicators_for(source, transaction_currency, counter_currency, resample_period, timestamp=None,
+                            resample=True):
+    '''
+    resample=False when the prices of the pair were already resampled with the other pairs of the source
+    by _resample_prices_for(), at timestamp
+    '''
     logger.info(
         f"### Starting calcs for: {quad_formatted(source, transaction_currency, counter_currency, resample_period)}")
 
     horizon = get_horizon_value_from_string(display_string=HORIZONS_TIME2NAMES[resample_period])
 
-    timestamp = time.time() // (1 * 60) * (1 * 60)  # current time rounded to a minute
+    if timestamp is None:
+        timestamp = time.time() // (1 * 60) * (1 * 60)  # current time rounded to a minute
 
     # create a dictionary of parameters to improve readability
     indicator_params_dict = {
@@ -128,63 +152,76 @@ def _compute_indicators_for(source, transaction_currency, counter_currency, resa
     # indicator_params_dict['timestamp'] = timestamp
     # ################# Can be commented after first time run
 
-    # 1 ############################
-    # calculate and save resampling price
-    # todo - prevent adding an empty record if no value was computed (static method below)
-    try:
-        resample_object = PriceResampl.objects.create(**indicator_params_dict)
-        resample_object.compute()
-        if MODIFY_DB: resample_object.save()  # we set MODIFY_DB = False for debug mode, so we can debug with real DB
-        # logger.debug("  ... Resampled completed,  ELAPSED Time: " + str(time.time() - timestamp))
-        logger.debug(
-            f">>>>{quad_formatted(source, transaction_currency, counter_currency, resample_period)} ... Resampled completed,  ELAPSED Time: {time.time() - timestamp}")
-    except Exception as e:
-        # logger.error(" -> RESAMPLE EXCEPTION: " + str(e))
-        logger.error(
-            f">>>>{quad_formatted(source, transaction_currency, counter_currency, resample_period)} -> RESAMPLE EXCEPTION: {e}")
-
-
-
-    # 2 ###########################
-    # calculate and save simple indicators
-    indicators_list = [Sma, Rsi]
-    for ind in indicators_list:
+    # data of the pair read once and shared by the stages below, and the SQL queries they run
+    context = PairContext(**indicator_params_dict)
+    with context.counting_queries():
+        # 1 ############################
+        # calculate and save resampling price
+        # todo - prevent adding an empty record if no value was computed (static method below)
         try:
-            ind.compute_all(ind, **indicator_params_dict)
-            # logger.debug("  ... Regular indicators completed,  ELAPSED Time: " + str(time.time() - timestamp))
-            logger.debug(
-                f">>>>{quad_formatted(source, transaction_currency, counter_currency, resample_period)} ... Regular indicators completed,  ELAPSED Time: {time.time() - timestamp}")
+            if resample:
+                resample_object = PriceResampl.objects.create(**indicator_params_dict)
+                resample_object.compute()
+                if MODIFY_DB: resample_object.save()  # we set MODIFY_DB = False for debug mode, so we can debug with real DB
+                # logger.debug("  ... Resampled completed,  ELAPSED Time: " + str(time.time() - timestamp))
+                logger.debug(
+                    f">>>>{quad_formatted(source, transaction_currency, counter_currency, resample_period)} ... Resampled completed,  ELAPSED Time: {time.time() - timestamp}")
         except Exception as e:
-            # logger.error(str(ind) + " Indicator Exception: " + str(e))
+            # logger.error(" -> RESAMPLE EXCEPTION: " + str(e))
             logger.error(
-                f">>>>{quad_formatted(source, transaction_currency, counter_currency, resample_period)} {(ind)} Indicator Exception: {e}")
+                f">>>>{quad_formatted(source, transaction_currency, counter_currency, resample_period)} -> RESAMPLE EXCEPTION: {e}")
 
-    # 4 #############################
-    # check for events and save if any
-    from apps.indicator.models.events_elementary import EventsElementary
-    from apps.indicator.models.events_logical import EventsLogical
-    for event in [EventsElementary, EventsLogical]:
-        try:
-            event.check_events(event, **indicator_params_dict)
-            # logger.debug("  ... Events completed,  ELAPSED Time: " + str(time.time() - timestamp))
-            logger.debug(
-                f">>>>{quad_formatted(source, transaction_currency, counter_currency, resample_period)}  ... Events completed,  ELAPSED Time: {time.time() - timestamp}")
-        except Exception as e:
-            # logger.error(" Event Exception: " + str(e))
-            logger.error(
-                f">>>>{quad_formatted(source, transaction_currency, counter_currency, resample_period)} Event Exception: {e}")
 
-        logger.debug("|| SQL for Events: helpers.indicators._compute_indicators, events || " + str(connection.queries))
 
-    # 5 ############################
+        # 2 ###########################
+        # calculate and save simple indicators
+        indicators_list = [Sma, Rsi]
+        for ind in indicators_list:
+            try:
+                ind.compute_all(ind, context=context, **indicator_params_dict)
+                # logger.debug("  ... Regular indicators completed,  ELAPSED Time: " + str(time.time() - timestamp))
+                logger.debug(
+                    f">>>>{quad_formatted(source, transaction_currency, counter_currency, resample_period)} ... Regular indicators completed,  ELAPSED Time: {time.time() - timestamp}")
+            except Exception as e:
+                # logger.error(str(ind) + " Indicator Exception: " + str(e))
+                logger.error(
+                    f">>>>{quad_formatted(source, transaction_currency, counter_currency, resample_period)} {(ind)} Indicator Exception: {e}")
+
+        # 4 #############################
+        # check for events and save if any
+        from apps.indicator.models.events_elementary import EventsElementary
+        from apps.indicator.models.events_logical import EventsLogical
+        for event in [EventsElementary, EventsLogical]:
+            try:
+                event.check_events(event, context=context, **indicator_params_dict)
+                # logger.debug("  ... Events completed,  ELAPSED Time: " + str(time.time() - timestamp))
+                logger.debug(
+                    f">>>>{quad_formatted(source, transaction_currency, counter_currency, resample_period)}  ... Events completed,  ELAPSED Time: {time.time() - timestamp}")
+            except Exception as e:
+                # logger.error(" Event Exception: " + str(e))
+                logger.error(
+                    f">>>>{quad_formatted(source, transaction_currency, counter_currency, resample_period)} Event Exception: {e}")
+
+            logger.debug("|| SQL for Events: helpers.indicators._compute_indicators, events || " + str(connection.queries))
+
+        # 5 ############################
+        # check if we have to emit any <Strategy> signals
+        _check_strategies(context, horizon)
+
+    logger.info(
+        f">>>>{quad_formatted(source, transaction_currency, counter_currency, resample_period)} ... {context.query_count} SQL queries,  ELAPSED Time: {time.time() - timestamp}")
+
+
+def _check_strategies(context, horizon):
     # TODO: Uncomment when strategies are ready, it will emit strategy signals
     # check if we have to emit any <Strategy> signals
+    indicator_params_dict = context.params
 
     strategies_list = get_all_strategy_classes()  # [RsiSimpleStrategy, SmaCrossOverStrategy]
 
     for strategy in strategies_list:
         try:
-            s = strategy(**indicator_params_dict)
+            s = strategy(context=context, **indicator_params_dict)
             now_signals_set = s.check_signals_now()
 
             if now_signals_set:
@@ -208,3 +245,67 @@ def _compute_indicators_for(source, transaction_currency, counter_currency, resa
                 logger.debug("   ... No STRATEGY signals has been found NOW.")
         except Exception as e:
             logger.error(f" Error Strategy checking:  {e}")
+
+
+def _compute_indicators_for_pairs(source, pairs, resample_period, timestamp):
+    '''
+    _compute_indicators_for() of a batch of pairs of a source, with prices already resampled at timestamp.
+    Each stage reads the data of all the pairs in one query per table and bulk_creates their rows,
+    signals are still saved one by one to be sent.
+    If a batch query fails, the pairs read their own data as in _compute_indicators_for()
+    '''
+    from apps.indicator.models.events_elementary import EventsElementary, LAST_RECORDS, EVENTS_SMA_PERIODS
+    from apps.indicator.models.events_logical import EventsLogical
+    from apps.indicator.models.sma import SMA_LIST
+
+    logger.info(f"### Starting calcs for {len(pairs)} pairs of: {get_source_name(source)}_{resample_period}")
+    horizon = get_horizon_value_from_string(display_string=HORIZONS_TIME2NAMES[resample_period])
+
+    contexts = [PairContext(timestamp, source, transaction_currency, counter_currency, resample_period,
+                            defer_saves=True)
+                for transaction_currency, counter_currency in pairs]
+
+    def load_batch(loader, *args):
+        # the contexts not filled by a failed loader query their own data on first use
+        try:
+            loader(contexts, *args)
+        except Exception as e:
+            logger.error(f">>>>{get_source_name(source)}_{resample_period} {loader.__name__} Exception, "
+                         f"loading the pairs one by one: {e}")
+
+    def run_stage(stage_name, compute):
+        for context in contexts:
+            try:
+                compute(context)
+            except Exception as e:
+                logger.error(f">>>>{context} {stage_name} Exception: {e}")
+        rows_count = save_pending_rows(contexts)
+        logger.debug(f">>>>{get_source_name(source)}_{resample_period} ... {stage_name} completed, "
+                     f"{rows_count} rows saved,  ELAPSED Time: {time.time() - timestamp}")
+
+    query_counter = QueryCounter()
+    with connection.execute_wrapper(query_counter):
+        # 2 ###########################
+        # the resampled prices of all the stages, each slices the records it needs
+        load_batch(load_resampl_dfs, max(LAST_RECORDS, max(SMA_LIST) + 5))
+        # Sma and Rsi of the previous period, updated with the newest prices
+        load_batch(load_previous_indicators, Sma)
+        load_batch(load_previous_indicators, Rsi)
+        for ind in [Sma, Rsi]:
+            run_stage(ind.__name__, lambda context: ind.compute_all(ind, context=context, **context.params))
+
+        # 4 #############################
+        load_batch(load_sma_dfs, LAST_RECORDS, EVENTS_SMA_PERIODS)  # with the sma rows just saved
+        run_stage("EventsElementary",
+                  lambda context: EventsElementary.check_events(EventsElementary, context=context, **context.params))
+        load_batch(load_current_events_dfs)  # with the elementary events just saved
+        run_stage("EventsLogical",
+                  lambda context: EventsLogical.check_events(EventsLogical, context=context, **context.params))
+
+        # 5 ############################
+        load_batch(load_signals_now)
+        for context in contexts:
+            _check_strategies(context, horizon)
+
+    logger.info(f">>>>{get_source_name(source)}_{resample_period} ... {len(pairs)} pairs, "
+                f"{query_counter.count} SQL queries,  ELAPSED Time: {time.time() - timestamp}")
@@ -15,14 +15,41 @@ logger = logging.getLogger(__name__)
 def compute_indicators_for_all_sources(resample_period):
     from taskapp.helpers.common import get_source_trading_pairs
     #logger.info(f"Trading trios: {get_source_trading_pairs()}")
+    pairs_by_source = {}
     for (source, transaction_currency, counter_currency) in get_source_trading_pairs():
-        compute_indicators_for.delay(source, transaction_currency, counter_currency, resample_period)
+        pairs_by_source.setdefault(source, []).append((transaction_currency, counter_currency))
+    for source, pairs in pairs_by_source.items():
+        compute_indicators_for_source.delay(source, pairs, resample_period)
 
 @celery_app.task(retry=False)
-def compute_indicators_for(source, transaction_currency, counter_currency, resample_period):
+def compute_indicators_for_source(source, pairs, resample_period):
+    logger.info("###### Start _resample_prices_for job #######")
+    from taskapp.helpers.indicators import _resample_prices_for
+    from settings import INDICATORS_PAIR_BATCHES
+    timestamp = _resample_prices_for(source, pairs, resample_period)
+    # prices of all the pairs are resampled, the other indicators are computed by batches of pairs
+    if INDICATORS_PAIR_BATCHES:
+        for pairs_batch in (pairs[i::INDICATORS_PAIR_BATCHES] for i in range(INDICATORS_PAIR_BATCHES)):
+            if pairs_batch:
+                compute_indicators_for_pairs.delay(source, pairs_batch, resample_period, timestamp)
+    else:
+        for (transaction_currency, counter_currency) in pairs:
+            compute_indicators_for.delay(source, transaction_currency, counter_currency, resample_period,
+                                         timestamp=timestamp, resample=False)
+
+@celery_app.task(retry=False)
+def compute_indicators_for_pairs(source, pairs, resample_period, timestamp):
+    logger.info("###### Start _compute_indicators_for_pairs job #######")
+    from taskapp.helpers.indicators import _compute_indicators_for_pairs
+    _compute_indicators_for_pairs(source, pairs, resample_period, timestamp)
+
+@celery_app.task(retry=False)
+def compute_indicators_for(source, transaction_currency, counter_currency, resample_period, timestamp=None,
+                           resample=True):
     logger.info("###### Start _compute_indicators_for job #######")
     from taskapp.helpers.indicators import _compute_indicators_for
-    _compute_indicators_for(source, transaction_currency, counter_currency, resample_period)
+    _compute_indicators_for(source, transaction_currency, counter_currency, resample_period,
+                            timestamp=timestamp, resample=resample)
 
 
 